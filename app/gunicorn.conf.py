@@ -0,0 +1,28 @@
+import multiprocessing
+import os
+
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn.workers.UvicornWorker')
+
+# Асинхронный воркер обслуживает много запросов сам, ему хватает процесса на ядро;
+# синхронным (gthread) - классические 2 * CPU + 1 процессов и потоки на каждый
+if 'uvicorn' in worker_class:
+    workers = int(os.environ.get('WEB_CONCURRENCY', cpu_count + 1))
+else:
+    workers = int(os.environ.get('WEB_CONCURRENCY', cpu_count * 2 + 1))
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+
+
+def post_worker_init(worker):
+    # Импорты, оборванные перезапуском, продолжают сами воркеры, без ручной команды
+    from materials.api.v1.services import jobs
+
+    jobs.start_resume_loop()
@@ -0,0 +1,57 @@
+from django.db.models import Subquery
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from materials.api.v1.services import search
+from materials.models import Category
+
+
+class MaterialSearchFilter(BaseFilterBackend):
+    """
+    Поиск материалов по '?q=': названия по префиксам слов и с опечатками, артикул - точно
+    """
+    search_param = search.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        return search.search_materials(queryset, text)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Поиск по названию (префиксы слов, опечатки) и артикулу. '
+                           'Результаты отсортированы по релевантности, в каждом есть поле rank.',
+            'schema': {'type': 'string'},
+        }]
+
+
+class CategorySubtreeFilter(BaseFilterBackend):
+    """
+    Ограничивает материалы поддеревом категории '?category=<id>'
+
+    Путь категории подставляется подзапросом, поэтому фильтр не делает
+    отдельного запроса и работает в асинхронных view.
+    """
+    category_param = 'category'
+
+    def filter_queryset(self, request, queryset, view):
+        category_id = request.query_params.get(self.category_param)
+        if not category_id:
+            return queryset
+        if not (category_id.isascii() and category_id.isdigit()):
+            raise ValidationError({self.category_param: 'A valid integer is required.'})
+        path = Category.objects.filter(pk=category_id).values('path')
+        return queryset.filter(category__path__startswith=Subquery(path))
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.category_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Только материалы поддерева этой категории',
+            'schema': {'type': 'integer'},
+        }]
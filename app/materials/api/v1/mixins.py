@@ -0,0 +1,22 @@
+# Подменяет сериализатор и queryset действий чтения на 'ValuesSerializer'.
+# 'fast_serializer_classes' задает быстрый сериализатор для действия,
+# 'use_fast_serializers' отключает подмену для всего view.
+# Описание не в docstring, чтобы оно не попадало в схему OpenAPI.
+class FastReadMixin:
+    fast_serializer_classes = {}
+    use_fast_serializers = True
+
+    def get_fast_serializer_class(self):
+        if not self.use_fast_serializers:
+            return None
+        return self.fast_serializer_classes.get(self.action)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fast_serializer_class = self.get_fast_serializer_class()
+        if fast_serializer_class is not None:
+            queryset = fast_serializer_class.prepare_queryset(queryset)
+        return queryset
+
+    def get_serializer_class(self):
+        return self.get_fast_serializer_class() or super().get_serializer_class()
@@ -0,0 +1,247 @@
+import base64
+import binascii
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db import connection
+from django.db.models import BooleanField, Q, QuerySet
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from materials.api.v1.services import search
+
+
+class KeysetPagination(LimitOffsetPagination):
+    """
+    LimitOffset по умолчанию и keyset-пагинация, если в запросе есть 'cursor'
+
+    Курсор хранит значения 'keyset_fields' последней строки страницы, следующая
+    страница выбирается сравнением кортежей '(f1, f2, id) > (%s, %s, %s)' по
+    составному индексу, поэтому страница N стоит столько же, сколько первая.
+    Поле с '-' сортируется по убыванию. Если направления полей разные или
+    среди них есть аннотации (например, ранг поиска), условие строится
+    как '(f1 < %s) OR (f1 = %s AND f2 < %s)'.
+    Точный COUNT(*) в этом режиме не выполняется, если его не запросить через
+    '?count=exact'; '?count=estimate' возвращает оценку планировщика.
+    """
+    keyset_fields = ('id', )
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    count_modes = ('none', 'estimate', 'exact')
+    invalid_cursor_message = 'Invalid cursor'
+
+    keyset = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+
+        mode = self.start_keyset(request)
+        if mode == 'exact':
+            self.count = self.get_count(queryset)
+        elif mode == 'estimate':
+            self.count = estimate_count(queryset)
+        else:
+            self.count = None
+        return self.finish_keyset(list(self.keyset_page(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        То же, что 'paginate_queryset', но через асинхронный ORM
+        """
+        if self.cursor_query_param not in request.query_params:
+            self.request = request
+            self.limit = self.get_limit(request)
+            if self.limit is None:
+                return None
+            self.count = await queryset.acount()
+            self.offset = self.get_offset(request)
+            if self.count > self.limit and self.template is not None:
+                self.display_page_controls = True
+            if self.count == 0 or self.offset > self.count:
+                return []
+            return [item async for item in queryset[self.offset:self.offset + self.limit]]
+
+        mode = self.start_keyset(request)
+        if mode == 'exact':
+            self.count = await queryset.acount()
+        elif mode == 'estimate':
+            self.count = await sync_to_async(estimate_count)(queryset)
+        else:
+            self.count = None
+        return self.finish_keyset([item async for item in self.keyset_page(queryset, request)])
+
+    def start_keyset(self, request) -> str:
+        mode = request.query_params.get(self.count_query_param, 'none')
+        if mode not in self.count_modes:
+            raise ValidationError({self.count_query_param: f'Expected one of: {", ".join(self.count_modes)}'})
+        self.keyset = True
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.fields = self.get_keyset_fields(request)
+        return mode
+
+    def get_keyset_fields(self, request) -> tuple[str, ...]:
+        return self.keyset_fields
+
+    def keyset_page(self, queryset: QuerySet, request) -> QuerySet:
+        queryset = queryset.order_by(*self.fields)
+        position = self.decode_cursor(request)
+        if position is not None:
+            position = self.clean_position(queryset, position)
+            queryset = queryset.filter(self.after(queryset, position, self.fields))
+        return queryset[:self.limit + 1]
+
+    def finish_keyset(self, page: list) -> list:
+        self.next_position = None
+        if len(page) > self.limit:
+            page = page[:self.limit]
+            self.next_position = [self.get_value(page[-1], field.lstrip('-')) for field in self.fields]
+        return page
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'count': self.count,
+            'next': self.get_next_cursor_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count']['nullable'] = True
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Keyset-пагинация: пустое значение - первая страница, дальше значение из "next".',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Подсчет строк в keyset режиме: none (по умолчанию), estimate или exact.',
+                'schema': {'type': 'string', 'enum': list(self.count_modes)},
+            },
+        ]
+
+    def after(self, queryset: QuerySet, position: list, fields: tuple[str, ...] | None = None) -> RawSQL | Q:
+        fields = fields or self.keyset_fields
+        opts = queryset.model._meta
+        names = [field.lstrip('-') for field in fields]
+        descending = {field.startswith('-') for field in fields}
+        try:
+            columns = [opts.get_field(name).column for name in names]
+        except FieldDoesNotExist:
+            columns = None
+        if columns is None or len(descending) > 1:
+            # Развернутое сравнение работает с аннотациями и разными направлениями
+            condition = Q()
+            for index, field in enumerate(fields):
+                lookup = 'lt' if field.startswith('-') else 'gt'
+                equal = {name: value for name, value in zip(names[:index], position)}
+                condition |= Q(**equal, **{f'{names[index]}__{lookup}': position[index]})
+            return condition
+
+        quote = connection.ops.quote_name
+        columns = ', '.join(f'{quote(opts.db_table)}.{quote(column)}' for column in columns)
+        placeholders = ', '.join(['%s'] * len(position))
+        operator = '<' if descending == {True} else '>'
+        return RawSQL(f'({columns}) {operator} ({placeholders})', position, output_field=BooleanField())
+
+    def decode_cursor(self, request) -> list | None:
+        encoded = request.query_params[self.cursor_query_param]
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.fields):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def clean_position(self, queryset: QuerySet, position: list) -> list:
+        """
+        Приводит значения курсора к типам полей, иначе они попали бы в SQL как есть
+
+        Поля модели проверяются своим 'clean' (тип, диапазон, длина),
+        аннотации вроде ранга поиска должны быть числами.
+
+        :raises NotFound: Если значение не подходит полю
+        """
+        opts = queryset.model._meta
+        cleaned = []
+        for field, value in zip(self.fields, position):
+            if value is None or isinstance(value, (bool, dict, list)):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                model_field = opts.get_field(field.lstrip('-'))
+            except FieldDoesNotExist:
+                if not isinstance(value, (int, float)):
+                    raise NotFound(self.invalid_cursor_message)
+                cleaned.append(float(value))
+                continue
+            try:
+                cleaned.append(model_field.clean(value, None))
+            except DjangoValidationError:
+                raise NotFound(self.invalid_cursor_message)
+        return cleaned
+
+    def get_next_cursor_link(self) -> str | None:
+        if self.next_position is None:
+            return None
+        encoded = base64.urlsafe_b64encode(json.dumps(self.next_position).encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    @staticmethod
+    def get_value(item, field: str):
+        return item[field] if isinstance(item, dict) else getattr(item, field)
+
+
+class MaterialPagination(KeysetPagination):
+    # Совпадает с Material.Meta.ordering и индексом material_price_name_id_idx,
+    # результаты поиска листаются по рангу
+    keyset_fields = ('price', 'name', 'id')
+
+    def get_keyset_fields(self, request) -> tuple[str, ...]:
+        if request.query_params.get(search.SEARCH_PARAM, '').strip():
+            return search.KEYSET_FIELDS
+        return self.keyset_fields
+
+
+def estimate_count(queryset: QuerySet) -> int:
+    """
+    Оценивает количество строк без COUNT(*)
+
+    Для запроса без фильтров берется 'pg_class.reltuples', иначе - оценка
+    строк из плана запроса.
+
+    :param queryset: QuerySet, строки которого нужно посчитать
+    :return: Приблизительное количество строк
+    """
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+            if row and row[0] >= 0:
+                return row[0]
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
@@ -1,14 +1,20 @@
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 
-from materials.models import Category, Material
+from materials.models import Category, ImportJob, Material
+from materials.api.v1.services import columnar, export, stats, xlsx
 from materials.api.v1.services.utils import calculate_total
+from materials.api.v1.services.validation import INT_MAX, INT_MIN, NAME_MAX_LENGTH
 
 
 class CategorySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Category
-        fields = '__all__'
+        # Порядок полей модели, его же повторяет CategoryFastSerializer
+        fields = ('id', 'name', 'parent', 'total_sum', 'materials_count', 'depth')
 
 
 class CategoryListSerializer(serializers.Serializer):
@@ -25,11 +31,22 @@ class CategoryWriteSerializer(serializers.ModelSerializer):
         fields = ('name', 'parent')
 
 
+class CategoryMoveSerializer(serializers.Serializer):
+    parent = serializers.IntegerField(allow_null=True, help_text='Новый родитель; null - сделать категорию корнем')
+
+
+class CategoryDestroyQuerySerializer(serializers.Serializer):
+    with_materials = serializers.BooleanField(
+        default=False, help_text='Удалить вместе с поддеревом и его материалы'
+    )
+
+
 class MaterialFullSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Material
-        fields = '__all__'
+        # Порядок полей модели, его же повторяет MaterialFastSerializer
+        fields = ('id', 'name', 'category', 'article', 'price')
 
 
 class MaterialCreateSerializer(serializers.ModelSerializer):
@@ -40,16 +57,9 @@ class MaterialCreateSerializer(serializers.ModelSerializer):
         fields = ('name', 'article', 'price', 'subcategory')
 
 
-class MaterialFromXLSXSerializer(serializers.Serializer):
-    name = serializers.CharField()
-    article = serializers.IntegerField()
-    price = serializers.IntegerField()
-
-
-
 class MaterialPutUpdateSerializer(serializers.ModelSerializer):
     name = serializers.CharField()
-    article = serializers.IntegerField()
+    article = serializers.IntegerField(validators=[UniqueValidator(queryset=Material.objects.all())])
     price = serializers.IntegerField()
 
     class Meta:
@@ -59,7 +69,10 @@ class MaterialPutUpdateSerializer(serializers.ModelSerializer):
 
 class MaterialPatchUpdateSerializer(serializers.ModelSerializer):
     name = serializers.CharField(required=False)
-    article = serializers.IntegerField(required=False)
+    article = serializers.IntegerField(
+        required=False,
+        validators=[UniqueValidator(queryset=Material.objects.all())]
+    )
     price = serializers.IntegerField(required=False)
 
     class Meta:
@@ -67,6 +80,68 @@ class MaterialPatchUpdateSerializer(serializers.ModelSerializer):
         fields = ('name', 'article', 'price')
 
 
+# Пакетные сериализаторы - обычные Serializer без UniqueValidator: артикулы и
+# категории проверяются для всей пачки сразу в 'services.bulk'
+class MaterialBulkCreateSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=NAME_MAX_LENGTH)
+    article = serializers.IntegerField(min_value=INT_MIN, max_value=INT_MAX)
+    price = serializers.IntegerField(min_value=INT_MIN, max_value=INT_MAX)
+    subcategory = serializers.IntegerField()
+
+
+class MaterialBulkUpdateSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField(max_length=NAME_MAX_LENGTH, required=False)
+    article = serializers.IntegerField(min_value=INT_MIN, max_value=INT_MAX, required=False)
+    price = serializers.IntegerField(min_value=INT_MIN, max_value=INT_MAX, required=False)
+    subcategory = serializers.IntegerField(required=False)
+
+
+class MaterialBulkItemResultSerializer(serializers.Serializer):
+    index = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=('created', 'updated', 'deleted', 'error'))
+    id = serializers.IntegerField(required=False)
+    errors = serializers.DictField(child=serializers.ListField(child=serializers.CharField()), required=False)
+
+
+class MaterialBulkResultSerializer(serializers.Serializer):
+    succeeded = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    results = MaterialBulkItemResultSerializer(many=True)
+
+
+class MaterialExportQuerySerializer(serializers.Serializer):
+    fmt = serializers.ChoiceField(choices=tuple(export.EXPORT_FORMATS), default='ndjson')
+    category = serializers.IntegerField(
+        min_value=1, required=False, help_text='Выгрузить только поддерево этой категории'
+    )
+
+
+def validate_bulk_items(
+        data, child: serializers.Field, max_items: int
+) -> tuple[dict[int, dict], dict[int, dict]]:
+    """
+    Валидирует каждый элемент пачки, не прерываясь на ошибках
+
+    :param data: Тело запроса - массив элементов
+    :param child: Сериализатор или поле одного элемента
+    :param max_items: Максимальный размер пачки
+    :return: Валидные элементы и ошибки элементов по их индексам в массиве
+    """
+    if not isinstance(data, list):
+        raise serializers.ValidationError({'non_field_errors': ['Expected a list of items.']})
+    if not 0 < len(data) <= max_items:
+        raise serializers.ValidationError({'non_field_errors': [f'Expected from 1 to {max_items} items.']})
+
+    items, errors = {}, {}
+    for index, item in enumerate(data):
+        try:
+            items[index] = child.run_validation(item)
+        except serializers.ValidationError as exc:
+            errors[index] = exc.detail if isinstance(exc.detail, dict) else {'non_field_errors': exc.detail}
+    return items, errors
+
+
 class MaterialSerializerForTree(MaterialFullSerializer):
     pass
 
@@ -95,10 +170,140 @@ class CategoryTreeSerializer(serializers.ModelSerializer):
         return result
 
 
+class CategorySubtreeSerializer(CategoryTreeSerializer):
+    has_children = serializers.BooleanField()
+    child_count = serializers.IntegerField()
+
+    class Meta(CategoryTreeSerializer.Meta):
+        fields = CategoryTreeSerializer.Meta.fields + ('has_children', 'child_count')
+
+
+class CategorySubtreeQuerySerializer(serializers.Serializer):
+    depth = serializers.IntegerField(min_value=0, required=False, allow_null=True, default=None)
+    include_materials = serializers.BooleanField(default=True)
+
+
+class CategoryStatsQuerySerializer(serializers.Serializer):
+    buckets = serializers.IntegerField(min_value=1, max_value=stats.MAX_BUCKETS, default=stats.DEFAULT_BUCKETS)
+
+
+class CategoryStatsBulkQuerySerializer(CategoryStatsQuerySerializer):
+    ids = serializers.CharField(help_text='Идентификаторы категорий через запятую')
+
+    def validate_ids(self, value: str) -> list[int]:
+        parts = [part.strip() for part in value.split(',') if part.strip()]
+        if not all(part.isascii() and part.isdigit() for part in parts):
+            raise serializers.ValidationError('Expected comma-separated category ids.')
+        ids = list(dict.fromkeys(int(part) for part in parts))
+        max_ids = settings.CATEGORY_STATS_MAX_IDS
+        if not 0 < len(ids) <= max_ids:
+            raise serializers.ValidationError(f'Expected from 1 to {max_ids} ids.')
+        return ids
+
+
+class PriceBucketSerializer(serializers.Serializer):
+    lower = serializers.FloatField()
+    upper = serializers.FloatField()
+    count = serializers.IntegerField()
+
+
+class CategoryStatsSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    count = serializers.IntegerField()
+    sum = serializers.IntegerField()
+    min = serializers.IntegerField(allow_null=True)
+    max = serializers.IntegerField(allow_null=True)
+    avg = serializers.FloatField(allow_null=True)
+    histogram = PriceBucketSerializer(many=True)
+
+
+class ValuesListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        return list(data)
+
+
+class ValuesSerializer(serializers.BaseSerializer):
+    """
+    Read-only сериализатор строк, уже собранных запросом '.values()'
+
+    Вывод строится в SQL: 'prepare_queryset' выбирает ровно поля ответа
+    в нужном порядке, а сериализатор отдает строки как есть, без полей
+    DRF и to_representation на каждое значение.
+    """
+    values_fields = ()
+
+    class Meta:
+        list_serializer_class = ValuesListSerializer
+
+    @classmethod
+    def prepare_queryset(cls, queryset):
+        return queryset.values(*cls.values_fields)
+
+    def to_representation(self, instance):
+        return instance
+
+
+class MaterialFastSerializer(ValuesSerializer):
+    # Тот же вывод и порядок ключей, что у MaterialFullSerializer
+    values_fields = ('id', 'name', 'category', 'article', 'price')
+
+
+class CategoryFastSerializer(ValuesSerializer):
+    # Тот же вывод и порядок ключей, что у CategorySerializer
+    values_fields = ('id', 'name', 'parent', 'total_sum', 'materials_count', 'depth')
+
+
+class CategoryListFastSerializer(ValuesSerializer):
+    # Тот же вывод, что у CategoryListSerializer
+    @classmethod
+    def prepare_queryset(cls, queryset):
+        return queryset.values_list('name', flat=True)
+
+
 class FileUploadSerializer(serializers.Serializer):
     file = serializers.FileField()
+    mode = serializers.ChoiceField(choices=ImportJob.Mode.choices, default=ImportJob.Mode.INSERT)
+    engine = serializers.ChoiceField(choices=ImportJob.Engine.choices, default=ImportJob.Engine.ORM)
+    sheets = serializers.CharField(default='0', help_text="'all' или индексы листов через запятую")
 
     def validate_file(self, value):
-        if not value.name.endswith('.xlsx'):
-            raise serializers.ValidationError('Only .xlsx files are allowed')
-        return value
\ No newline at end of file
+        if not value.name.lower().endswith(tuple(columnar.supported_formats())):
+            raise serializers.ValidationError(f'Only {", ".join(columnar.supported_formats())} files are allowed')
+        return value
+
+    def validate(self, attrs):
+        file = attrs['file']
+        try:
+            sheet_count = columnar.get_sheet_count(file, columnar.get_file_format(file.name))
+        except ValueError as exc:
+            raise serializers.ValidationError({'file': str(exc)})
+        except Exception:
+            raise serializers.ValidationError({'file': 'File cannot be read'})
+        finally:
+            file.seek(0)
+        try:
+            attrs['sheets'] = xlsx.parse_sheet_list(attrs['sheets'], sheet_count)
+        except ValueError as exc:
+            raise serializers.ValidationError({'sheets': str(exc)})
+        if attrs['engine'] == ImportJob.Engine.COPY and len(attrs['sheets']) > 1:
+            raise serializers.ValidationError({'engine': 'COPY engine imports a single sheet only'})
+        return attrs
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = (
+            'id', 'status', 'mode', 'engine', 'rows_processed', 'rows_rejected', 'rows_inserted', 'rows_updated',
+            'rows_unchanged', 'rows_per_second', 'errors', 'sheets', 'sheet_reports', 'detail', 'created_at',
+            'started_at', 'finished_at'
+        )
+
+    def get_rows_per_second(self, instance: ImportJob) -> float | None:
+        if instance.started_at is None:
+            return None
+        elapsed = ((instance.finished_at or timezone.now()) - instance.started_at).total_seconds()
+        return round(instance.rows_processed / elapsed, 1) if elapsed > 0 else None
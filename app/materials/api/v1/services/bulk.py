@@ -0,0 +1,205 @@
+from django.db import connection, transaction
+
+from materials.api.v1.services.cache import bump_catalogue_version
+from materials.api.v1.services.totals import apply_material_deltas, collect_deltas
+from materials.models import Category, Material
+
+
+NOT_LEAF_ERROR = 'Category not found or not leaf category'
+ARTICLE_TAKEN_ERROR = 'Material with this article already exists.'
+
+# Артикул, занятый параллельной транзакцией уже после проверки, не ломает вставку:
+# такая строка пропускается, а RETURNING показывает, какие строки вставлены
+INSERT_MISSING_SQL = f'''
+    INSERT INTO {Material._meta.db_table} (name, article, price, category_id)
+    SELECT * FROM unnest(%s::varchar[], %s::integer[], %s::integer[], %s::bigint[])
+    ON CONFLICT (article) DO NOTHING
+    RETURNING article, id
+'''
+
+
+def create_materials(items: dict[int, dict], errors: dict[int, dict]) -> list[dict]:
+    """
+    Создает пачку материалов одной транзакцией
+
+    Листовые категории и занятые артикулы всей пачки проверяются двумя
+    запросами, материалы вставляются одним запросом 'insert_missing', итоги
+    предков обновляются одним UPDATE. Элементы с ошибками, в том числе с
+    артикулом, занятым параллельно, пропускаются.
+
+    :param items: Провалидированные элементы по индексам в запросе
+    :param errors: Ошибки элементов по индексам, дополняются ошибками пачки
+    :return: Результаты элементов в порядке запроса
+    """
+    with transaction.atomic():
+        leaves = _leaf_ids({item['subcategory'] for item in items.values()})
+        taken = set(
+            Material.objects.filter(article__in={item['article'] for item in items.values()})
+            .order_by().values_list('article', flat=True)
+        )
+        created = {}
+        for index, item in items.items():
+            if item['subcategory'] not in leaves:
+                errors[index] = {'subcategory': [NOT_LEAF_ERROR]}
+            elif item['article'] in taken:
+                errors[index] = {'article': [ARTICLE_TAKEN_ERROR]}
+            else:
+                taken.add(item['article'])
+                created[index] = Material(
+                    name=item['name'], article=item['article'], price=item['price'], category_id=item['subcategory']
+                )
+
+        ids = insert_missing(list(created.values()))
+        for index, material in list(created.items()):
+            if material.article in ids:
+                material.id = ids[material.article]
+            else:
+                errors[index] = {'article': [ARTICLE_TAKEN_ERROR]}
+                del created[index]
+
+        if created:
+            apply_material_deltas(collect_deltas(
+                (material.category_id, material.price, 1) for material in created.values()
+            ))
+            bump_catalogue_version()
+    return _results({index: material.id for index, material in created.items()}, 'created', errors)
+
+
+def update_materials(items: dict[int, dict], errors: dict[int, dict]) -> list[dict]:
+    """
+    Частично обновляет пачку материалов одной транзакцией
+
+    Материалы блокируются и читаются одним запросом, новые категории и
+    артикулы проверяются еще двумя, запись - один bulk_update только
+    по переданным полям. Артикул, занятый другим материалом, в том числе
+    из этой же пачки, считается ошибкой.
+
+    :param items: Провалидированные элементы (id и изменяемые поля) по индексам в запросе
+    :param errors: Ошибки элементов по индексам, дополняются ошибками пачки
+    :return: Результаты элементов в порядке запроса
+    """
+    with transaction.atomic():
+        current = {
+            material_id: (name, article, price, category_id)
+            for material_id, name, article, price, category_id in Material.objects.select_for_update().filter(
+                id__in={item['id'] for item in items.values()}
+            ).order_by('id').values_list('id', 'name', 'article', 'price', 'category_id')
+        }
+        leaves = _leaf_ids({item['subcategory'] for item in items.values() if 'subcategory' in item})
+        new_articles = {
+            item['article'] for item in items.values()
+            if item['id'] in current and item.get('article', current[item['id']][1]) != current[item['id']][1]
+        }
+        taken = set(
+            Material.objects.filter(article__in=new_articles).order_by().values_list('article', flat=True)
+        )
+
+        changed, fields, deltas, seen = {}, set(), [], set()
+        for index, item in items.items():
+            if item['id'] not in current:
+                errors[index] = {'id': ['Material not found.']}
+                continue
+            if item['id'] in seen:
+                errors[index] = {'id': ['Duplicate id in request.']}
+                continue
+            name, article, price, category_id = current[item['id']]
+            if 'subcategory' in item and item['subcategory'] not in leaves:
+                errors[index] = {'subcategory': [NOT_LEAF_ERROR]}
+                continue
+            if item.get('article', article) != article:
+                if item['article'] in taken:
+                    errors[index] = {'article': [ARTICLE_TAKEN_ERROR]}
+                    continue
+                taken.add(item['article'])
+            seen.add(item['id'])
+            material = Material(
+                id=item['id'],
+                name=item.get('name', name),
+                article=item.get('article', article),
+                price=item.get('price', price),
+                category_id=item.get('subcategory', category_id),
+            )
+            changed[index] = material
+            fields.update(field for field in ('name', 'article', 'price') if field in item)
+            if 'subcategory' in item:
+                fields.add('category')
+            if (material.price, material.category_id) != (price, category_id):
+                deltas.extend(((category_id, -price, -1), (material.category_id, material.price, 1)))
+
+        if fields:
+            Material.objects.bulk_update(changed.values(), sorted(fields))
+            apply_material_deltas(collect_deltas(deltas))
+            bump_catalogue_version()
+    return _results({index: material.id for index, material in changed.items()}, 'updated', errors)
+
+
+def delete_materials(ids: dict[int, int], errors: dict[int, dict]) -> list[dict]:
+    """
+    Удаляет пачку материалов одной транзакцией
+
+    :param ids: Идентификаторы материалов по индексам в запросе
+    :param errors: Ошибки элементов по индексам, дополняются ошибками пачки
+    :return: Результаты элементов в порядке запроса
+    """
+    with transaction.atomic():
+        current = {
+            material_id: (price, category_id)
+            for material_id, price, category_id in Material.objects.select_for_update().filter(
+                id__in=set(ids.values())
+            ).order_by('id').values_list('id', 'price', 'category_id')
+        }
+        deleted = {}
+        for index, material_id in ids.items():
+            if material_id not in current:
+                errors[index] = {'id': ['Material not found.']}
+            elif current[material_id] is None:
+                errors[index] = {'id': ['Duplicate id in request.']}
+            else:
+                price, category_id = current[material_id]
+                current[material_id] = None
+                deleted[index] = (material_id, price, category_id)
+
+        if deleted:
+            Material.objects.filter(id__in=[material_id for material_id, _, _ in deleted.values()]).delete()
+            apply_material_deltas(collect_deltas(
+                (category_id, -price, -1) for _, price, category_id in deleted.values()
+            ))
+            bump_catalogue_version()
+    return _results({index: material_id for index, (material_id, _, _) in deleted.items()}, 'deleted', errors)
+
+
+def insert_missing(materials: list[Material]) -> dict[int, int]:
+    """
+    Вставляет материалы одним запросом, пропуская уже занятые артикулы
+
+    Проверка артикулов перед вставкой не защищает от параллельной транзакции,
+    которая вставит тот же артикул между проверкой и вставкой: bulk_create
+    тогда упал бы на уникальном индексе вместе со всей пачкой. Здесь такие
+    строки пропускаются через ON CONFLICT DO NOTHING, и вызывающий код
+    решает, что с ними делать.
+
+    :param materials: Несохраненные материалы с разными артикулами
+    :return: Словарь 'артикул -> id' только для вставленных материалов
+    """
+    if not materials:
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute(INSERT_MISSING_SQL, [
+            [material.name for material in materials],
+            [material.article for material in materials],
+            [material.price for material in materials],
+            [material.category_id for material in materials],
+        ])
+        return dict(cursor.fetchall())
+
+
+def _leaf_ids(category_ids: set[int]) -> set[int]:
+    if not category_ids:
+        return set()
+    return set(Category.objects.leaves().filter(id__in=category_ids).order_by().values_list('id', flat=True))
+
+
+def _results(succeeded: dict[int, int], status: str, errors: dict[int, dict]) -> list[dict]:
+    results = [{'index': index, 'status': status, 'id': material_id} for index, material_id in succeeded.items()]
+    results.extend({'index': index, 'status': 'error', 'errors': item_errors} for index, item_errors in errors.items())
+    return sorted(results, key=lambda result: result['index'])
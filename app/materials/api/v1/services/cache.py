@@ -0,0 +1,109 @@
+import hashlib
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+VERSION_KEY = 'materials:catalogue:version'
+PAYLOAD_KEY = 'materials:catalogue:{version}:{name}'
+
+
+def get_catalogue_version() -> int:
+    """
+    Возвращает текущую версию каталога, не обращаясь к БД
+
+    Начальное значение берется из времени, чтобы после вытеснения ключа
+    из кэша версия не совпала с уже выданными клиентам ETag.
+
+    :return: Номер версии
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def aget_catalogue_version() -> int:
+    """
+    То же, что 'get_catalogue_version', но через асинхронный API кэша
+
+    :return: Номер версии
+    """
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def bump_catalogue_version() -> None:
+    """
+    Делает недействительными все закэшированные ответы каталога
+
+    Версия меняется сразу и еще раз после фиксации транзакции: иначе
+    параллельный запрос мог бы закэшировать еще не измененные данные
+    под новой версией, пока транзакция записи не зафиксирована.
+    """
+    _increment()
+    transaction.on_commit(_increment)
+
+
+def get_or_build(name: str, build: Callable[[], Any]) -> tuple[Any, str]:
+    """
+    Возвращает ответ из кэша текущей версии каталога или строит и кэширует его
+
+    :param name: Имя ответа, уникальное для ресурса и его параметров (например, 'tree' или 'tree:5')
+    :param build: Функция, собирающая данные ответа
+    :return: Данные и ETag ответа
+    """
+    version = get_catalogue_version()
+    key = PAYLOAD_KEY.format(version=version, name=name)
+    payload = cache.get(key)
+    if payload is None:
+        payload = build()
+        cache.set(key, payload, timeout=settings.CATALOGUE_CACHE_TIMEOUT)
+    return payload, make_etag(name, version)
+
+
+async def aget_or_build(name: str, build: Callable[[], Awaitable[Any]]) -> tuple[Any, str]:
+    """
+    То же, что 'get_or_build', но для асинхронных view
+
+    :param name: Имя ответа, см. 'get_or_build'
+    :param build: Корутинная функция, собирающая данные ответа
+    :return: Данные и ETag ответа
+    """
+    version = await aget_catalogue_version()
+    key = PAYLOAD_KEY.format(version=version, name=name)
+    payload = await cache.aget(key)
+    if payload is None:
+        payload = await build()
+        await cache.aset(key, payload, timeout=settings.CATALOGUE_CACHE_TIMEOUT)
+    return payload, make_etag(name, version)
+
+
+def make_etag(name: str, version: int | None = None) -> str:
+    """
+    ETag ответа каталога: меняется вместе с версией каталога
+
+    В ETag входит имя ответа, поэтому ETag одного ресурса (например,
+    поддерева другой категории) не совпадет с ETag другого.
+
+    :param name: Имя ответа, см. 'get_or_build'
+    :param version: Версия каталога, по умолчанию - текущая
+    :return: Слабый ETag
+    """
+    digest = hashlib.md5(f'{version or get_catalogue_version()}:{name}'.encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _increment() -> None:
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_catalogue_version()
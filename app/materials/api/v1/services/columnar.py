@@ -0,0 +1,224 @@
+import csv
+import io
+import os.path
+from collections.abc import Iterator
+from itertools import islice
+
+from materials.api.v1.services import xlsx
+from materials.api.v1.services.validation import validate_batches, validate_columns
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.csv
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pyarrow - необязательная зависимость, без нее CSV читается модулем csv, а Parquet недоступен
+    pyarrow = None
+
+
+XLSX, CSV, PARQUET, ARROW = 'xlsx', 'csv', 'parquet', 'arrow'
+FILE_FORMATS = {
+    '.xlsx': XLSX,
+    '.csv': CSV,
+    '.parquet': PARQUET,
+    '.arrow': ARROW,
+    '.feather': ARROW,
+}
+# Форматам без листов нужен pyarrow, CSV читается и без него
+ARROW_FORMATS = (PARQUET, ARROW)
+# Колонки CSV, Parquet и Arrow выбираются по имени, в порядке строк импорта
+IMPORT_COLUMNS = ('name', 'article', 'price', 'category_name')
+INT_COLUMNS = ('article', 'price')
+READ_BATCH_SIZE = 64 * 1024
+
+
+def get_file_format(filename: str) -> str | None:
+    """
+    :param filename: Имя файла
+    :return: Формат по расширению файла или None, если формат не поддерживается
+    """
+    return FILE_FORMATS.get(os.path.splitext(filename)[1].lower())
+
+
+def supported_formats() -> list[str]:
+    """
+    :return: Расширения файлов, которые можно импортировать в текущем окружении
+    """
+    return [
+        extension for extension, file_format in FILE_FORMATS.items()
+        if pyarrow is not None or file_format not in ARROW_FORMATS
+    ]
+
+
+def get_sheet_count(file, file_format: str) -> int:
+    """
+    Проверяет, что файл читается и содержит колонки импорта
+
+    :param file: Путь к файлу или открытый бинарный файл
+    :param file_format: Формат из 'get_file_format'
+    :return: Количество листов: у xlsx - листы книги, у остальных форматов один лист
+    :raises ValueError: Если в файле нет колонок импорта
+    """
+    if file_format == XLSX:
+        return len(xlsx.get_sheet_names(file))
+    if file_format == CSV:
+        columns = _read_csv_header(file)
+    elif file_format == PARQUET:
+        columns = pyarrow.parquet.read_schema(file).names
+    else:
+        columns = pyarrow.ipc.open_file(file).schema.names
+    if missing := [column for column in IMPORT_COLUMNS if column not in columns]:
+        raise ValueError(f'Missing columns: {", ".join(missing)}.')
+    return 1
+
+
+def get_datas(file, file_format: str, sheet_page: int = 0) -> Iterator[tuple]:
+    """
+    Построчно читает материалы из файла любого поддерживаемого формата
+
+    :param file: Путь к файлу или открытый бинарный файл
+    :param file_format: Формат из 'get_file_format'
+    :param sheet_page: Индекс листа, только для xlsx
+    :return: Генератор строк (name, article, price, category_name), как у 'get_datas_from_xlsx'
+    """
+    if file_format == XLSX:
+        return xlsx.get_datas_from_xlsx(file, sheet_page=sheet_page)
+    if file_format == CSV and pyarrow is None:
+        return _iter_csv_rows(file)
+    return (
+        row
+        for arrays in _iter_arrays(file, file_format)
+        for row in zip(*(array.to_pylist() for array in arrays))
+    )
+
+
+def iter_batches(file, file_format: str, batch_size: int, skip_rows: int = 0, sheet_page: int = 0) -> Iterator[tuple]:
+    """
+    Читает и валидирует файл пачками, как 'xlsx.iter_sheet_batches'
+
+    Колонки CSV (с pyarrow), Parquet и Arrow не собираются в строки: пустые
+    строки отбрасываются и целочисленные колонки приводятся к int векторно,
+    после чего колонки пачки сразу передаются в 'validate_columns'.
+
+    :param file: Путь к файлу или открытый бинарный файл
+    :param file_format: Формат из 'get_file_format'
+    :param batch_size: Размер пачки
+    :param skip_rows: Сколько строк данных уже записано и пропускается при возобновлении
+    :param sheet_page: Индекс листа, только для xlsx
+    :return: Генератор (колонки, ошибки, прочитано строк) в формате 'validate_rows'
+    """
+    if file_format == XLSX or (file_format == CSV and pyarrow is None):
+        rows = islice(get_datas(file, file_format, sheet_page=sheet_page), skip_rows, None)
+        yield from validate_batches(rows, batch_size, first_row_number=2 + skip_rows)
+        return
+    row_number = 2 + skip_rows
+    for arrays in _iter_arrays(file, file_format):
+        if skip_rows >= len(arrays[0]):
+            skip_rows -= len(arrays[0])
+            continue
+        arrays, skip_rows = [array.slice(skip_rows) for array in arrays], 0
+        for offset in range(0, len(arrays[0]), batch_size):
+            chunk = [array.slice(offset, batch_size) for array in arrays]
+            yield (*validate_columns(*_present_rows(chunk, row_number)), len(chunk[0]))
+            row_number += len(chunk[0])
+
+
+def get_datas_from_csv(file) -> Iterator[tuple]:
+    """
+    Читает материалы из CSV файла с заголовком, колонки выбираются по имени
+
+    С pyarrow файл разбирается потоково большими блоками в колонки, и
+    целочисленные колонки блока приводятся к int одной векторной операцией;
+    без pyarrow файл читается модулем csv. Каждая строка CSV, в том числе
+    пустая, - одна строка данных, поэтому номера строк в отчете совпадают с
+    файлом, если в нем нет значений с переводами строк.
+
+    :param file: Путь к файлу или открытый бинарный файл в UTF-8
+    :return: Генератор строк (name, article, price, category_name)
+    """
+    return get_datas(file, CSV)
+
+
+def _open_csv(file):
+    return pyarrow.csv.open_csv(
+        file,
+        # Имена колонок берутся из заголовка без пробелов по краям, как их проверяет 'get_sheet_count'
+        read_options=pyarrow.csv.ReadOptions(
+            block_size=4 * 1024 * 1024, column_names=_read_csv_header(file), skip_rows=1
+        ),
+        # Пустые строки читаются как строки из null, чтобы не сдвигать номера строк в отчете
+        parse_options=pyarrow.csv.ParseOptions(ignore_empty_lines=False),
+        # Все колонки читаются строками: вывод типов по первому блоку падал бы на
+        # первой нечисловой цене в следующих, а ошибки должны попасть в отчет построчно
+        convert_options=pyarrow.csv.ConvertOptions(
+            include_columns=list(IMPORT_COLUMNS),
+            column_types={column: pyarrow.string() for column in IMPORT_COLUMNS},
+            strings_can_be_null=True,
+        ),
+    )
+
+
+def _iter_arrays(file, file_format: str) -> Iterator[list]:
+    if file_format == CSV:
+        batches = _open_csv(file)
+    elif file_format == PARQUET:
+        batches = pyarrow.parquet.ParquetFile(file).iter_batches(READ_BATCH_SIZE, columns=IMPORT_COLUMNS)
+    else:
+        batches = _iter_ipc_batches(file)
+    for batch in batches:
+        yield [_cast_int(batch.column(column)) if column in INT_COLUMNS else batch.column(column)
+               for column in IMPORT_COLUMNS]
+
+
+def _cast_int(column):
+    if pyarrow.types.is_string(column.type) or pyarrow.types.is_large_string(column.type):
+        try:
+            # Обычно числовая колонка целиком приводится к int за одну операцию, и
+            # валидации остается быстрый путь; при любой ошибке колонка остается
+            # строками, и 'validate_columns' сообщит о конкретных строках
+            return pyarrow.compute.cast(pyarrow.compute.utf8_trim_whitespace(column), pyarrow.int64())
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowNotImplementedError):
+            pass
+    return column
+
+
+def _present_rows(arrays: list, first_row_number: int) -> tuple[list[list], list[int]]:
+    # Полностью пустые строки пропускаются, как в 'validate_rows', но номера остальных сохраняются
+    present = pyarrow.compute.is_valid(arrays[0])
+    for array in arrays[1:]:
+        present = pyarrow.compute.or_(present, pyarrow.compute.is_valid(array))
+    if present.false_count:
+        indices = pyarrow.compute.indices_nonzero(present)
+        arrays = [array.take(indices) for array in arrays]
+        numbers = [first_row_number + index for index in indices.to_pylist()]
+    else:
+        numbers = list(range(first_row_number, first_row_number + len(present)))
+    return [array.to_pylist() for array in arrays], numbers
+
+
+def _iter_ipc_batches(file) -> Iterator:
+    reader = pyarrow.ipc.open_file(file)
+    for index in range(reader.num_record_batches):
+        yield reader.get_batch(index).select(IMPORT_COLUMNS)
+
+
+def _read_csv_header(file) -> list[str]:
+    if isinstance(file, str):
+        with open(file, 'rb') as binary:
+            return _read_csv_header(binary)
+    line = file.readline().decode('utf-8-sig')
+    file.seek(0)
+    return [column.strip() for column in next(csv.reader([line]), [])]
+
+
+def _iter_csv_rows(file) -> Iterator[tuple]:
+    if isinstance(file, str):
+        with open(file, 'rb') as binary:
+            yield from _iter_csv_rows(binary)
+        return
+    reader = csv.reader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+    header = [column.strip() for column in next(reader, [])]
+    positions = [header.index(column) for column in IMPORT_COLUMNS]
+    for row in reader:
+        yield tuple(row[position] or None if position < len(row) else None for position in positions)
@@ -0,0 +1,182 @@
+import csv
+from collections.abc import Iterable
+from io import StringIO
+
+from django.db import connection, transaction
+
+from materials.api.v1.services.cache import bump_catalogue_version
+from materials.api.v1.services.specific_queries import IMPORT_BATCH_SIZE, add_errors, new_report
+from materials.api.v1.services.totals import apply_material_deltas
+from materials.api.v1.services.validation import validate_batches
+from materials.models import Category, ImportJob, Material
+
+
+STAGING_TABLE = 'materials_material_staging'
+COPY_BATCH_SIZE = 50 * IMPORT_BATCH_SIZE
+
+MATERIAL_TABLE = Material._meta.db_table
+CATEGORY_TABLE = Category._meta.db_table
+
+# Категория с одинаковым именем - та, у которой меньше id, как и в create_records
+CATEGORIES_CTE = f'''
+    categories AS (
+        SELECT DISTINCT ON (name) name, id FROM {CATEGORY_TABLE} ORDER BY name, id
+    )
+'''
+
+REJECTED_ROWS_SQL = f'''
+    WITH {CATEGORIES_CTE},
+    ranked AS (
+        SELECT
+            s.row_number, s.article, s.category_name, c.id AS category_id,
+            row_number() OVER (
+                PARTITION BY s.article, c.id IS NULL ORDER BY s.row_number {{direction}}
+            ) AS rank
+        FROM {STAGING_TABLE} s LEFT JOIN categories c ON c.name = s.category_name
+    )
+    SELECT row_number, category_name, category_id IS NULL AS unknown_category, rank > 1 AS duplicate
+    FROM ranked r
+    WHERE category_id IS NULL
+        OR rank > 1
+        OR (%(insert_only)s AND EXISTS (SELECT 1 FROM {MATERIAL_TABLE} m WHERE m.article = r.article))
+    ORDER BY row_number
+'''
+
+MERGE_SQL = f'''
+    WITH {CATEGORIES_CTE},
+    incoming AS (
+        SELECT DISTINCT ON (s.article) s.article, s.name, s.price, c.id AS category_id
+        FROM {STAGING_TABLE} s JOIN categories c ON c.name = s.category_name
+        ORDER BY s.article, s.row_number {{direction}}
+    ),
+    previous AS (
+        SELECT m.article, m.price, m.category_id
+        FROM {MATERIAL_TABLE} m JOIN incoming i ON i.article = m.article
+    ),
+    merged AS (
+        INSERT INTO {MATERIAL_TABLE} AS m (name, article, price, category_id)
+        SELECT name, article, price, category_id FROM incoming
+        ON CONFLICT (article) {{conflict}}
+        RETURNING m.article, m.price, m.category_id
+    ),
+    changes AS (
+        SELECT merged.category_id, merged.price, 1 AS delta_count, previous.article IS NULL AS inserted
+        FROM merged LEFT JOIN previous ON previous.article = merged.article
+        UNION ALL
+        SELECT previous.category_id, -previous.price, -1, FALSE
+        FROM merged JOIN previous ON previous.article = merged.article
+    )
+    SELECT
+        category_id,
+        SUM(price),
+        SUM(delta_count),
+        COUNT(*) FILTER (WHERE inserted),
+        COUNT(*) FILTER (WHERE delta_count = 1 AND NOT inserted)
+    FROM changes
+    GROUP BY category_id
+'''
+
+UPDATE_CHANGED = '''
+    DO UPDATE SET name = EXCLUDED.name, price = EXCLUDED.price, category_id = EXCLUDED.category_id
+    WHERE (m.name, m.price, m.category_id) IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.price, EXCLUDED.category_id)
+'''
+
+
+def copy_records(
+        data: Iterable[tuple],
+        batch_size: int = COPY_BATCH_SIZE,
+        first_row_number: int = 2,
+        mode: str = ImportJob.Mode.INSERT,
+) -> dict:
+    """
+    Загружает материалы через COPY во временную таблицу и сливает их одним запросом
+
+    Строки валидируются поколоночно, как в 'create_records', и пачками
+    передаются в 'copy_batches'.
+
+    :param data: Поток строк с материалами (name, article, price, category_name)
+    :param batch_size: Сколько строк передавать за один COPY
+    :param first_row_number: Номер первой строки данных в файле, нужен для отчета
+    :param mode: 'insert' - только добавление, 'upsert' - добавление и обновление по артикулу
+    :return: Отчет в формате 'create_records'
+    """
+    return copy_batches(validate_batches(data, batch_size, first_row_number=first_row_number), mode=mode)
+
+
+def copy_batches(batches: Iterable[tuple], mode: str = ImportJob.Mode.INSERT) -> dict:
+    """
+    Загружает провалидированные пачки через COPY и сливает их одним запросом
+
+    Пачки передаются в PostgreSQL через 'COPY FROM STDIN' из буфера в памяти.
+    Категории находятся по имени прямо в SQL, а перенос в materials_material
+    выполняется одним INSERT ... ON CONFLICT, который сразу возвращает
+    изменения итогов по категориям. Вся загрузка идет в одной транзакции.
+
+    :param batches: Поток (колонки, ошибки, прочитано строк), например из 'columnar.iter_batches'
+    :param mode: 'insert' - только добавление, 'upsert' - добавление и обновление по артикулу
+    :return: Отчет в формате 'create_records'
+    """
+    report = new_report()
+    insert_only = mode == ImportJob.Mode.INSERT
+    # При добавлении из повторов артикула остается первая строка, при обновлении - последняя
+    direction = 'ASC' if insert_only else 'DESC'
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS pg_temp.{STAGING_TABLE}')
+        cursor.execute(
+            f'''
+            CREATE TEMPORARY TABLE {STAGING_TABLE} (
+                row_number bigint NOT NULL,
+                name varchar(100) NOT NULL,
+                article integer NOT NULL,
+                price integer NOT NULL,
+                category_name text NOT NULL
+            ) ON COMMIT DROP
+            '''
+        )
+
+        staged = 0
+        for columns, errors, _ in batches:
+            report['processed'] += len(columns['row']) + len({error['row'] for error in errors})
+            add_errors(report, errors)
+
+            buffer = StringIO()
+            csv.writer(buffer).writerows(
+                zip(columns['row'], columns['name'], columns['article'], columns['price'], columns['category'])
+            )
+            buffer.seek(0)
+            cursor.copy_expert(
+                f'COPY {STAGING_TABLE} (row_number, name, article, price, category_name) FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+            staged += len(columns['row'])
+
+        cursor.execute(f'ANALYZE {STAGING_TABLE}')
+        cursor.execute(REJECTED_ROWS_SQL.format(direction=direction), {'insert_only': insert_only})
+        rejected = 0
+        while rows := cursor.fetchmany(IMPORT_BATCH_SIZE):
+            rejected += len(rows)
+            add_errors(report, [_staging_error(*row) for row in rows])
+
+        conflict = 'DO NOTHING' if insert_only else UPDATE_CHANGED
+        cursor.execute(MERGE_SQL.format(direction=direction, conflict=conflict))
+        deltas = {}
+        for category_id, sum_delta, count_delta, inserted, updated in cursor.fetchall():
+            deltas[category_id] = (sum_delta, count_delta)
+            report['inserted'] += inserted
+            report['updated'] += updated
+        apply_material_deltas(deltas)
+        bump_catalogue_version()
+
+    if not insert_only:
+        report['unchanged'] = staged - rejected - report['inserted'] - report['updated']
+    return report
+
+
+def _staging_error(row_number: int, category_name: str, unknown_category: bool, duplicate: bool) -> dict:
+    if unknown_category:
+        return {'row': row_number, 'field': 'category', 'error': f'Category {category_name}: not found!'}
+    if duplicate:
+        return {'row': row_number, 'field': 'article', 'error': 'Duplicate article in file.'}
+    return {'row': row_number, 'field': 'article', 'error': 'Material with this article already exists.'}
+
@@ -0,0 +1,230 @@
+import csv
+import json
+import tempfile
+from collections.abc import AsyncIterator, Callable, Iterator
+from typing import NamedTuple
+
+from asgiref.sync import sync_to_async
+from openpyxl import Workbook
+
+from materials.models import Category, Material
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pyarrow - необязательная зависимость, без нее выгрузки в Parquet нет
+    pyarrow = None
+
+
+EXPORT_CHUNK_SIZE = 2000
+# Первые четыре колонки совпадают с форматом импорта, поэтому выгрузку можно загрузить обратно
+EXPORT_FIELDS = ('name', 'article', 'price', 'category__name', 'category_id', 'id')
+EXPORT_HEADER = ('name', 'article', 'price', 'category_name', 'category', 'id')
+ID_POSITION = EXPORT_FIELDS.index('id')
+FILE_CHUNK_SIZE = 64 * 1024
+# Строк в группе Parquet: столько строк держится в памяти перед записью группы
+PARQUET_ROW_GROUP_SIZE = 64 * 1024
+
+
+def get_export_rows(category: Category | None = None) -> Iterator[tuple]:
+    """
+    Построчно читает материалы для выгрузки пачками по ключу
+
+    Серверные курсоры за pgbouncer отключены (DB_DISABLE_SERVER_SIDE_CURSORS), и
+    iterator() тогда загружает в память всю выборку. Вместо курсора каждая пачка
+    выбирается отдельным запросом 'id > последний id пачки', поэтому память
+    ограничена пачкой, а выборка по первичному ключу не замедляется к концу.
+    Пачки читаются разными запросами, поэтому материалы, измененные во время
+    выгрузки, могут попасть в нее как до, так и после изменения.
+
+    :param category: Категория, поддерево которой нужно выгрузить; None - весь каталог
+    :return: Генератор кортежей в порядке 'EXPORT_FIELDS'
+    """
+    queryset = _export_queryset(category)
+    last_id = 0
+    while batch := list(queryset.filter(id__gt=last_id)[:EXPORT_CHUNK_SIZE]):
+        yield from batch
+        last_id = batch[-1][ID_POSITION]
+
+
+async def aget_export_rows(category: Category | None = None) -> AsyncIterator[tuple]:
+    """
+    То же, что 'get_export_rows', но через асинхронный ORM (для ASGI)
+
+    :param category: Категория, поддерево которой нужно выгрузить; None - весь каталог
+    :return: Асинхронный генератор кортежей в порядке 'EXPORT_FIELDS'
+    """
+    queryset = _export_queryset(category)
+    last_id = 0
+    while batch := await sync_to_async(list)(queryset.filter(id__gt=last_id)[:EXPORT_CHUNK_SIZE]):
+        for row in batch:
+            yield row
+        last_id = batch[-1][ID_POSITION]
+
+
+def iter_ndjson(rows: Iterator[tuple]) -> Iterator[str]:
+    """
+    Отдает строки в формате JSON Lines, по одному объекту на строку
+
+    :param rows: Строки из 'get_export_rows'
+    :return: Генератор строк NDJSON
+    """
+    for row in rows:
+        yield _ndjson_line(row)
+
+
+async def aiter_ndjson(rows: AsyncIterator[tuple]) -> AsyncIterator[str]:
+    async for row in rows:
+        yield _ndjson_line(row)
+
+
+def iter_csv(rows: Iterator[tuple]) -> Iterator[str]:
+    """
+    Отдает строки в формате CSV с заголовком, по пачке строк за раз
+
+    :param rows: Строки из 'get_export_rows'
+    :return: Генератор фрагментов CSV
+    """
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow(EXPORT_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+async def aiter_csv(rows: AsyncIterator[tuple]) -> AsyncIterator[str]:
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow(EXPORT_HEADER)
+    async for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_xlsx(rows: Iterator[tuple]) -> Iterator[bytes]:
+    """
+    Собирает xlsx книгу в режиме write-only во временном файле и отдает его по частям
+
+    Строки не держатся в памяти: openpyxl пишет их во временный файл листа,
+    поэтому память постоянна, но первый байт уходит только после сборки книги.
+
+    :param rows: Строки из 'get_export_rows'
+    :return: Генератор фрагментов xlsx файла
+    """
+    workbook, sheet = _xlsx_workbook()
+    for row in rows:
+        sheet.append(row)
+
+    with tempfile.TemporaryFile() as file:
+        workbook.save(file)
+        file.seek(0)
+        while chunk := file.read(FILE_CHUNK_SIZE):
+            yield chunk
+
+
+async def aiter_xlsx(rows: AsyncIterator[tuple]) -> AsyncIterator[bytes]:
+    workbook, sheet = _xlsx_workbook()
+    async for row in rows:
+        sheet.append(row)
+
+    with tempfile.TemporaryFile() as file:
+        # Сборка zip-архива книги - долгая синхронная операция, ее место в пуле потоков
+        await sync_to_async(workbook.save, thread_sensitive=False)(file)
+        file.seek(0)
+        while chunk := file.read(FILE_CHUNK_SIZE):
+            yield chunk
+
+
+def iter_parquet(rows: Iterator[tuple]) -> Iterator[bytes]:
+    """
+    Собирает Parquet файл группами строк во временном файле и отдает его по частям
+
+    В памяти держится только текущая группа из 'PARQUET_ROW_GROUP_SIZE' строк,
+    каждая колонка группы сжимается целиком. Как и xlsx, файл отдается после
+    сборки: метаданные Parquet пишутся в его конец.
+
+    :param rows: Строки из 'get_export_rows'
+    :return: Генератор фрагментов Parquet файла
+    """
+    with tempfile.TemporaryFile() as file:
+        with pyarrow.parquet.ParquetWriter(file, PARQUET_SCHEMA) as writer:
+            group = []
+            for row in rows:
+                group.append(row)
+                if len(group) == PARQUET_ROW_GROUP_SIZE:
+                    writer.write_table(_parquet_table(group))
+                    group = []
+            if group:
+                writer.write_table(_parquet_table(group))
+        file.seek(0)
+        while chunk := file.read(FILE_CHUNK_SIZE):
+            yield chunk
+
+
+async def aiter_parquet(rows: AsyncIterator[tuple]) -> AsyncIterator[bytes]:
+    with tempfile.TemporaryFile() as file:
+        with pyarrow.parquet.ParquetWriter(file, PARQUET_SCHEMA) as writer:
+            write_group = sync_to_async(
+                lambda group: writer.write_table(_parquet_table(group)), thread_sensitive=False
+            )
+            group = []
+            async for row in rows:
+                group.append(row)
+                if len(group) == PARQUET_ROW_GROUP_SIZE:
+                    # Сжатие колонок группы - синхронная работа, ее место в пуле потоков
+                    await write_group(group)
+                    group = []
+            if group:
+                await write_group(group)
+        file.seek(0)
+        while chunk := file.read(FILE_CHUNK_SIZE):
+            yield chunk
+
+
+class ExportFormat(NamedTuple):
+    stream: Callable[[Iterator[tuple]], Iterator]
+    astream: Callable[[AsyncIterator[tuple]], AsyncIterator]
+    content_type: str
+    extension: str
+
+
+EXPORT_FORMATS = {
+    'ndjson': ExportFormat(iter_ndjson, aiter_ndjson, 'application/x-ndjson', 'ndjson'),
+    'csv': ExportFormat(iter_csv, aiter_csv, 'text/csv', 'csv'),
+    'xlsx': ExportFormat(
+        iter_xlsx, aiter_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'
+    ),
+}
+if pyarrow is not None:
+    PARQUET_SCHEMA = pyarrow.schema(zip(EXPORT_HEADER, (
+        pyarrow.string(), pyarrow.int64(), pyarrow.int64(), pyarrow.string(), pyarrow.int64(), pyarrow.int64()
+    )))
+    EXPORT_FORMATS['parquet'] = ExportFormat(iter_parquet, aiter_parquet, 'application/vnd.apache.parquet', 'parquet')
+
+
+def _export_queryset(category: Category | None):
+    queryset = Material.objects.subtree_materials(category) if category else Material.objects.all()
+    return queryset.order_by('id').values_list(*EXPORT_FIELDS)
+
+
+def _ndjson_line(row: tuple) -> str:
+    return json.dumps(dict(zip(EXPORT_HEADER, row)), ensure_ascii=False) + '\n'
+
+
+def _xlsx_workbook():
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('materials')
+    sheet.append(EXPORT_HEADER)
+    return workbook, sheet
+
+
+def _parquet_table(rows: list[tuple]):
+    columns = zip(*rows)
+    return pyarrow.Table.from_arrays(
+        [pyarrow.array(column, type=field.type) for column, field in zip(columns, PARQUET_SCHEMA)],
+        schema=PARQUET_SCHEMA,
+    )
+
+
+class _LineBuffer:
+    # csv.writer пишет строку в файл; здесь строка просто возвращается наружу
+    @staticmethod
+    def write(value: str) -> str:
+        return value
@@ -0,0 +1,248 @@
+import contextvars
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from materials.api.v1.services import columnar, copy_loader, sheets, specific_queries, xlsx
+from materials.models import ImportJob
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Возвращает пул потоков процесса, в котором выполняются импорты
+
+    :return: ThreadPoolExecutor на 'IMPORT_JOBS_WORKERS' потоков
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMPORT_JOBS_WORKERS,
+            thread_name_prefix='import-job'
+        )
+    return _executor
+
+
+def enqueue_import(job: ImportJob) -> None:
+    """
+    Ставит импорт в очередь после фиксации транзакции, в которой создана задача
+
+    При 'IMPORT_JOBS_EAGER' импорт выполняется сразу в текущем потоке, но,
+    как и в потоке пула, вне контекста HTTP запроса: его SQL запросы не
+    входят в замеры и бюджет запроса, который только создал задачу.
+
+    :param job: Сохраненная задача импорта
+    """
+    if settings.IMPORT_JOBS_EAGER:
+        contextvars.Context().run(run_import_job, job.id)
+        return
+    transaction.on_commit(lambda: get_executor().submit(_run_in_worker, job.id))
+
+
+def run_import_job(job_id: int, resume: bool = False) -> bool:
+    """
+    Выполняет или продолжает импорт с последней зафиксированной пачки
+
+    Прогресс задачи сохраняется в той же транзакции, что и пачка материалов,
+    поэтому после сбоя импорт продолжается ровно с первой незаписанной строки.
+    Задачу забирает один исполнитель условным UPDATE: новую - только из
+    очереди, выполняющуюся - только при 'resume' и если ее прогресс
+    ('heartbeat_at') не обновлялся дольше 'IMPORT_JOB_STALE_SECONDS'.
+
+    :param job_id: Идентификатор задачи
+    :param resume: Продолжить задачу, оборванную остановкой процесса
+    :return: False, если задачу забрал другой исполнитель или она уже завершена
+    """
+    now = timezone.now()
+    claimable = Q(status=ImportJob.Status.PENDING)
+    if resume:
+        claimable |= Q(status=ImportJob.Status.RUNNING) & (
+            Q(heartbeat_at__isnull=True)
+            | Q(heartbeat_at__lt=now - timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS))
+        )
+    claimed = ImportJob.objects.filter(claimable, id=job_id).update(status=ImportJob.Status.RUNNING, heartbeat_at=now)
+    if not claimed:
+        return False
+
+    job = ImportJob.objects.get(id=job_id)
+    if job.started_at is None:
+        job.started_at = timezone.now()
+        job.save(update_fields=['started_at'])
+
+    def save_progress(report: dict, rows_read: int) -> None:
+        ImportJob.objects.filter(id=job.id).update(
+            rows_committed=job.rows_committed + rows_read,
+            heartbeat_at=timezone.now(),
+            **_report_fields(report),
+        )
+
+    try:
+        # COPY и долгие пачки не сохраняют прогресс минутами, задача не должна выглядеть оборванной
+        with _heartbeat(job.id):
+            if len(job.sheets) > 1:
+                _import_sheets(job)
+            else:
+                with job.file.open('rb') as file:
+                    file_format = columnar.get_file_format(job.file.name)
+                    if job.engine == ImportJob.Engine.COPY:
+                        # COPY грузит файл одной транзакцией, после сбоя файл читается заново целиком
+                        batches = columnar.iter_batches(
+                            file, file_format, copy_loader.COPY_BATCH_SIZE, sheet_page=job.sheets[0]
+                        )
+                        save_progress(copy_loader.copy_batches(batches, mode=job.mode), rows_read=0)
+                    else:
+                        batches = columnar.iter_batches(
+                            file, file_format, specific_queries.IMPORT_BATCH_SIZE,
+                            skip_rows=job.rows_committed, sheet_page=job.sheets[0],
+                        )
+                        specific_queries.write_batches(
+                            batches, report=_job_report(job), on_chunk=save_progress, mode=job.mode
+                        )
+    except Exception as exc:
+        logger.exception('Import job %s failed', job.id)
+        ImportJob.objects.filter(id=job.id).update(
+            status=ImportJob.Status.FAILED,
+            detail=str(exc),
+            finished_at=timezone.now()
+        )
+    else:
+        ImportJob.objects.filter(id=job.id).update(status=ImportJob.Status.DONE, finished_at=timezone.now())
+    # Завершенная задача, в том числе с ошибкой, не возобновляется, файл ей больше не нужен
+    job.file.delete(save=False)
+    return True
+
+
+def resume_interrupted_jobs() -> list[int]:
+    """
+    Досчитывает задачи, оборванные остановкой процесса, в текущем потоке
+
+    Задачи, которые еще выполняет другой процесс, пропускаются, см. 'run_import_job'.
+
+    :return: Идентификаторы возобновленных задач
+    """
+    job_ids = list(
+        ImportJob.objects
+        .filter(status__in=(ImportJob.Status.PENDING, ImportJob.Status.RUNNING))
+        .order_by('created_at')
+        .values_list('id', flat=True)
+    )
+    return [job_id for job_id in job_ids if run_import_job(job_id, resume=True)]
+
+
+def start_resume_loop() -> threading.Thread:
+    """
+    Запускает в фоне периодическое продолжение оборванных импортов
+
+    Задачи из очереди пула теряются при перезапуске процесса, а выполнявшиеся
+    можно продолжить только через 'IMPORT_JOB_STALE_SECONDS' без прогресса,
+    поэтому проверка повторяется с тем же интервалом. Задачу забирает один
+    процесс условным UPDATE, так что цикл запускается в каждом воркере.
+
+    :return: Поток-демон цикла
+    """
+    thread = threading.Thread(target=_resume_loop, name='import-job-resume', daemon=True)
+    thread.start()
+    return thread
+
+
+def _import_sheets(job: ImportJob) -> None:
+    """
+    Импортирует несколько листов по порядку индексов, см. 'sheets.import_sheets'
+
+    Отчеты листов хранятся в задаче, поэтому после сбоя продолжаются
+    только незаконченные листы, каждый со своей последней записанной пачки.
+    """
+    # Процессы пула открывают файл сами, поэтому нужен путь на локальном диске
+    path = job.file.path
+    sheet_reports = job.sheet_reports
+    if not sheet_reports:
+        names = xlsx.get_sheet_names(path)
+        sheet_reports = [sheets.new_sheet_report(page, names[page]) for page in job.sheets]
+
+    def save_progress(report: dict, sheet_reports: list[dict]) -> None:
+        ImportJob.objects.filter(id=job.id).update(
+            sheet_reports=sheet_reports, heartbeat_at=timezone.now(), **_report_fields(report)
+        )
+
+    sheets.import_sheets(
+        path, sheet_reports, _job_report(job), save_progress,
+        workers=settings.IMPORT_SHEET_WORKERS,
+        mode=job.mode,
+    )
+
+
+def _job_report(job: ImportJob) -> dict:
+    return {
+        'processed': job.rows_processed,
+        'rejected': job.rows_rejected,
+        'inserted': job.rows_inserted,
+        'updated': job.rows_updated,
+        'unchanged': job.rows_unchanged,
+        'errors': job.errors,
+    }
+
+
+def _report_fields(report: dict) -> dict:
+    return {
+        'rows_processed': report['processed'],
+        'rows_rejected': report['rejected'],
+        'rows_inserted': report['inserted'],
+        'rows_updated': report['updated'],
+        'rows_unchanged': report['unchanged'],
+        'errors': report['errors'],
+    }
+
+
+@contextmanager
+def _heartbeat(job_id: int) -> Iterator[None]:
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(settings.IMPORT_JOB_STALE_SECONDS / 3):
+                ImportJob.objects.filter(id=job_id, status=ImportJob.Status.RUNNING).update(
+                    heartbeat_at=timezone.now()
+                )
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'import-job-{job_id}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _resume_loop() -> None:
+    while True:
+        close_old_connections()
+        try:
+            resume_interrupted_jobs()
+        except Exception:
+            logger.exception('Resuming import jobs failed')
+        finally:
+            connection.close()
+        time.sleep(settings.IMPORT_JOB_STALE_SECONDS)
+
+
+def _run_in_worker(job_id: int) -> None:
+    close_old_connections()
+    try:
+        run_import_job(job_id)
+    finally:
+        connection.close()
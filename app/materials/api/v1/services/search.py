@@ -0,0 +1,71 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connections
+from django.db.models import Case, F, Q, QuerySet, Value, When
+
+from materials.api.v1.services.validation import INT_MAX, INT_MIN, INT_PATTERN
+from materials.models import SEARCH_CONFIG
+
+
+SEARCH_PARAM = 'q'
+# Порядок результатов поиска и поля курсора keyset-пагинации
+KEYSET_FIELDS = ('-rank', '-id')
+# Точное совпадение артикула всегда выше любого совпадения по названию
+ARTICLE_RANK = 10.0
+
+_TERM = re.compile(r'\w+')
+
+
+def search_materials(queryset: QuerySet, text: str) -> QuerySet:
+    """
+    Ищет материалы по названию и артикулу, сортируя по релевантности
+
+    Сначала выполняется полнотекстовый поиск по префиксам слов ('цем мар'
+    найдет 'Цемент марки М500') по GIN индексу хранимого
+    'Material.search_vector', ранг - ts_rank. Если так ничего не нашлось,
+    запрос считается опечаткой и ищется нечетко по триграммам (pg_trgm,
+    GIN gin_trgm_ops) с рангом word_similarity. Триграммы не проверяются
+    на каждом запросе: на широких запросах вроде 'цем' их перепроверка и
+    ранжирование в несколько раз дороже полнотекстового поиска. Если запрос -
+    число, дополнительно находится материал с таким артикулом, а нечеткий
+    поиск не выполняется.
+
+    :param queryset: Материалы, в которых искать
+    :param text: Строка запроса
+    :return: QuerySet с аннотацией 'rank', отсортированный по 'KEYSET_FIELDS'
+    """
+    terms = _TERM.findall(text.lower())
+    if not terms:
+        return queryset.none()
+
+    query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config=SEARCH_CONFIG)
+    condition, rank = Q(search_vector=query), SearchRank(F('search_vector'), query)
+    article = _parse_article(text)
+    if article is None and not _has_matches(queryset, condition):
+        words = ' '.join(terms)
+        condition, rank = Q(name__trigram_word_similar=words), TrigramWordSimilarity(words, 'name')
+
+    if article is not None:
+        condition |= Q(article=article)
+        rank = Case(When(article=article, then=Value(ARTICLE_RANK)), default=Value(0.0)) + rank
+
+    return queryset.annotate(rank=rank).filter(condition).order_by(*KEYSET_FIELDS)
+
+
+def _has_matches(queryset: QuerySet, condition: Q) -> bool:
+    # exists() добавляет LIMIT 1, и планировщик выбирает обход индекса по цене
+    # с фильтром: при промахе это чтение всей таблицы. CTE MATERIALIZED
+    # планируется на весь результат, поэтому проверка идет по GIN индексу
+    sql, params = queryset.filter(condition).order_by().values('pk').query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'WITH matches AS MATERIALIZED ({sql}) SELECT EXISTS (SELECT 1 FROM matches)', params)
+        return cursor.fetchone()[0]
+
+
+def _parse_article(text: str) -> int | None:
+    text = text.strip()
+    if not INT_PATTERN.fullmatch(text):
+        return None
+    article = int(text)
+    return article if INT_MIN <= article <= INT_MAX else None
@@ -0,0 +1,157 @@
+import multiprocessing
+import queue
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import transaction
+
+from materials.api.v1.services import xlsx
+from materials.api.v1.services.specific_queries import (
+    IMPORT_BATCH_SIZE,
+    REPORT_COUNTERS,
+    merge_report,
+    write_batch,
+)
+from materials.models import ImportJob
+
+
+# Пачек в очереди листа: столько лист может быть разобран вперед, пока писатель занят предыдущими
+QUEUE_BATCHES_PER_SHEET = 2
+# Как часто писатель проверяет, не упал ли процесс пула без сообщения 'done'
+POLL_SECONDS = 1.0
+
+
+def new_sheet_report(sheet_page: int, name: str) -> dict:
+    """
+    :return: Отчет листа: счетчики 'create_records', записанные строки и скорость разбора
+    """
+    return {
+        'sheet': sheet_page,
+        'name': name,
+        **dict.fromkeys(REPORT_COUNTERS, 0),
+        'rows_committed': 0,
+        'finished': False,
+        'parse_seconds': None,
+        'rows_per_second': None,
+    }
+
+
+def import_sheets(
+        filename: str,
+        sheets: list[dict],
+        report: dict,
+        on_progress: Callable[[dict, list[dict]], None],
+        workers: int = 1,
+        mode: str = ImportJob.Mode.INSERT,
+        batch_size: int = IMPORT_BATCH_SIZE,
+) -> dict:
+    """
+    Импортирует несколько листов книги по порядку индексов
+
+    Листы записываются строго по возрастанию индекса, пачки листа - по
+    порядку строк, каждая пачка в своей транзакции вместе с прогрессом через
+    'write_batch'. Поэтому результат не зависит от числа процессов: при
+    повторе артикула в разных листах исход тот же, что при импорте листов по
+    одному - в режиме insert отклоняется строка листа с большим индексом, в
+    режиме upsert она перезаписывает материал. 'rows_committed' листа - точная
+    точка возобновления, законченные листы при возобновлении пропускаются.
+
+    При 'workers' = 1 листы читаются в текущем потоке. При большем значении
+    листы читаются и валидируются в пуле процессов ('xlsx.parse_sheet'), каждый
+    в свою ограниченную очередь; писатель забирает пачки только текущего листа,
+    а остальные листы разбираются вперед на 'QUEUE_BATCHES_PER_SHEET' пачек.
+
+    :param filename: Путь к xlsx файлу, процессы пула открывают его сами
+    :param sheets: Отчеты листов из 'new_sheet_report', обновляются на месте
+    :param report: Общий отчет импорта в формате 'create_records', ошибки в нем с именем листа
+    :param on_progress: Вызывается внутри транзакции каждой пачки с общим отчетом и отчетами листов
+    :param workers: Максимум процессов разбора; 1 - без пула процессов
+    :param mode: 'insert' - только добавление, 'upsert' - добавление и обновление по артикулу
+    :param batch_size: Размер пачки
+    :return: Общий отчет импорта
+    """
+    pending = sorted((sheet for sheet in sheets if not sheet['finished']), key=lambda sheet: sheet['sheet'])
+    if not pending:
+        return report
+    skipped = {sheet['sheet']: sheet['rows_committed'] for sheet in pending}
+    category_ids = {}
+
+    def write(sheet: dict, columns: dict, errors: list, rows_read: int) -> None:
+        with transaction.atomic():
+            batch = write_batch(columns, errors, category_ids, mode=mode, sheet=sheet['name'])
+            merge_report(report, batch)
+            for key in REPORT_COUNTERS:
+                sheet[key] += batch[key]
+            sheet['rows_committed'] += rows_read
+            on_progress(report, sheets)
+
+    def finish(sheet: dict, seconds: float) -> None:
+        parsed = sheet['rows_committed'] - skipped[sheet['sheet']]
+        sheet.update(
+            finished=True,
+            parse_seconds=round(seconds, 3),
+            rows_per_second=round(parsed / seconds, 1) if seconds > 0 else None,
+        )
+        with transaction.atomic():
+            on_progress(report, sheets)
+
+    if workers <= 1:
+        for sheet in pending:
+            batches = xlsx.iter_sheet_batches(filename, sheet['sheet'], sheet['rows_committed'], batch_size)
+            parse_seconds = 0.0
+            while True:
+                started = time.perf_counter()
+                try:
+                    batch = next(batches, None)
+                except Exception as exc:
+                    raise RuntimeError(f'Sheet {sheet["name"]}: {type(exc).__name__}: {exc}') from exc
+                parse_seconds += time.perf_counter() - started
+                if batch is None:
+                    break
+                write(sheet, *batch)
+            finish(sheet, parse_seconds)
+        return report
+
+    # spawn, а не fork: импорт идет в потоке пула задач, а fork многопоточного процесса небезопасен
+    context = multiprocessing.get_context('spawn')
+    queues = {sheet['sheet']: context.Queue(maxsize=QUEUE_BATCHES_PER_SHEET) for sheet in pending}
+    stop = context.Event()
+    workers = min(workers, len(pending))
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=xlsx.init_worker, initargs=(queues, stop)) as pool:
+        # Листы отдаются пулу по порядку, поэтому текущий лист писателя всегда уже разбирается
+        futures = {
+            sheet['sheet']: pool.submit(xlsx.parse_sheet, filename, sheet['sheet'], skipped[sheet['sheet']], batch_size)
+            for sheet in pending
+        }
+        done = set()
+        try:
+            for sheet in pending:
+                while (message := _next_message(queues, futures, sheet['sheet']))[0] == 'batch':
+                    write(sheet, *message[1:])
+                done.add(sheet['sheet'])
+                seconds, error = message[1:]
+                if error is not None:
+                    raise RuntimeError(f'Sheet {sheet["name"]}: {error}')
+                finish(sheet, seconds)
+        except BaseException:
+            # Очереди начатых листов дочитываются до 'done', иначе процессы пула
+            # зависнут на put и пул не закроется
+            stop.set()
+            for page, future in futures.items():
+                if page not in done and not future.cancel():
+                    while _next_message(queues, futures, page)[0] == 'batch':
+                        pass
+            raise
+    return report
+
+
+def _next_message(queues: dict, futures: dict, page: int) -> tuple:
+    while True:
+        try:
+            return queues[page].get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            # Процесс, убитый без сообщения 'done' (например, OOM), ломает пул - иначе ждали бы вечно
+            future = futures[page]
+            if future.done() and future.exception() is not None:
+                return 'done', 0.0, str(future.exception())
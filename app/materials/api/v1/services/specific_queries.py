@@ -1,40 +1,218 @@
+from collections.abc import Callable, Iterable
+
 from django.db import transaction
-from django.db.models import Q
-from materials.api.v1.serializers import MaterialFromXLSXSerializer
-from materials.models import Material, Category
-from rest_framework.exceptions import ValidationError
+from materials.api.v1.services.bulk import insert_missing
+from materials.api.v1.services.cache import bump_catalogue_version
+from materials.api.v1.services.totals import apply_material_deltas, collect_deltas
+from materials.api.v1.services.validation import validate_batches
+from materials.models import Material, Category, ImportJob
+
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+REPORT_COUNTERS = ('processed', 'rejected', 'inserted', 'updated', 'unchanged')
 
 
-def create_records(data: list[tuple], batch_size: int | None = None):
+def create_records(
+        data: Iterable[tuple],
+        batch_size: int = IMPORT_BATCH_SIZE,
+        first_row_number: int = 2,
+        report: dict | None = None,
+        on_chunk: Callable[[dict, int], None] | None = None,
+        mode: str = ImportJob.Mode.INSERT,
+) -> dict:
     """
-    Создает записи с xlsx файла
+    Создает записи с xlsx файла пачками фиксированного размера
 
-    :param data: Принимает Список с материалами
-    :param batch_size: Это нужно для bulk_create операции! По умоланию None
-    :return: 'None'
+    Поток строк читается и записывается по 'batch_size' строк, каждая пачка
+    в своей транзакции, поэтому потребление памяти не зависит от размера файла.
+    Пачка валидируется поколоночно, а категории и уже существующие артикулы
+    всей пачки находятся одним запросом 'name__in' и 'article__in'.
+    Невалидные строки, строки с неизвестной категорией и повторы артикула
+    пропускаются и попадают в отчет об ошибках.
+
+    В режиме 'upsert' существующие материалы обновляются по артикулу, причем
+    записываются только строки, значения которых действительно изменились.
+
+    :param data: Поток строк с материалами (name, article, price, category_name)
+    :param batch_size: Размер пачки для валидации и записи
+    :param first_row_number: Номер первой строки данных в файле, нужен для отчета
+    :param report: Отчет, который нужно продолжить (при возобновлении импорта)
+    :param on_chunk: Вызывается внутри транзакции каждой пачки с отчетом и числом прочитанных строк
+    :param mode: 'insert' - только добавление, 'upsert' - добавление и обновление по артикулу
+    :return: Отчет: обработано, отклонено, добавлено, обновлено, без изменений, ошибки
     """
-    pre_materials = []
-    for item in data:
-        serializer = MaterialFromXLSXSerializer(
-            data={
-                'name': item[0],
-                'article': int(item[1]),
-                'price': int(item[2]),
-            }
-        )
-        if serializer.is_valid():
-            category = Category.objects.filter(name=item[3]).first()
-            if category:
-                pre_materials.append(
-                    Material(**serializer.validated_data, category=category)
-                )
-            else:
-                raise ValidationError(f'Category {item[3]}: not found!')
-        else:
-            raise ValidationError(f'Validation failed for {item}: {serializer.errors}')
-    if pre_materials:
+    batches = validate_batches(data, batch_size, first_row_number=first_row_number)
+    return write_batches(batches, report=report, on_chunk=on_chunk, mode=mode)
+
+
+def write_batches(
+        batches: Iterable[tuple],
+        report: dict | None = None,
+        on_chunk: Callable[[dict, int], None] | None = None,
+        mode: str = ImportJob.Mode.INSERT,
+) -> dict:
+    """
+    Записывает уже провалидированные пачки, каждую в своей транзакции
+
+    :param batches: Поток (колонки, ошибки, прочитано строк), например из 'columnar.iter_batches'
+    :param report: Отчет, который нужно продолжить (при возобновлении импорта)
+    :param on_chunk: Вызывается внутри транзакции каждой пачки с отчетом и числом прочитанных строк
+    :param mode: 'insert' - только добавление, 'upsert' - добавление и обновление по артикулу
+    :return: Отчет в формате 'create_records'
+    """
+    report = report or new_report()
+    category_ids = {}
+    rows_read = 0
+    for columns, errors, batch_rows in batches:
+        rows_read += batch_rows
         with transaction.atomic():
-            Material.objects.bulk_create(pre_materials, batch_size=batch_size)
+            merge_report(report, write_batch(columns, errors, category_ids, mode=mode))
+            if on_chunk is not None:
+                on_chunk(report, rows_read)
+    return report
+
+
+def write_batch(
+        columns: dict,
+        errors: list[dict],
+        category_ids: dict[str, int | None],
+        mode: str = ImportJob.Mode.INSERT,
+        sheet: str | None = None,
+) -> dict:
+    """
+    Записывает уже провалидированную пачку строк и возвращает её отчет
+
+    Категории и существующие артикулы всей пачки находятся одним запросом,
+    строки с неизвестной категорией и повторами артикула попадают в ошибки.
+    Новые артикулы вставляются через 'insert_missing', поэтому артикул, занятый
+    параллельным импортом, не роняет пачку, а считается существующим.
+    Транзакцию открывает вызывающий код, чтобы сохранить прогресс в ней же.
+
+    :param columns: Валидные колонки пачки из 'validate_rows'
+    :param errors: Ошибки валидации пачки
+    :param category_ids: Карта 'имя -> id категории', общая для всех пачек импорта
+    :param mode: 'insert' - только добавление, 'upsert' - добавление и обновление по артикулу
+    :param sheet: Имя листа, добавляется в каждую ошибку пачки
+    :return: Отчет пачки в формате 'create_records'
+    """
+    report = new_report()
+    report['processed'] = len(columns['row']) + len({error['row'] for error in errors})
+
+    _resolve_categories(set(columns['category']) - category_ids.keys(), category_ids)
+    rows = {}
+    for number, name, article, price, category_name in zip(
+        columns['row'], columns['name'], columns['article'], columns['price'], columns['category']
+    ):
+        category_id = category_ids[category_name]
+        if category_id is None:
+            errors.append({'row': number, 'field': 'category', 'error': f'Category {category_name}: not found!'})
+        elif article in rows:
+            # при добавлении выигрывает первая строка, при обновлении - последняя
+            superseded = number if mode == ImportJob.Mode.INSERT else rows[article][0]
+            errors.append({'row': superseded, 'field': 'article', 'error': 'Duplicate article in file.'})
+            if mode == ImportJob.Mode.UPSERT:
+                rows[article] = (number, name, price, category_id)
+        else:
+            rows[article] = (number, name, price, category_id)
+
+    # При обновлении строки блокируются: иначе параллельное изменение материала
+    # между чтением и записью исказило бы изменения итогов
+    existing = _existing_materials(rows, lock=mode == ImportJob.Mode.UPSERT)
+    missing = [
+        Material(name=name, article=article, price=price, category_id=category_id)
+        for article, (number, name, price, category_id) in rows.items() if article not in existing
+    ]
+    inserted = insert_missing(missing)
+    # Артикулы, которые параллельная транзакция вставила уже после чтения 'existing'
+    existing.update(_existing_materials(
+        [material.article for material in missing if material.article not in inserted],
+        lock=mode == ImportJob.Mode.UPSERT,
+    ))
+    changed, deltas = [], []
+    for article, (number, name, price, category_id) in rows.items():
+        if article in inserted:
+            deltas.append((category_id, price, 1))
+        elif mode == ImportJob.Mode.INSERT:
+            errors.append({'row': number, 'field': 'article', 'error': 'Material with this article already exists.'})
+        elif existing[article][1:] == (name, price, category_id):
+            report['unchanged'] += 1
+        else:
+            material_id, _, old_price, old_category_id = existing[article]
+            changed.append(Material(id=material_id, name=name, price=price, category_id=category_id))
+            deltas.extend(((old_category_id, -old_price, -1), (category_id, price, 1)))
+
+    if sheet is not None:
+        errors = [{'sheet': sheet, **error} for error in errors]
+    add_errors(report, errors)
+    report['inserted'] += len(inserted)
+    report['updated'] += len(changed)
+    if changed:
+        Material.objects.bulk_update(changed, ['name', 'price', 'category'])
+    if deltas:
+        apply_material_deltas(collect_deltas(deltas))
+        bump_catalogue_version()
+    return report
+
+
+def new_report() -> dict:
+    return {'processed': 0, 'rejected': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'errors': []}
+
+
+def merge_report(report: dict, batch: dict) -> None:
+    """
+    Добавляет отчет пачки к отчету импорта, храня не больше 'MAX_REPORTED_ERRORS' ошибок
+
+    :param report: Отчет импорта или листа
+    :param batch: Отчет пачки из 'write_batch'
+    """
+    for key in REPORT_COUNTERS:
+        report[key] += batch[key]
+    free = MAX_REPORTED_ERRORS - len(report['errors'])
+    report['errors'].extend(batch['errors'][:free])
+
+
+def _existing_materials(articles, lock: bool = False) -> dict[int, tuple[int, str, int, int]]:
+    if not articles:
+        return {}
+    queryset = Material.objects.filter(article__in=articles).order_by('id')
+    if lock:
+        queryset = queryset.select_for_update()
+    return {
+        article: (material_id, name, price, category_id)
+        for article, material_id, name, price, category_id in queryset.values_list(
+            'article', 'id', 'name', 'price', 'category_id'
+        )
+    }
+
+
+def _resolve_categories(names: set[str], category_ids: dict[str, int | None]) -> None:
+    """
+    Дополняет карту 'имя -> id категории' одним запросом на все новые имена
+
+    При одинаковых именах берется категория с меньшим id, ненайденные
+    имена запоминаются как None, чтобы не искать их повторно.
+
+    :param names: Имена категорий, которых еще нет в карте
+    :param category_ids: Карта, общая для всех пачек импорта
+    """
+    if not names:
+        return
+    found = Category.objects.filter(name__in=names).order_by('-id').values_list('name', 'id')
+    category_ids.update(dict.fromkeys(names))
+    category_ids.update(found)
+
+
+def add_errors(report: dict, errors: list[dict]) -> None:
+    """
+    Добавляет ошибки строк в отчет, храня не больше 'MAX_REPORTED_ERRORS' записей
+
+    :param report: Отчет импорта
+    :param errors: Ошибки пачки '{row, field, error}'
+    """
+    report['rejected'] += len({error['row'] for error in errors})
+    free = MAX_REPORTED_ERRORS - len(report['errors'])
+    report['errors'].extend(sorted(errors, key=lambda error: error['row'])[:free])
 
 
 def get_subcategory(subcategory_id: int) -> Category | None:
@@ -44,10 +222,6 @@ def get_subcategory(subcategory_id: int) -> Category | None:
     :param subcategory_id: Идентификатор дочерней категории
     :return: объект Category
     """
-    category  = Category.objects.filter(
-            Q(id=subcategory_id)
-            &
-            ~Q(children__isnull=False)
-        ).first()
+    category = Category.objects.leaves().filter(id=subcategory_id).first()
 
     return category
\ No newline at end of file
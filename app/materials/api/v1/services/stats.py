@@ -0,0 +1,89 @@
+from django.db import connection
+
+from materials.models import Category, Material
+
+
+DEFAULT_BUCKETS = 10
+MAX_BUCKETS = 100
+
+# Материалы поддерева каждой запрошенной категории читаются один раз (CTE с
+# двумя ссылками материализуется), итоги и гистограмма считаются по ним же.
+# Корзины равной ширины между минимальной и максимальной ценой поддерева,
+# максимальная цена попадает в последнюю корзину. Категория без материалов
+# дает одну строку с bucket NULL, несуществующая - ни одной
+STATS_SQL = '''
+WITH subtree AS (
+    SELECT root.id AS root_id, material.price
+    FROM {category} root
+    JOIN {category} category ON category.path LIKE root.path || '%%'
+    LEFT JOIN {material} material ON material.category_id = category.id
+    WHERE root.id = ANY(%(ids)s)
+),
+totals AS (
+    SELECT root_id, COUNT(price) AS count, COALESCE(SUM(price), 0) AS sum,
+           MIN(price) AS min, MAX(price) AS max, AVG(price) AS avg
+    FROM subtree
+    GROUP BY root_id
+)
+SELECT
+    totals.root_id, totals.count, totals.sum, totals.min, totals.max, totals.avg,
+    CASE
+        WHEN subtree.price IS NULL THEN NULL
+        WHEN totals.min = totals.max THEN 1
+        ELSE LEAST(width_bucket(subtree.price::numeric, totals.min, totals.max, %(buckets)s), %(buckets)s)
+    END AS bucket,
+    COUNT(subtree.price)
+FROM totals
+JOIN subtree ON subtree.root_id = totals.root_id
+GROUP BY totals.root_id, totals.count, totals.sum, totals.min, totals.max, totals.avg, bucket
+'''
+
+
+def get_category_stats(category_ids: list[int], buckets: int = DEFAULT_BUCKETS) -> dict[int, dict]:
+    """
+    Считает статистику цен материалов поддеревьев категорий одним SQL запросом
+
+    Для каждой категории: количество, сумма, минимум, максимум и среднее
+    цен материалов всего поддерева и гистограмма цен из 'buckets' корзин
+    равной ширины от минимума до максимума. Поддерево выбирается по пути
+    категории, итоги не собираются по узлам.
+
+    :param category_ids: Идентификаторы категорий
+    :param buckets: Количество корзин гистограммы
+    :return: Словарь 'id категории -> статистика' в формате 'CategoryStatsSerializer'
+        только для существующих категорий; у категорий без материалов
+        нулевые итоги и пустая гистограмма
+    """
+    sql = STATS_SQL.format(
+        category=connection.ops.quote_name(Category._meta.db_table),
+        material=connection.ops.quote_name(Material._meta.db_table),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {'ids': list(category_ids), 'buckets': buckets})
+        rows = cursor.fetchall()
+
+    stats = {}
+    for category_id, count, total, low, high, average, bucket, bucket_count in rows:
+        if category_id not in stats:
+            stats[category_id] = {
+                'id': category_id,
+                'count': count,
+                'sum': total,
+                'min': low,
+                'max': high,
+                'avg': round(float(average), 2) if count else None,
+                'histogram': _empty_histogram(low, high, buckets) if count else [],
+            }
+        if bucket is not None:
+            stats[category_id]['histogram'][bucket - 1]['count'] = bucket_count
+    return stats
+
+
+def _empty_histogram(low: int, high: int, buckets: int) -> list[dict]:
+    if low == high:
+        return [{'lower': low, 'upper': high, 'count': 0}]
+    width = (high - low) / buckets
+    return [
+        {'lower': round(low + width * index, 2), 'upper': round(low + width * (index + 1), 2), 'count': 0}
+        for index in range(buckets)
+    ]
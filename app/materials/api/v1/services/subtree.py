@@ -0,0 +1,168 @@
+from django.db import connection, transaction
+
+from materials.api.v1.services.cache import bump_catalogue_version
+from materials.api.v1.services.totals import apply_material_deltas, move_category_totals
+from materials.models import PATH_SEPARATOR, Category, Material
+
+
+SUBTREE_DELETE_BATCH_SIZE = 5000
+CYCLE_ERROR = 'Category cannot be moved into its own subtree.'
+PARENT_NOT_FOUND_ERROR = 'Parent category not found.'
+EMPTY_PATH_ERROR = 'Category path is not set, the subtree cannot be selected by path prefix.'
+
+# Пачка материалов поддерева удаляется одним запросом, который сразу
+# возвращает суммы удаленного по категориям для пересчета итогов предков
+DELETE_MATERIALS_SQL = '''
+WITH deleted AS (
+    DELETE FROM {material} WHERE id IN (
+        SELECT material.id
+        FROM {material} material
+        JOIN {category} category ON category.id = material.category_id
+        WHERE category.path LIKE %(prefix)s
+        LIMIT %(limit)s
+    )
+    RETURNING category_id, price
+)
+SELECT category_id, SUM(price), COUNT(*) FROM deleted GROUP BY category_id
+'''
+# Поддерево, категория, её предки, новый родитель и его предки блокируются одним
+# запросом от глубоких к корню, в порядке 'totals.LOCK_CHAINS_SQL'; 'locked_prefix' -
+# путь категории, по которому выбрано поддерево
+LOCK_FOR_MOVE_SQL = '''
+WITH target AS (SELECT path FROM {category} WHERE id = %(category)s)
+SELECT category.*, target.path AS locked_prefix
+FROM {category} category, target
+WHERE category.path LIKE target.path || '%%' OR category.id IN (
+    SELECT unnest(string_to_array(rtrim(path, '{separator}'), '{separator}'))::bigint
+    FROM {category}
+    WHERE id IN (%(category)s, %(parent)s)
+)
+ORDER BY category.depth DESC, category.id
+FOR NO KEY UPDATE OF category
+'''.format(category=connection.ops.quote_name(Category._meta.db_table), separator=PATH_SEPARATOR)
+# Самые глубокие категории первыми: все потомки категории пачки либо уже
+# удалены, либо удаляются в той же пачке
+DELETE_CATEGORIES_SQL = '''
+DELETE FROM {category} WHERE id IN (
+    SELECT id FROM {category} WHERE path LIKE %(prefix)s ORDER BY depth DESC LIMIT %(limit)s
+)
+'''
+
+
+def lock_for_move(category_id: int, parent_id: int | None) -> Category:
+    """
+    Блокирует поддерево категории и обе цепочки предков и проверяет, что перенос не создаст цикл
+
+    Блокируются поддерево, старые предки категории, новый родитель и его
+    предки - все строки, которые перенос меняет, - одним SELECT FOR NO KEY
+    UPDATE от глубоких к корню. В том же порядке блокирует цепочки
+    'apply_material_deltas', поэтому запись материала и перенос выполняются
+    по очереди без взаимной блокировки, а встречные переносы (A под B и B
+    под A) - тоже по очереди, и второй видит путь, уже измененный первым.
+    Цикл - это родитель внутри поддерева категории, то есть путь родителя
+    начинается с пути категории. Вызывать внутри транзакции.
+
+    :param category_id: Перемещаемая категория
+    :param parent_id: Новый родитель; None - сделать категорию корнем
+    :return: Заблокированная категория с актуальными путем и итогами
+    :raises Category.DoesNotExist: Если категории нет
+    :raises ValueError: Если родителя нет или он в поддереве категории
+    """
+    while True:
+        locked = {
+            category.id: category
+            for category in Category.objects.raw(LOCK_FOR_MOVE_SQL, {'category': category_id, 'parent': parent_id})
+        }
+        if category_id not in locked:
+            raise Category.DoesNotExist()
+        category = locked[category_id]
+        chain_ids = set(category.ancestor_ids)
+        if parent_id is not None:
+            if parent_id not in locked:
+                raise ValueError(PARENT_NOT_FOUND_ERROR)
+            if locked[parent_id].path.startswith(category.path):
+                raise ValueError(CYCLE_ERROR)
+            chain_ids.update(locked[parent_id].ancestor_ids)
+        # Параллельный перенос мог изменить пути, пока запрос ждал блокировку
+        if category.path == category.locked_prefix and locked.keys() >= chain_ids:
+            return category
+
+
+def move_subtree(category_id: int, parent_id: int | None) -> Category:
+    """
+    Переносит категорию со всем поддеревом под нового родителя
+
+    Пути и глубины поддерева меняются одним UPDATE по префиксу пути, итоги
+    поддерева снимаются со старой цепочки предков и добавляются к новой -
+    число запросов не зависит ни от размера поддерева, ни от числа материалов.
+
+    :param category_id: Перемещаемая категория
+    :param parent_id: Новый родитель; None - сделать категорию корнем
+    :return: Перемещенная категория
+    :raises Category.DoesNotExist: Если категории нет
+    :raises ValueError: Если родителя нет или он в поддереве категории
+    """
+    with transaction.atomic():
+        category = lock_for_move(category_id, parent_id)
+        old_parent_id = category.parent_id
+        category.parent_id = parent_id
+        category.save(update_fields=['parent'])
+        move_category_totals(category, old_parent_id, parent_id)
+    return category
+
+
+def delete_subtree(
+        category: Category,
+        with_materials: bool = False,
+        batch_size: int = SUBTREE_DELETE_BATCH_SIZE,
+) -> dict:
+    """
+    Удаляет категорию со всем поддеревом пачками, без сборщика Django
+
+    Сборщик загрузил бы в память все поддерево и падал бы на первом
+    защищенном материале. Здесь сначала удаляются материалы поддерева,
+    каждая пачка в своей транзакции вместе с уменьшением итогов предков, затем
+    категории снизу вверх, тоже пачками. Память и блокировки ограничены
+    пачкой, итоги и пути согласованы после каждой пачки. Операция в целом
+    не атомарна: после сбоя повторное удаление продолжит с оставшегося.
+
+    :param category: Корень удаляемого поддерева
+    :param with_materials: Удалять материалы поддерева; без этого поддерево с материалами не удаляется
+    :param batch_size: Размер пачки материалов и категорий
+    :return: Количество удаленных категорий и материалов
+    :raises IntegrityError: Если в поддереве остались материалы, а 'with_materials' не задан
+    :raises ValueError: Если путь категории не заполнен: префикс '%' выбрал бы весь каталог
+    """
+    if not category.path.endswith('/'):
+        raise ValueError(EMPTY_PATH_ERROR)
+    params = {'prefix': f'{category.path}%', 'limit': batch_size}
+    report = {'categories': 0, 'materials': 0}
+    while with_materials:
+        with transaction.atomic():
+            deltas = _delete_materials_batch(params)
+            if not deltas:
+                break
+            apply_material_deltas(deltas)
+            bump_catalogue_version()
+        report['materials'] -= sum(count for _, count in deltas.values())
+
+    sql = DELETE_CATEGORIES_SQL.format(category=connection.ops.quote_name(Category._meta.db_table))
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            deleted = cursor.rowcount
+        if not deleted:
+            break
+        report['categories'] += deleted
+    bump_catalogue_version()
+    return report
+
+
+def _delete_materials_batch(params: dict) -> dict[int, tuple[int, int]]:
+    sql = DELETE_MATERIALS_SQL.format(
+        category=connection.ops.quote_name(Category._meta.db_table),
+        material=connection.ops.quote_name(Material._meta.db_table),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {category_id: (-total, -count) for category_id, total, count in cursor.fetchall()}
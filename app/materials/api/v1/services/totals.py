@@ -0,0 +1,183 @@
+from collections import defaultdict
+from collections.abc import Iterable
+
+from django.db import connection
+from django.db.models import Case, F, Sum, Count, Value, When
+
+from materials.api.v1.services.cache import bump_catalogue_version
+from materials.models import PATH_SEPARATOR, Category, Material
+
+
+CATEGORY_TABLE = connection.ops.quote_name(Category._meta.db_table)
+# Предки берутся из путей категорий, заблокированные строки возвращаются уже с актуальными путями
+LOCK_CHAINS_SQL = f'''
+    SELECT id, path FROM {CATEGORY_TABLE}
+    WHERE id IN (
+        SELECT unnest(string_to_array(rtrim(path, '{PATH_SEPARATOR}'), '{PATH_SEPARATOR}'))::bigint
+        FROM {CATEGORY_TABLE}
+        WHERE id = ANY(%s)
+    )
+    ORDER BY depth DESC, id
+    FOR NO KEY UPDATE
+'''
+
+
+def get_ancestor_ids(category_ids: Iterable[int], lock: bool = False) -> dict[int, list[int]]:
+    """
+    Возвращает цепочки предков (включая саму категорию) одним запросом по пути категорий
+
+    С 'lock' все категории цепочек тем же запросом блокируются до конца
+    транзакции от глубоких к корню, в том же порядке, что и в
+    'subtree.lock_for_move'. Пока блокировка держится, перенос поддерева не
+    может изменить их пути. Если перенос завершился, пока запрос ждал
+    блокировку, цепочка по свежему пути может выйти за заблокированные строки -
+    тогда запрос повторяется.
+
+    :param category_ids: Идентификаторы категорий
+    :param lock: Заблокировать категории цепочек (FOR NO KEY UPDATE), вызывать внутри транзакции
+    :return: Словарь 'id категории -> список id её предков'
+    """
+    if not lock:
+        categories = Category.objects.filter(id__in=set(category_ids)).order_by()
+        return {category.id: category.ancestor_ids for category in categories.only('id', 'path')}
+    category_ids = list(set(category_ids))
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(LOCK_CHAINS_SQL, [category_ids])
+            paths = dict(cursor.fetchall())
+        chains = {
+            category_id: Category(path=paths[category_id]).ancestor_ids
+            for category_id in category_ids if category_id in paths
+        }
+        if all(paths.keys() >= set(chain) for chain in chains.values()):
+            return chains
+
+
+def apply_material_deltas(deltas: dict[int, tuple[int, int]]) -> None:
+    """
+    Переносит изменения стоимости и количества материалов на всю цепочку предков
+
+    Цепочки читаются под блокировкой ('get_ancestor_ids' с 'lock'), поэтому
+    параллельный перенос поддерева не уведет итоги на старую цепочку. Все
+    затронутые категории обновляются одним UPDATE с атомарными
+    F()-инкрементами, поэтому параллельные записи не теряют изменения.
+
+    :param deltas: Словарь 'id категории -> (изменение суммы, изменение количества)'
+    """
+    chains = get_ancestor_ids(deltas, lock=True)
+    sums = defaultdict(int)
+    counts = defaultdict(int)
+    for category_id, (sum_delta, count_delta) in deltas.items():
+        for ancestor_id in chains.get(category_id, ()):
+            sums[ancestor_id] += sum_delta
+            counts[ancestor_id] += count_delta
+
+    ids = [category_id for category_id in sums if sums[category_id] or counts[category_id]]
+    if not ids:
+        return
+    Category.objects.filter(id__in=ids).update(
+        total_sum=F('total_sum') + Case(
+            *(When(id=category_id, then=Value(sums[category_id])) for category_id in ids),
+            default=Value(0)
+        ),
+        materials_count=F('materials_count') + Case(
+            *(When(id=category_id, then=Value(counts[category_id])) for category_id in ids),
+            default=Value(0)
+        ),
+    )
+
+
+def collect_deltas(rows: Iterable[tuple[int, int, int]]) -> dict[int, tuple[int, int]]:
+    """
+    Группирует изменения материалов по категориям для 'apply_material_deltas'
+
+    :param rows: Тройки '(id категории, изменение суммы, изменение количества)'
+    :return: Словарь 'id категории -> (изменение суммы, изменение количества)'
+    """
+    deltas = defaultdict(lambda: (0, 0))
+    for category_id, sum_delta, count_delta in rows:
+        total, count = deltas[category_id]
+        deltas[category_id] = (total + sum_delta, count + count_delta)
+    return dict(deltas)
+
+
+def move_category_totals(category: Category, old_parent_id: int | None, new_parent_id: int | None) -> None:
+    """
+    Переносит итоги поддерева со старой цепочки предков на новую
+
+    :param category: Перемещаемая категория (с актуальными итогами)
+    :param old_parent_id: Прежний родитель
+    :param new_parent_id: Новый родитель
+    """
+    if old_parent_id == new_parent_id:
+        return
+    if old_parent_id is not None:
+        apply_material_deltas({old_parent_id: (-category.total_sum, -category.materials_count)})
+    if new_parent_id is not None:
+        apply_material_deltas({new_parent_id: (category.total_sum, category.materials_count)})
+
+
+def compute_subtree_totals() -> dict[int, tuple[int, int]]:
+    """
+    Пересчитывает итоги всех категорий с нуля
+
+    Одна выборка категорий, один сгруппированный запрос по материалам и
+    один post-order обход дерева в памяти.
+
+    :return: Словарь 'id категории -> (сумма поддерева, количество материалов)'
+    """
+    children = defaultdict(list)
+    roots = []
+    totals = {}
+    for category_id, parent_id in Category.objects.order_by().values_list('id', 'parent_id'):
+        totals[category_id] = [0, 0]
+        if parent_id is None:
+            roots.append(category_id)
+        else:
+            children[parent_id].append(category_id)
+
+    own = (
+        Material.objects.order_by()
+        .values('category_id')
+        .annotate(total=Sum('price'), count=Count('id'))
+        .values_list('category_id', 'total', 'count')
+    )
+    for category_id, total, count in own:
+        totals[category_id][0] += total
+        totals[category_id][1] += count
+
+    stack = [(category_id, False) for category_id in roots]
+    while stack:
+        category_id, visited = stack.pop()
+        if visited:
+            for child_id in children[category_id]:
+                totals[category_id][0] += totals[child_id][0]
+                totals[category_id][1] += totals[child_id][1]
+            continue
+        stack.append((category_id, True))
+        stack.extend((child_id, False) for child_id in children[category_id])
+
+    return {category_id: tuple(value) for category_id, value in totals.items()}
+
+
+def rebuild_totals(dry_run: bool = False) -> list[tuple[int, tuple[int, int], tuple[int, int]]]:
+    """
+    Сверяет сохраненные итоги с пересчитанными и исправляет расхождения
+
+    :param dry_run: Только проверить, не записывая изменения
+    :return: Список расхождений '(id, сохраненное, правильное)'
+    """
+    expected = compute_subtree_totals()
+    mismatches = []
+    fixed = []
+    for category in Category.objects.order_by('id').only('id', 'total_sum', 'materials_count'):
+        stored = (category.total_sum, category.materials_count)
+        if stored != expected[category.id]:
+            mismatches.append((category.id, stored, expected[category.id]))
+            category.total_sum, category.materials_count = expected[category.id]
+            fixed.append(category)
+
+    if fixed and not dry_run:
+        Category.objects.bulk_update(fixed, ['total_sum', 'materials_count'], batch_size=1000)
+        bump_catalogue_version()
+    return mismatches
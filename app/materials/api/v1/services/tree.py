@@ -0,0 +1,134 @@
+from collections import defaultdict
+from collections.abc import Iterable
+
+from django.db.models import Count, QuerySet
+
+from materials.models import Category, Material
+
+
+MATERIAL_FIELDS = ('id', 'name', 'category', 'article', 'price')
+
+
+def build_category_tree() -> list[dict]:
+    """
+    Собирает дерево категорий с материалами за постоянное число запросов
+
+    Категории и материалы загружаются двумя плоскими выборками, дерево
+    собирается в памяти по индексу parent -> children, а 'total_sum'
+    берется из сохраненных итогов категории.
+
+    :return: Список корневых категорий в формате 'CategoryTreeSerializer'
+    """
+    categories, materials = _tree_querysets()
+    return _assemble_forest(categories, materials)
+
+
+async def abuild_category_tree() -> list[dict]:
+    """
+    То же, что 'build_category_tree', но через асинхронный ORM
+
+    :return: Список корневых категорий в формате 'CategoryTreeSerializer'
+    """
+    categories, materials = _tree_querysets()
+    return _assemble_forest([row async for row in categories], [row async for row in materials])
+
+
+def build_subtree(category: Category, depth: int | None = None, include_materials: bool = True) -> dict:
+    """
+    Собирает срез поддерева категории на заданную глубину за два запроса
+
+    Категории среза выбираются по пути и глубине одним запросом, вместе с
+    числом прямых детей каждой категории. Категории на нижней границе
+    среза отдаются свернутыми: с пустым 'subcategories', как у листьев, а
+    отличить их от листьев позволяют 'has_children' и 'child_count'; вместе с
+    'total_sum' этого хватает, чтобы клиент раскрыл их отдельным запросом.
+
+    :param category: Корень поддерева
+    :param depth: Сколько уровней под корнем раскрыть; None - все
+    :param include_materials: Добавлять ли собственные материалы категорий среза
+    :return: Корень поддерева в формате 'CategorySubtreeSerializer'
+    """
+    categories, materials = _subtree_querysets(category, depth, include_materials)
+    return _assemble_subtree(category.id, categories, materials or ())
+
+
+async def abuild_subtree(category: Category, depth: int | None = None, include_materials: bool = True) -> dict:
+    """
+    То же, что 'build_subtree', но через асинхронный ORM
+
+    :return: Корень поддерева в формате 'CategorySubtreeSerializer'
+    """
+    categories, materials = _subtree_querysets(category, depth, include_materials)
+    return _assemble_subtree(
+        category.id,
+        [row async for row in categories],
+        [row async for row in materials] if materials is not None else ()
+    )
+
+
+def _tree_querysets() -> tuple[QuerySet, QuerySet]:
+    return (
+        Category.objects.values_list('id', 'name', 'parent_id', 'total_sum'),
+        Material.objects.values_list(*MATERIAL_FIELDS),
+    )
+
+
+def _assemble_forest(categories: Iterable[tuple], materials: Iterable[tuple]) -> list[dict]:
+    nodes = {}
+    children = defaultdict(list)
+    roots = []
+    for category_id, name, parent_id, total_sum in categories:
+        nodes[category_id] = {
+            'id': category_id,
+            'name': name,
+            'subcategories': children[category_id],
+            'materials': [],
+            'total_sum': total_sum,
+        }
+        if parent_id is None:
+            roots.append(nodes[category_id])
+        else:
+            children[parent_id].append(nodes[category_id])
+
+    for row in materials:
+        nodes[row[2]]['materials'].append(dict(zip(MATERIAL_FIELDS, row)))
+
+    return roots
+
+
+def _subtree_querysets(
+        category: Category, depth: int | None, include_materials: bool
+) -> tuple[QuerySet, QuerySet | None]:
+    categories = Category.objects.descendants_of(category, include_self=True)
+    if depth is not None:
+        categories = categories.filter(depth__lte=category.depth + depth)
+
+    materials = None
+    if include_materials:
+        materials = Material.objects.filter(category_id__in=categories.values('id')).values_list(*MATERIAL_FIELDS)
+    rows = categories.annotate(child_count=Count('children')).values_list(
+        'id', 'name', 'parent_id', 'total_sum', 'child_count'
+    )
+    return rows, materials
+
+
+def _assemble_subtree(root_id: int, categories: Iterable[tuple], materials: Iterable[tuple]) -> dict:
+    nodes = {}
+    children = defaultdict(list)
+    for category_id, name, parent_id, total_sum, child_count in categories:
+        nodes[category_id] = {
+            'id': category_id,
+            'name': name,
+            'subcategories': children[category_id],
+            'materials': [],
+            'total_sum': total_sum,
+            'has_children': child_count > 0,
+            'child_count': child_count,
+        }
+        if category_id != root_id:
+            children[parent_id].append(nodes[category_id])
+
+    for row in materials:
+        nodes[row[2]]['materials'].append(dict(zip(MATERIAL_FIELDS, row)))
+
+    return nodes[root_id]
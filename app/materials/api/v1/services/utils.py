@@ -1,9 +1,30 @@
-from materials.models import Material
+from collections.abc import Iterable, Iterator
+from itertools import islice
 
+from materials.models import Category
 
-def calculate_total(category) -> int:
-    materials = Material.objects.filter(category=category).select_related('category')
-    total = sum(material.price for material in materials)
-    for child in category.children.all():
-        total += calculate_total(child)
-    return total
+
+def calculate_total(category: Category) -> int:
+    """
+    Возвращает стоимость всех материалов поддерева категории
+
+    Итог хранится в самой категории и поддерживается при записи материалов,
+    см. 'services.totals'.
+
+    :param category: объект Category
+    :return: Сумма стоимостей
+    """
+    return category.total_sum
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    """
+    Разбивает поток на списки фиксированного размера
+
+    :param iterable: Любой итерируемый объект, в том числе генератор
+    :param size: Размер пачки
+    :return: Генератор пачек
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
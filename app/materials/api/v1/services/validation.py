@@ -0,0 +1,131 @@
+import re
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+from itertools import islice
+
+
+# Совпадает с Material.name.max_length; модуль намеренно не импортирует модели,
+# чтобы его можно было использовать вне Django (например, в дочерних процессах)
+NAME_MAX_LENGTH = 100
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+COLUMNS = ('name', 'article', 'price', 'category')
+# Только ASCII цифры: str.isdigit() пропускает '²' и другие символы, которые int() не разбирает
+INT_PATTERN = re.compile(r'-?\d+', re.ASCII)
+
+
+def validate_rows(rows: list[tuple], first_row_number: int) -> tuple[dict, list[dict]]:
+    """
+    Поколоночно валидирует пачку строк файла
+
+    Вместо сериализатора на каждую строку пачка транспонируется в колонки и
+    передается в 'validate_columns'. Полностью пустые строки пропускаются.
+
+    :param rows: Строки (name, article, price, category_name)
+    :param first_row_number: Номер первой строки пачки в файле
+    :return: Валидные колонки ('row', 'name', 'article', 'price', 'category') и список ошибок
+    """
+    numbers = []
+    padded = []
+    for number, row in enumerate(rows, start=first_row_number):
+        if row is None or all(value is None for value in row):
+            continue
+        numbers.append(number)
+        padded.append(tuple(row[:4]) + (None, ) * (4 - len(row[:4])))
+    return validate_columns(tuple(zip(*padded)) or ((), (), (), ()), numbers)
+
+
+def validate_columns(columns: Sequence[Sequence], numbers: list[int]) -> tuple[dict, list[dict]]:
+    """
+    Валидирует пачку, уже разобранную в колонки
+
+    Каждая колонка приводится к своему типу одним проходом, а числовые
+    колонки собираются в типизированные массивы. Ошибки не прерывают
+    обработку и собираются все.
+
+    :param columns: Колонки (name, article, price, category_name) одинаковой длины без пустых строк
+    :param numbers: Номера строк файла для каждого значения колонок
+    :return: Валидные колонки ('row', 'name', 'article', 'price', 'category') и список ошибок
+    """
+    if not numbers:
+        return {'row': [], 'name': [], 'article': array('q'), 'price': array('q'), 'category': []}, []
+
+    names, articles, prices, categories = columns
+    errors = {}
+    names = _coerce_strings(names, 'name', errors, max_length=NAME_MAX_LENGTH)
+    articles = _coerce_ints(articles, 'article', errors)
+    prices = _coerce_ints(prices, 'price', errors)
+    categories = _coerce_strings(categories, 'category', errors)
+
+    if not errors:
+        return {
+            'row': numbers,
+            'name': names,
+            'article': array('q', articles),
+            'price': array('q', prices),
+            'category': categories,
+        }, []
+    valid = [index for index in range(len(numbers)) if index not in errors]
+    columns = {
+        'row': [numbers[index] for index in valid],
+        'name': [names[index] for index in valid],
+        'article': array('q', (articles[index] for index in valid)),
+        'price': array('q', (prices[index] for index in valid)),
+        'category': [categories[index] for index in valid],
+    }
+    report = [
+        {'row': numbers[index], 'field': field, 'error': message}
+        for index, row_errors in sorted(errors.items())
+        for field, message in row_errors
+    ]
+    return columns, report
+
+
+def validate_batches(rows: Iterable[tuple], batch_size: int, first_row_number: int) -> Iterator[tuple]:
+    """
+    Читает поток строк пачками и валидирует каждую через 'validate_rows'
+
+    :param rows: Поток строк (name, article, price, category_name)
+    :param batch_size: Размер пачки
+    :param first_row_number: Номер первой строки потока в файле
+    :return: Генератор (колонки, ошибки, прочитано строк)
+    """
+    rows = iter(rows)
+    row_number = first_row_number
+    while chunk := list(islice(rows, batch_size)):
+        columns, errors = validate_rows(chunk, first_row_number=row_number)
+        row_number += len(chunk)
+        yield columns, errors, len(chunk)
+
+
+def _coerce_ints(values: tuple, field: str, errors: dict) -> list[int]:
+    result = [0] * len(values)
+    for index, value in enumerate(values):
+        if type(value) is int:
+            number = value
+        elif type(value) is float and value.is_integer():
+            number = int(value)
+        elif isinstance(value, str) and INT_PATTERN.fullmatch(value.strip()):
+            number = int(value)
+        else:
+            errors.setdefault(index, []).append((field, 'A valid integer is required.'))
+            continue
+        if not INT_MIN <= number <= INT_MAX:
+            errors.setdefault(index, []).append((field, 'Value is out of range.'))
+            continue
+        result[index] = number
+    return result
+
+
+def _coerce_strings(values: tuple, field: str, errors: dict, max_length: int | None = None) -> list[str]:
+    result = [''] * len(values)
+    for index, value in enumerate(values):
+        text = '' if value is None else str(value).strip()
+        if not text:
+            errors.setdefault(index, []).append((field, 'This field may not be blank.'))
+        elif max_length is not None and len(text) > max_length:
+            errors.setdefault(index, []).append(
+                (field, f'Ensure this field has no more than {max_length} characters.')
+            )
+        else:
+            result[index] = text
+    return result
@@ -1,19 +1,121 @@
+import time
+from collections.abc import Iterator
+from itertools import islice
+
 from openpyxl import load_workbook
 
-def get_datas_from_xlsx(filename: str, sheet_page: int) -> list[tuple]:
+from materials.api.v1.services.validation import validate_batches
+
+
+ALL_SHEETS = 'all'
+
+# Модуль не импортирует Django: 'parse_sheet' выполняется в дочерних процессах
+# пула, которые запускаются через spawn и не настраивают Django
+_queues = None
+_stop = None
+
+
+def get_datas_from_xlsx(filename: str, sheet_page: int) -> Iterator[tuple]:
     """
-    Из xlsx файла прочитает и возвращает список с материалами 'list[tuple]'
+    Построчно читает материалы из xlsx файла, не загружая книгу целиком
+
+    Книга открывается в режиме read-only, строки отдаются генератором
+    начиная со второй (первая - заголовок). Пустые строки не пропускаются,
+    чтобы номера строк в отчете об ошибках совпадали с файлом.
 
     :param filename: Имя файла
     :param sheet_page: Индекс страницы
-    :return: Список с материалами
+    :return: Генератор строк с материалами
+    """
+    workbook = load_workbook(filename=filename, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[sheet_page]
+        yield from sheet.iter_rows(min_row=2, values_only=True)
+    finally:
+        workbook.close()
+
+
+def get_sheet_names(filename) -> list[str]:
+    """
+    :param filename: Имя файла или открытый файл
+    :return: Имена листов книги в порядке индексов
+    """
+    workbook = load_workbook(filename=filename, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+def parse_sheet_list(value: str, sheet_count: int) -> list[int]:
+    """
+    Разбирает выбор листов для импорта
+
+    :param value: 'all' или индексы листов через запятую, например '0,2,3'
+    :param sheet_count: Количество листов в книге
+    :return: Отсортированные индексы листов без повторов
+    :raises ValueError: Если значение не разбирается или листа с таким индексом нет
+    """
+    if value.strip().lower() == ALL_SHEETS:
+        return list(range(sheet_count))
+    parts = [part.strip() for part in value.split(',') if part.strip()]
+    if not parts or not all(part.isascii() and part.isdigit() for part in parts):
+        raise ValueError(f"Expected '{ALL_SHEETS}' or comma-separated sheet indexes.")
+    pages = sorted({int(part) for part in parts})
+    if pages[-1] >= sheet_count:
+        raise ValueError(f'Sheet {pages[-1]} does not exist, the workbook has {sheet_count} sheets.')
+    return pages
+
+
+def init_worker(queues: dict, stop) -> None:
     """
-    # На этот метод можно добавить валидацию листа, пустых строк, ожидаемые строки и т.д.
-    workbook = load_workbook(filename=filename)
-    sheet = workbook.worksheets[sheet_page]
+    Инициализатор процесса пула: очереди, в которые 'parse_sheet' отдает пачки
 
-    result = []
-    for rows in sheet.iter_rows(min_row=2, values_only=True):
-        result.append(rows)
+    :param queues: Ограниченная multiprocessing.Queue на каждый лист, по индексу листа
+    :param stop: multiprocessing.Event, после которого разбор листов прекращается
+    """
+    global _queues, _stop
+    _queues, _stop = queues, stop
+
+
+def iter_sheet_batches(filename: str, sheet_page: int, skip_rows: int, batch_size: int) -> Iterator[tuple]:
+    """
+    Читает и валидирует лист пачками
 
-    return result
\ No newline at end of file
+    :param filename: Путь к файлу
+    :param sheet_page: Индекс листа
+    :param skip_rows: Сколько строк данных уже записано и пропускается при возобновлении
+    :param batch_size: Размер пачки
+    :return: Генератор (колонки, ошибки, прочитано строк) в формате 'validate_rows'
+    """
+    rows = islice(get_datas_from_xlsx(filename, sheet_page), skip_rows, None)
+    return validate_batches(rows, batch_size, first_row_number=2 + skip_rows)
+
+
+def parse_sheet(filename: str, sheet_page: int, skip_rows: int, batch_size: int) -> None:
+    """
+    Читает и валидирует лист в процессе пула, отдавая пачки в очередь листа
+
+    Разбор xlsx и приведение типов - основная работа импорта, и в отдельных
+    процессах она не ограничена GIL. В очередь листа по порядку кладутся
+    ('batch', колонки, ошибки, прочитано строк), в конце - ('done', секунды
+    разбора, текст ошибки или None). Очередь ограничена, поэтому процесс
+    разбирает лист вперед не больше, чем на несколько пачек, и ждет, пока
+    писатель дойдет до его листа.
+
+    :param filename: Путь к файлу
+    :param sheet_page: Индекс листа
+    :param skip_rows: Сколько строк данных уже записано и пропускается при возобновлении
+    :param batch_size: Размер пачки
+    """
+    started = time.perf_counter()
+    batches = _queues[sheet_page]
+    try:
+        for columns, errors, rows_read in iter_sheet_batches(filename, sheet_page, skip_rows, batch_size):
+            if _stop.is_set():
+                break
+            batches.put(('batch', columns, errors, rows_read))
+    except Exception as exc:
+        batches.put(('done', time.perf_counter() - started, f'{type(exc).__name__}: {exc}'))
+    else:
+        batches.put(('done', time.perf_counter() - started, None))
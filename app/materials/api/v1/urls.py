@@ -5,6 +5,7 @@ from materials.api.v1.views import (
     MaterialViewSet,
     CreateMaterialFromXLSX,
     CategoryViewSet,
+    ImportJobDetail,
 )
 
 
@@ -15,4 +16,5 @@ router.register(r'categories', CategoryViewSet, basename='categories')
 urlpatterns = [
     path('', include(router.urls)),
     path('xlsx/', CreateMaterialFromXLSX.as_view(), name='xlsx'),
+    path('xlsx/jobs/<int:pk>/', ImportJobDetail.as_view(), name='xlsx-job'),
 ]
\ No newline at end of file
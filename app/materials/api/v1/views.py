@@ -1,25 +1,58 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from adrf.viewsets import GenericViewSet as AsyncGenericViewSet
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
 from drf_spectacular.utils import extend_schema_view, extend_schema, extend_schema_field
-from rest_framework import viewsets, status
-from rest_framework.exceptions import NotFound
-from rest_framework.parsers import MultiPartParser, FormParser, FileUploadParser
+from rest_framework import mixins, status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.fields import IntegerField
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser, FileUploadParser
+from rest_framework.generics import RetrieveAPIView
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.views import APIView
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.decorators import action
 
-from materials.models import Category, Material
+from materials import metrics
+from materials.models import Category, ImportJob, Material
+from materials.api.v1.filters import CategorySubtreeFilter, MaterialSearchFilter
+from materials.api.v1.mixins import FastReadMixin
+from materials.api.v1.pagination import MaterialPagination
 from materials.api.v1.serializers import (
     CategorySerializer,
     CategoryListSerializer,
+    CategoryFastSerializer,
+    CategoryListFastSerializer,
     CategoryTreeSerializer,
+    CategorySubtreeSerializer,
+    CategorySubtreeQuerySerializer,
+    CategoryStatsQuerySerializer,
+    CategoryStatsBulkQuerySerializer,
+    CategoryStatsSerializer,
     CategoryWriteSerializer,
+    CategoryMoveSerializer,
+    CategoryDestroyQuerySerializer,
     MaterialFullSerializer,
+    MaterialFastSerializer,
     MaterialCreateSerializer,
     MaterialPutUpdateSerializer,
     MaterialPatchUpdateSerializer,
-    FileUploadSerializer
+    MaterialBulkCreateSerializer,
+    MaterialBulkUpdateSerializer,
+    MaterialBulkResultSerializer,
+    MaterialExportQuerySerializer,
+    FileUploadSerializer,
+    ImportJobSerializer,
+    validate_bulk_items,
 )
-from materials.api.v1.services import xlsx, specific_queries
+from materials.api.v1.services import bulk, cache, export, jobs, specific_queries, stats, subtree, totals, tree
 
 
 @extend_schema_view(
@@ -52,8 +85,22 @@ from materials.api.v1.services import xlsx, specific_queries
         responses={204: None},
     )
 )
-class MaterialViewSet(viewsets.ModelViewSet):
+class MaterialViewSet(
+    FastReadMixin,
+    mixins.CreateModelMixin,
+    mixins.UpdateModelMixin,
+    mixins.DestroyModelMixin,
+    AsyncGenericViewSet,
+):
     queryset = Material.objects.select_related('category')
+    serializer_class = MaterialFullSerializer
+    pagination_class = MaterialPagination
+    filter_backends = (CategorySubtreeFilter, MaterialSearchFilter)
+    fast_serializer_classes = {'list': MaterialFastSerializer}
+    # Страница и COUNT; оценка count=estimate на свежей таблице - еще EXPLAIN,
+    # поиск ?q= - еще проверка, есть ли полнотекстовые совпадения
+    # Пакетные операции: проверки, запись и итоги предков - без запросов на элемент
+    query_budgets = {'list': 3, 'retrieve': 1, 'bulk_create': 7, 'bulk_update': 8, 'bulk_destroy': 6}
 
     def get_serializer_class(self):
         match self.action:
@@ -64,7 +111,21 @@ class MaterialViewSet(viewsets.ModelViewSet):
             case 'partial_update':
                 return MaterialPatchUpdateSerializer
             case _:
-                return MaterialFullSerializer
+                return super().get_serializer_class()
+
+    async def list(self, request, *args, **kwargs):
+        # Поиск может выполнить запрос, чтобы выбрать полнотекстовый или нечеткий режим
+        queryset = await sync_to_async(self.filter_queryset)(self.get_queryset())
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        with metrics.timer('serialize'):
+            data = self.get_serializer(page, many=True).data
+        return self.get_paginated_response(data)
+
+    async def retrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        with metrics.timer('serialize'):
+            data = self.get_serializer(instance).data
+        return Response(data)
 
     def create(self, request, *args, **kwargs):
         subcategory = request.data['subcategory']
@@ -77,17 +138,106 @@ class MaterialViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             pre_material = serializer.validated_data.copy()
             pre_material.pop('subcategory')
-            material = Material.objects.create(
-                **pre_material,
-                category=category
-            )
+            with transaction.atomic():
+                material = Material.objects.create(
+                    **pre_material,
+                    category=category
+                )
+                totals.apply_material_deltas({category.id: (material.price, 1)})
+                cache.bump_catalogue_version()
             return Response(MaterialFullSerializer(material).data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_price = Material.objects.select_for_update().values_list('price', flat=True).get(
+            pk=serializer.instance.pk
+        )
+        material = serializer.save()
+        if material.price != old_price:
+            totals.apply_material_deltas({material.category_id: (material.price - old_price, 0)})
+        cache.bump_catalogue_version()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        totals.apply_material_deltas({instance.category_id: (-instance.price, -1)})
+        cache.bump_catalogue_version()
+
+    @extend_schema(
+        summary='Пакетное создание Материалов',
+        description='Создает до MATERIALS_BULK_MAX_ITEMS материалов одной транзакцией. '
+                    'Элементы с ошибками пропускаются, результат и ошибки возвращаются для каждого элемента.',
+        request=MaterialBulkCreateSerializer(many=True),
+        responses={200: MaterialBulkResultSerializer},
+    )
+    @action(detail=False, methods=['post'], url_path='bulk', url_name='bulk', parser_classes=[JSONParser])
+    def bulk_create(self, request):
+        items, errors = validate_bulk_items(
+            request.data, MaterialBulkCreateSerializer(), max_items=settings.MATERIALS_BULK_MAX_ITEMS
+        )
+        return bulk_response(bulk.create_materials(items, errors))
+
+    @extend_schema(
+        summary='Пакетное частичное обновление Материалов',
+        description='Обновляет переданные поля материалов по id одной транзакцией, '
+                    'subcategory переносит материал в другую листовую категорию.',
+        request=MaterialBulkUpdateSerializer(many=True),
+        responses={200: MaterialBulkResultSerializer},
+    )
+    @bulk_create.mapping.patch
+    def bulk_update(self, request):
+        items, errors = validate_bulk_items(
+            request.data, MaterialBulkUpdateSerializer(), max_items=settings.MATERIALS_BULK_MAX_ITEMS
+        )
+        return bulk_response(bulk.update_materials(items, errors))
+
+    @extend_schema(
+        summary='Пакетное удаление Материалов',
+        description='Удаляет материалы по массиву id одной транзакцией.',
+        request={'application/json': {'type': 'array', 'items': {'type': 'integer'}}},
+        responses={200: MaterialBulkResultSerializer},
+    )
+    @bulk_create.mapping.delete
+    def bulk_destroy(self, request):
+        ids, errors = validate_bulk_items(
+            request.data, IntegerField(), max_items=settings.MATERIALS_BULK_MAX_ITEMS
+        )
+        return bulk_response(bulk.delete_materials(ids, errors))
+
+    @extend_schema(
+        summary='Выгрузка всех Материалов',
+        description='Потоково выгружает каталог или поддерево категории в NDJSON, CSV, XLSX или Parquet '
+                    '(если установлен pyarrow). '
+                    'Колонки name, article, price, category_name совпадают с форматом импорта.',
+        parameters=[MaterialExportQuerySerializer],
+        responses={(200, 'application/octet-stream'): bytes},
+    )
+    @action(detail=False, methods=['get'], url_path='export', url_name='export', pagination_class=None)
+    def export(self, request):
+        query = MaterialExportQuerySerializer(data=request.query_params.dict())
+        query.is_valid(raise_exception=True)
+        category = None
+        if category_id := query.validated_data.get('category'):
+            category = get_object_or_404(Category, pk=category_id)
+
+        export_format = export.EXPORT_FORMATS[query.validated_data['fmt']]
+        if isinstance(request._request, ASGIRequest):
+            # Под ASGI синхронный итератор был бы прочитан целиком до отправки
+            content = export_format.astream(export.aget_export_rows(category))
+        else:
+            content = export_format.stream(export.get_export_rows(category))
+        response = StreamingHttpResponse(content, content_type=export_format.content_type)
+        response['Content-Disposition'] = f'attachment; filename="materials.{export_format.extension}"'
+        return response
+
 
 class CreateMaterialFromXLSX(APIView):
     parser_classes = (MultiPartParser, FormParser, FileUploadParser)
+    # Только создание задачи: импорт идет в пуле потоков (или при IMPORT_JOBS_EAGER
+    # сразу, но вне замера запроса), его запросы ограничены тестами пачки импорта
+    query_budgets = {'post': 1}
 
     @extend_schema(
         request={
@@ -97,29 +247,67 @@ class CreateMaterialFromXLSX(APIView):
                     'file': {
                         'type': 'string',
                         'format': 'binary'
+                    },
+                    'mode': {
+                        'type': 'string',
+                        'enum': list(ImportJob.Mode.values),
+                        'default': ImportJob.Mode.INSERT
+                    },
+                    'engine': {
+                        'type': 'string',
+                        'enum': list(ImportJob.Engine.values),
+                        'default': ImportJob.Engine.ORM
+                    },
+                    'sheets': {
+                        'type': 'string',
+                        'default': '0',
+                        'description': "'all' или индексы листов через запятую, несколько листов "
+                                       "разбираются параллельно (только engine=orm)"
                     }
                 }
             }
         },
         responses={
-            201: {'msg': 'Datas uploaded and writed to DB successfully'}
+            202: {'msg': 'Import job accepted', 'job_id': 1, 'status': 'pending', 'url': '/api/v1/xlsx/jobs/1/'}
         },
-        summary='С xlsx файла читает и записывает в БД',
-        description='ВАЖНО! Файл должен быть структурирован правильно! name, article, price, category_name'
+        summary='Ставит импорт xlsx, csv, parquet или arrow файла в очередь',
+        description='ВАЖНО! Файл должен быть структурирован правильно! name, article, price, category_name. '
+                    'В xlsx колонки берутся по порядку, в csv (UTF-8 с заголовком), parquet и arrow - по имени. '
+                    'Импорт выполняется в фоне, прогресс доступен по ссылке из ответа.'
     )
     def post(self, request, *args, **kwargs):
         serializer = FileUploadSerializer(data=request.data)
         if serializer.is_valid():
-            file = serializer.validated_data['file']
-            xlsx_data = xlsx.get_datas_from_xlsx(file, sheet_page=0)
-            specific_queries.create_records(xlsx_data)
+            job = ImportJob.objects.create(
+                file=serializer.validated_data['file'],
+                mode=serializer.validated_data['mode'],
+                engine=serializer.validated_data['engine'],
+                sheets=serializer.validated_data['sheets']
+            )
+            jobs.enqueue_import(job)
             return Response(
-                {'msg': 'Datas uploaded and writed to DB successfully'},
-                status=status.HTTP_201_CREATED
+                {
+                    'msg': 'Import job accepted',
+                    'job_id': job.id,
+                    'status': job.status,
+                    'url': reverse('xlsx-job', kwargs={'pk': job.id}, request=request),
+                },
+                status=status.HTTP_202_ACCEPTED
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@extend_schema(
+    summary='Статус импорта xlsx',
+    description='Статус, скорость, количество ошибок и итоги фонового импорта.',
+    responses={200: ImportJobSerializer},
+)
+class ImportJobDetail(RetrieveAPIView):
+    queryset = ImportJob.objects.all()
+    serializer_class = ImportJobSerializer
+    query_budgets = {'get': 1}
+
+
 @extend_schema_view(
     list=extend_schema(
         summary='Список Категории',
@@ -152,14 +340,101 @@ class CreateMaterialFromXLSX(APIView):
         responses={204: None},
     )
 )
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(
+    FastReadMixin,
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.UpdateModelMixin,
+    mixins.DestroyModelMixin,
+    AsyncGenericViewSet,
+):
     queryset = Category.objects.all()
+    serializer_class = CategorySerializer
     pagination_class = LimitOffsetPagination
+    # Только ASCII цифры: иначе '²' доходит до int() и ORM
+    lookup_value_regex = '[0-9]+'
+    fast_serializer_classes = {'list': CategoryFastSerializer, 'list_categories': CategoryListFastSerializer}
+    # Дерево и поддерево строятся фиксированным числом запросов независимо от размера каталога,
+    # статистика любого числа категорий - одним
+    query_budgets = {
+        'list': 2, 'retrieve': 1, 'list_categories': 1, 'tree': 2, 'subtree': 3,
+        'category_stats': 1, 'category_stats_bulk': 1, 'move': 12,
+    }
 
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return CategoryWriteSerializer
-        return CategorySerializer
+        if self.action == 'list_categories':
+            return self.get_fast_serializer_class() or CategoryListSerializer
+        return super().get_serializer_class()
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        parent = serializer.validated_data.get('parent', serializer.instance.parent)
+        try:
+            # Свежая копия под блокировкой, чтобы save() не затер итоги устаревшими значениями
+            serializer.instance = subtree.lock_for_move(serializer.instance.pk, parent.pk if parent else None)
+        except ValueError as exc:
+            raise ValidationError({'parent': [str(exc)]})
+        old_parent_id = serializer.instance.parent_id
+        category = serializer.save()
+        totals.move_category_totals(category, old_parent_id, category.parent_id)
+
+    @extend_schema(
+        summary='Удаление категории с поддеревом',
+        description='Удаляет категорию со всеми подкатегориями пачками, без загрузки поддерева в память. '
+                    'Если в поддереве есть материалы, возвращает 409, пока не передан with_materials=true: '
+                    'тогда материалы удаляются пачками вместе с пересчетом итогов предков.',
+        parameters=[CategoryDestroyQuerySerializer],
+        responses={204: None, 409: {'detail': 'Category subtree contains materials', 'materials_count': 3}},
+    )
+    def destroy(self, request, *args, **kwargs):
+        query = CategoryDestroyQuerySerializer(data=request.query_params.dict())
+        query.is_valid(raise_exception=True)
+        with_materials = query.validated_data['with_materials']
+        category = self.get_object()
+        # Сохраненный итог поддерева проверяет материалы без запроса по ним
+        if category.materials_count and not with_materials:
+            return self._subtree_conflict(category.materials_count)
+        try:
+            subtree.delete_subtree(category, with_materials=with_materials)
+        except IntegrityError:
+            # Материал добавлен в поддерево уже после проверки
+            return self._subtree_conflict(Material.objects.subtree_materials(category).count())
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @staticmethod
+    def _subtree_conflict(materials_count: int) -> Response:
+        return Response(
+            {'detail': 'Category subtree contains materials', 'materials_count': materials_count},
+            status=status.HTTP_409_CONFLICT
+        )
+
+    @extend_schema(
+        summary='Перенос категории с поддеревом',
+        description='Переносит категорию со всеми подкатегориями и материалами под нового родителя '
+                    'или в корень. Перенос в собственное поддерево отклоняется. Пути поддерева и итоги '
+                    'обеих цепочек предков обновляются несколькими запросами независимо от размера поддерева.',
+        request=CategoryMoveSerializer,
+        responses={200: CategorySerializer},
+    )
+    @action(
+        detail=True, methods=['post'], url_path='move', url_name='move', parser_classes=[JSONParser, MultiPartParser]
+    )
+    def move(self, request, pk=None):
+        serializer = CategoryMoveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        category = self.get_object()
+        try:
+            category = subtree.move_subtree(category.id, serializer.validated_data['parent'])
+        except Category.DoesNotExist:
+            raise NotFound()
+        except ValueError as exc:
+            raise ValidationError({'parent': [str(exc)]})
+        return Response(CategorySerializer(category).data)
 
     @extend_schema(
         summary='Вывод категорий плоским списком',
@@ -167,15 +442,107 @@ class CategoryViewSet(viewsets.ModelViewSet):
         responses={200: CategoryListSerializer(many=True)},
     )
     @action(detail=False, methods=['get'], url_path='flat', url_name='flat')
-    def list_categories(self, request):
-        category = Category.objects.all()
-        serializer = CategoryListSerializer(category, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    async def list_categories(self, request):
+        async def build():
+            rows = [row async for row in self.get_queryset()]
+            with metrics.timer('serialize'):
+                return self.get_serializer(rows, many=True).data
+
+        return await cached_response(request, 'flat', build)
 
     @extend_schema_field(CategoryTreeSerializer(many=True))
     @action(detail=False, methods=['get'], url_path='tree', url_name='tree')
-    def tree(self, request):
-        categories = Category.objects.filter(parent__isnull=True)
-        serializer = CategoryTreeSerializer(categories, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    async def tree(self, request):
+        return await cached_response(request, 'tree', tree.abuild_category_tree)
+
+    @extend_schema(
+        operation_id='api_v1_categories_subtree_retrieve',
+        summary='Поддерево категории',
+        description='Возвращает поддерево категории на глубину depth (по умолчанию - целиком). '
+                    'Категории на границе среза свернуты: has_children и child_count показывают, '
+                    'есть ли что раскрывать следующим запросом.',
+        parameters=[CategorySubtreeQuerySerializer],
+        responses={200: CategorySubtreeSerializer},
+    )
+    @action(detail=True, methods=['get'], url_path='tree', url_name='subtree')
+    async def subtree(self, request, pk=None):
+        query = CategorySubtreeQuerySerializer(data=request.query_params.dict())
+        query.is_valid(raise_exception=True)
+        depth, include_materials = query.validated_data['depth'], query.validated_data['include_materials']
+
+        async def build():
+            return await tree.abuild_subtree(await self.aget_object(), depth=depth, include_materials=include_materials)
+
+        return await cached_response(request, f'tree:{pk}:{depth}:{include_materials:d}', build)
+
+    @extend_schema(
+        summary='Статистика цен поддерева категории',
+        description='Количество, сумма, минимум, максимум, среднее и гистограмма цен материалов '
+                    'всего поддерева категории. Считается одним SQL запросом, без данных материалов.',
+        parameters=[CategoryStatsQuerySerializer],
+        responses={200: CategoryStatsSerializer},
+    )
+    @action(detail=True, methods=['get'], url_path='stats', url_name='stats')
+    async def category_stats(self, request, pk=None):
+        query = CategoryStatsQuerySerializer(data=request.query_params.dict())
+        query.is_valid(raise_exception=True)
+        buckets = query.validated_data['buckets']
+        category_id = int(pk)
+
+        async def build():
+            result = await sync_to_async(stats.get_category_stats)([category_id], buckets)
+            if category_id not in result:
+                raise NotFound()
+            return result[category_id]
+
+        return await cached_response(request, f'stats:{category_id}:{buckets}', build)
+
+    @extend_schema(
+        summary='Статистика цен нескольких категорий',
+        description='То же, что статистика категории, для списка категорий одним SQL запросом. '
+                    'Несуществующие категории пропускаются, порядок совпадает с ids.',
+        parameters=[CategoryStatsBulkQuerySerializer],
+        responses={200: CategoryStatsSerializer(many=True)},
+    )
+    @action(detail=False, methods=['get'], url_path='stats', url_name='stats-bulk')
+    async def category_stats_bulk(self, request):
+        query = CategoryStatsBulkQuerySerializer(data=request.query_params.dict())
+        query.is_valid(raise_exception=True)
+        ids, buckets = query.validated_data['ids'], query.validated_data['buckets']
+
+        async def build():
+            result = await sync_to_async(stats.get_category_stats)(ids, buckets)
+            return [result[category_id] for category_id in ids if category_id in result]
+
+        key = hashlib.md5(','.join(map(str, ids)).encode()).hexdigest()
+        return await cached_response(request, f'stats:{key}:{buckets}', build)
+
+
+def bulk_response(results: list[dict]) -> Response:
+    """
+    Ответ пакетной операции: итоги и результат каждого элемента
+
+    :param results: Результаты элементов в порядке запроса
+    :return: Response со счетчиками успешных и ошибочных элементов
+    """
+    failed = sum(result['status'] == 'error' for result in results)
+    return Response({'succeeded': len(results) - failed, 'failed': failed, 'results': results})
+
+
+async def cached_response(request, name: str, build) -> Response:
+    """
+    Отдает ответ каталога из кэша текущей версии с ETag
+
+    304 возвращается только после того, как ответ найден в кэше или собран:
+    ответ с 404 не кэшируется, поэтому ETag удаленного или несуществующего
+    ресурса не дает 304. Если ответ уже в кэше, к БД запросов нет.
 
+    :param request: Запрос
+    :param name: Имя ответа в кэше, см. 'cache.aget_or_build'
+    :param build: Корутинная функция, собирающая данные ответа
+    :return: Response с заголовком ETag
+    """
+    data, etag = await cache.aget_or_build(name, build)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return Response(data, status=status.HTTP_200_OK, headers={'ETag': etag})
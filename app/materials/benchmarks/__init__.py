@@ -0,0 +1,21 @@
+from materials.benchmarks.endpoints import bench_endpoints
+from materials.benchmarks.imports import (
+    bench_file_formats, bench_import_engines, bench_sheet_import, bench_xlsx_import
+)
+from materials.benchmarks.renderers import bench_renderers
+from materials.benchmarks.search import bench_search
+from materials.benchmarks.serializers import bench_serializers
+from materials.benchmarks.subtree import bench_subtree
+
+
+BENCHMARKS = {
+    'import_engines': bench_import_engines,
+    'import_xlsx': bench_xlsx_import,
+    'import_sheets': bench_sheet_import,
+    'import_formats': bench_file_formats,
+    'endpoints': bench_endpoints,
+    'search': bench_search,
+    'serializers': bench_serializers,
+    'renderers': bench_renderers,
+    'subtree': bench_subtree,
+}
@@ -0,0 +1,100 @@
+import random
+from collections.abc import Iterator
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from materials.api.v1.services import cache, totals
+from materials.models import PATH_SEPARATOR, Category, Material
+
+
+# Словарь названий: поиск по одному слову находит около 1/len(MATERIAL_KINDS) каталога
+MATERIAL_KINDS = (
+    'Цемент', 'Кирпич', 'Доска', 'Брус', 'Арматура', 'Гипсокартон', 'Утеплитель', 'Плитка', 'Шпатлевка',
+    'Грунтовка', 'Краска', 'Саморез', 'Профиль', 'Труба', 'Кабель', 'Ламинат', 'Фанера', 'Песок', 'Щебень',
+    'Раствор', 'Блок', 'Сетка', 'Уголок', 'Швеллер', 'Лист', 'Пленка', 'Мембрана', 'Герметик', 'Клей', 'Эмаль',
+    'Лак', 'Дюбель', 'Анкер', 'Гвоздь', 'Шуруп', 'Брусчатка', 'Бордюр', 'Черепица', 'Сайдинг', 'Вагонка',
+)
+MATERIAL_GRADES = (
+    'М400', 'М500', 'обрезная', 'строганый', 'красный', 'облицовочный', 'влагостойкий', 'фасадная', 'белая',
+    'оцинкованный', 'сухой', 'A500C', 'полнотелый', 'пустотелый', 'огнестойкий', 'морозостойкий', 'серый',
+    'черный', 'медный', 'алюминиевый', 'усиленный', 'монтажный', 'финишная', 'стартовая', 'универсальный',
+)
+MATERIAL_SIZES = ('6 мм', '8 мм', '10 мм', '12 мм', '50x150', '100x100', '1 м', '3 м', '6 м', '25 кг', '50 кг', '10 л')
+
+
+def generate_catalogue(
+    depth: int = 3,
+    fanout: int = 10,
+    materials_per_leaf: int = 100,
+    roots: int | None = None,
+    batch_size: int = 5000,
+    seed: int = 0,
+) -> dict[str, int]:
+    """
+    Создает синтетический каталог заданной формы пачками bulk_create
+
+    Идентификаторы категорий резервируются из последовательности заранее,
+    поэтому путь и глубина заполняются сразу при вставке, без UPDATE по
+    уровням. Названия и цены материалов псевдослучайные, но повторяются при
+    том же 'seed', артикулы продолжают максимальный существующий.
+
+    :param depth: Число уровней категорий, материалы лежат в категориях последнего уровня
+    :param fanout: Количество подкатегорий у каждой категории
+    :param materials_per_leaf: Количество материалов в каждой категории последнего уровня
+    :param roots: Количество корневых категорий, по умолчанию - 'fanout'
+    :param batch_size: Размер пачки вставки
+    :param seed: Зерно генератора цен
+    :return: Количество созданных категорий, листьев и материалов
+    """
+    roots = fanout if roots is None else roots
+    with transaction.atomic():
+        level = [None]
+        categories = 0
+        for level_index in range(depth):
+            width = roots if level_index == 0 else fanout
+            ids = iter(_reserve_category_ids(len(level) * width))
+            next_level = []
+            for parent in level:
+                for position in range(1, width + 1):
+                    category_id = next(ids)
+                    parent_path, parent_name = (parent.path, parent.name) if parent else ('', 'Category')
+                    next_level.append(Category(
+                        id=category_id,
+                        name=f'{parent_name} {position}' if parent else f'Category {position}',
+                        parent=parent,
+                        path=f'{parent_path}{category_id}{PATH_SEPARATOR}',
+                        depth=level_index,
+                    ))
+            Category.objects.bulk_create(next_level, batch_size=batch_size)
+            categories += len(next_level)
+            level = next_level
+
+        materials = _generate_materials(level, materials_per_leaf, random.Random(seed))
+        created = 0
+        while batch := list(islice(materials, batch_size)):
+            Material.objects.bulk_create(batch)
+            created += len(batch)
+
+        totals.rebuild_totals()
+        cache.bump_catalogue_version()
+    return {'categories': categories, 'leaves': len(level), 'materials': created}
+
+
+def _reserve_category_ids(count: int) -> list[int]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+            [Category._meta.db_table, 'id', count]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _generate_materials(leaves: list[Category], per_leaf: int, rng: random.Random) -> Iterator[Material]:
+    article = (Material.objects.aggregate(last=Max('article'))['last'] or 0) + 1
+    for leaf in leaves:
+        for _ in range(per_leaf):
+            name = f'{rng.choice(MATERIAL_KINDS)} {rng.choice(MATERIAL_GRADES)} {rng.choice(MATERIAL_SIZES)}'
+            yield Material(name=name, article=article, price=rng.randint(1, 10_000), category=leaf)
+            article += 1
@@ -0,0 +1,82 @@
+import statistics
+
+from django.db.models import Max
+from django.test import Client
+from django.urls import reverse
+
+from materials.api.v1.services import cache
+from materials.benchmarks.catalogue import generate_catalogue
+from materials.benchmarks.utils import result, rolled_back, timed
+from materials.models import Category, Material
+
+
+REPEATS = 5
+
+
+def bench_endpoints(rows: int) -> list[dict]:
+    """
+    Замеряет ответы API на синтетическом каталоге через полный стек Django
+
+    Каталог: 10 корней, 3 уровня по 10 подкатегорий, 'rows' материалов
+    поровну в 1000 листьях. Запросы идут тестовым клиентом, без сети, но
+    с middleware, сериализацией и рендером. Для каждого запроса берется
+    медиана из 'REPEATS' повторов; 'cold' - после сброса кэша каталога.
+
+    :param rows: Количество материалов в каталоге
+    :return: Результаты замеров
+    """
+    client = Client(SERVER_NAME='localhost')
+    results = []
+    with rolled_back():
+        created = generate_catalogue(depth=3, fanout=10, materials_per_leaf=max(rows // 1000, 1))
+        materials = created['materials']
+        leaf = Category.objects.filter(depth=2).order_by('id').first()
+        root = Category.objects.roots().order_by('id').first()
+        materials_url = reverse('materials-list')
+        next_url = client.get(materials_url, {'cursor': '', 'limit': 100}).json()['next']
+
+        requests = (
+            ('tree', 'cold', reverse('categories-tree'), cache.bump_catalogue_version),
+            ('tree', 'warm', reverse('categories-tree'), None),
+            ('flat', 'cold', reverse('categories-flat'), cache.bump_catalogue_version),
+            ('list', 'offset_first', f'{materials_url}?limit=100', None),
+            ('list', 'offset_middle', f'{materials_url}?limit=100&offset={materials // 2}', None),
+            ('list', 'keyset_first', f'{materials_url}?cursor=&limit=100', None),
+            ('list', 'keyset_next', next_url, None),
+            ('subtree', 'cold', reverse('categories-subtree', kwargs={'pk': leaf.parent_id}),
+             cache.bump_catalogue_version),
+            ('stats', 'cold', reverse('categories-stats', kwargs={'pk': root.id}), cache.bump_catalogue_version),
+            ('stats', 'bulk_cold', f'{reverse("categories-stats-bulk")}?ids={leaf.id},{leaf.parent_id},{root.id}',
+             cache.bump_catalogue_version),
+        )
+        for benchmark, variant, url, prepare in requests:
+            samples = []
+            for _ in range(REPEATS):
+                if prepare:
+                    prepare()
+                seconds, response = timed(client.get, url)
+                assert response.status_code == 200, (url, response.status_code)
+                samples.append(seconds)
+            results.append(_result(benchmark, variant, materials, samples, response))
+
+        samples = []
+        last_article = Material.objects.aggregate(last=Max('article'))['last']
+        for article in range(last_article + 1, last_article + 1 + REPEATS):
+            seconds, response = timed(client.post, materials_url, {
+                'name': 'Benchmark material', 'article': article, 'price': 100, 'subcategory': leaf.id,
+            })
+            assert response.status_code == 201, response.content
+            samples.append(seconds)
+        results.append(_result('create', 'single', materials, samples, response))
+    return results
+
+
+def _result(benchmark: str, variant: str, materials: int, samples: list[float], response) -> dict:
+    seconds = statistics.median(samples)
+    return result(
+        f'api_{benchmark}', variant, materials, seconds,
+        rows_per_second=None,
+        min_ms=round(min(samples) * 1000, 2),
+        queries=response.request_metrics.queries if hasattr(response, 'request_metrics') else None,
+        bytes=len(response.content),
+    )
@@ -0,0 +1,154 @@
+import csv
+import os
+from itertools import islice
+from tempfile import NamedTemporaryFile
+
+from django.conf import settings
+from openpyxl import Workbook
+
+from materials.api.v1.services import columnar, copy_loader, sheets, specific_queries, xlsx
+from materials.benchmarks.utils import result, rolled_back, synthetic_rows, timed
+from materials.models import Category
+
+
+def bench_import_engines(rows: int) -> list[dict]:
+    """
+    Сравнивает загрузку материалов через bulk_create и через COPY
+
+    :param rows: Количество строк синтетического прайс-листа
+    :return: Результаты замеров
+    """
+    results = []
+    engines = (
+        ('bulk_create', specific_queries.create_records),
+        ('copy', copy_loader.copy_records),
+    )
+    for variant, load in engines:
+        with rolled_back():
+            categories = [Category.objects.create(name=f'Benchmark category {index}').name for index in range(10)]
+            seconds, report = timed(load, synthetic_rows(rows, categories))
+            results.append(result('import', variant, rows, seconds, inserted=report['inserted']))
+    return results
+
+
+def bench_xlsx_import(rows: int) -> list[dict]:
+    """
+    Замеряет импорт xlsx файла целиком: чтение книги и загрузку обоими способами
+
+    Файл из 'rows' строк создается заранее во временном файле, время его
+    записи в замер не входит.
+
+    :param rows: Количество строк файла
+    :return: Результаты замеров с размером файла в байтах
+    """
+    results = []
+    engines = (
+        ('bulk_create', specific_queries.create_records),
+        ('copy', copy_loader.copy_records),
+    )
+    categories = [f'Benchmark category {index}' for index in range(10)]
+    with NamedTemporaryFile(suffix='.xlsx') as file:
+        _write_xlsx(file.name, synthetic_rows(rows, categories))
+        size = os.path.getsize(file.name)
+        for variant, load in engines:
+            with rolled_back():
+                for name in categories:
+                    Category.objects.create(name=name)
+                seconds, report = timed(load, xlsx.get_datas_from_xlsx(file.name, sheet_page=0))
+                results.append(result('import_xlsx', variant, rows, seconds, inserted=report['inserted'], bytes=size))
+    return results
+
+
+def bench_sheet_import(rows: int, sheet_count: int = 10) -> list[dict]:
+    """
+    Сравнивает импорт книги из нескольких листов одним процессом разбора и пулом
+
+    Строки делятся поровну между 'sheet_count' листами. Ускорение пула
+    ограничено числом ядер и скоростью единственного писателя.
+
+    :param rows: Общее количество строк книги
+    :param sheet_count: Количество листов
+    :return: Результаты замеров с числом процессов
+    """
+    results = []
+    categories = [f'Benchmark category {index}' for index in range(10)]
+    per_sheet = rows // sheet_count
+    with NamedTemporaryFile(suffix='.xlsx') as file:
+        all_rows = synthetic_rows(per_sheet * sheet_count, categories)
+        _write_xlsx(file.name, *(islice(all_rows, per_sheet) for _ in range(sheet_count)))
+        names = xlsx.get_sheet_names(file.name)
+        for workers in sorted({1, settings.IMPORT_SHEET_WORKERS, os.cpu_count() or 1}):
+            with rolled_back():
+                for name in categories:
+                    Category.objects.create(name=name)
+                sheet_reports = [sheets.new_sheet_report(page, name) for page, name in enumerate(names)]
+                seconds, report = timed(
+                    sheets.import_sheets, file.name, sheet_reports, specific_queries.new_report(),
+                    lambda *args: None, workers=workers,
+                )
+                results.append(result(
+                    'import_sheets', f'workers_{workers}', per_sheet * sheet_count, seconds,
+                    inserted=report['inserted'], sheets=sheet_count,
+                ))
+    return results
+
+
+def bench_file_formats(rows: int) -> list[dict]:
+    """
+    Сравнивает разбор одних и тех же строк из xlsx, csv и parquet
+
+    Замеряется чтение файла и поколоночная валидация пачками импорта - все,
+    что зависит от формата; запись в базу у всех форматов общая и в замер
+    не входит. Parquet замеряется, только если установлен pyarrow.
+
+    :param rows: Количество строк файла
+    :return: Результаты замеров с размером файла в байтах
+    """
+    results = []
+    categories = [f'Benchmark category {index}' for index in range(10)]
+    data = list(synthetic_rows(rows, categories))
+    writers = {
+        columnar.XLSX: _write_xlsx,
+        columnar.CSV: _write_csv,
+        columnar.PARQUET: _write_parquet,
+    }
+    for file_format, write in writers.items():
+        if file_format in columnar.ARROW_FORMATS and columnar.pyarrow is None:
+            continue
+        with NamedTemporaryFile(suffix=f'.{file_format}') as file:
+            write(file.name, data)
+            seconds, parsed = timed(_parse_file, file.name, file_format)
+            results.append(result(
+                'import_formats', file_format, rows, seconds, parsed=parsed, bytes=os.path.getsize(file.name)
+            ))
+    return results
+
+
+def _parse_file(filename: str, file_format: str) -> int:
+    parsed = 0
+    for columns, _, _ in columnar.iter_batches(filename, file_format, specific_queries.IMPORT_BATCH_SIZE):
+        parsed += len(columns['row'])
+    return parsed
+
+
+def _write_csv(filename: str, rows) -> None:
+    with open(filename, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(columnar.IMPORT_COLUMNS)
+        writer.writerows(rows)
+
+
+def _write_parquet(filename: str, rows) -> None:
+    import pyarrow.parquet
+
+    pyarrow.parquet.write_table(columnar.pyarrow.table(dict(zip(columnar.IMPORT_COLUMNS, zip(*rows)))), filename)
+
+
+def _write_xlsx(filename: str, *sheets) -> None:
+    workbook = Workbook(write_only=True)
+    for rows in sheets:
+        sheet = workbook.create_sheet()
+        sheet.append(('name', 'article', 'price', 'category_name'))
+        for row in rows:
+            sheet.append(row)
+    workbook.save(filename)
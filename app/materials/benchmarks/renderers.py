@@ -0,0 +1,56 @@
+import gzip
+
+from rest_framework.renderers import JSONRenderer
+
+from materials.api.v1.renderers import MessagePackRenderer, ORJSONRenderer
+from materials.api.v1.services import totals, tree
+from materials.benchmarks.utils import result, rolled_back, synthetic_rows, timed
+from materials.middleware import brotli
+from materials.models import Category, Material
+
+
+def bench_renderers(rows: int) -> list[dict]:
+    """
+    Сравнивает время кодирования и размер ответа '/categories/tree/'
+
+    Дерево собирается на синтетическом каталоге (10 корней по 10 подкатегорий,
+    'rows' материалов в листьях) и кодируется каждым рендерером, затем
+    orjson-ответ сжимается gzip и, если установлен, brotli.
+
+    :param rows: Количество материалов в каталоге
+    :return: Результаты замеров с размером ответа в байтах
+    """
+    results = []
+    with rolled_back():
+        leaves = []
+        for root_index in range(10):
+            root = Category.objects.create(name=f'Benchmark root {root_index}')
+            leaves.extend(
+                Category.objects.create(name=f'Benchmark leaf {root_index}.{index}', parent=root)
+                for index in range(10)
+            )
+        Material.objects.bulk_create(
+            (Material(name=name, article=article, price=price, category=leaves[article % len(leaves)])
+             for name, article, price, _ in synthetic_rows(rows, [''])),
+            batch_size=5000
+        )
+        totals.rebuild_totals()
+        data = tree.build_category_tree()
+
+    renderers = (
+        ('json', JSONRenderer()),
+        ('orjson', ORJSONRenderer()),
+        ('msgpack', MessagePackRenderer()),
+    )
+    for variant, renderer in renderers:
+        seconds, body = timed(renderer.render, data)
+        results.append(result('render_tree', variant, rows, seconds, bytes=len(body)))
+
+    body = ORJSONRenderer().render(data)
+    compressors = [('orjson+gzip', lambda: gzip.compress(body, compresslevel=6))]
+    if brotli is not None:
+        compressors.append(('orjson+brotli', lambda: brotli.compress(body, quality=5)))
+    for variant, compress in compressors:
+        seconds, compressed = timed(compress)
+        results.append(result('render_tree', variant, rows, seconds, bytes=len(compressed)))
+    return results
@@ -0,0 +1,57 @@
+import statistics
+
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from materials.benchmarks.catalogue import generate_catalogue
+from materials.benchmarks.utils import result, rolled_back, timed
+from materials.models import Category, Material
+
+
+REPEATS = 50
+
+
+def bench_search(rows: int) -> list[dict]:
+    """
+    Замеряет задержку '/materials/?q=' на синтетическом каталоге из 'rows' материалов
+
+    Запросы идут через полный стек Django, как в 'bench_endpoints', с
+    keyset-пагинацией по 20 результатов. Для каждого вида запроса
+    выполняется 'REPEATS' повторов и считаются медиана и p95.
+
+    :param rows: Количество материалов в каталоге
+    :return: Результаты замеров с p50/p95 в миллисекундах и числом найденных на странице
+    """
+    client = Client(SERVER_NAME='localhost')
+    results = []
+    with rolled_back():
+        created = generate_catalogue(depth=3, fanout=10, materials_per_leaf=max(rows // 1000, 1))
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Material._meta.db_table}, {Category._meta.db_table}')
+        article = Material.objects.order_by('id').values_list('article', flat=True)[created['materials'] // 2]
+        root = Category.objects.roots().order_by('id').first()
+
+        queries = (
+            ('prefix', {'q': 'цем'}),
+            ('two_words', {'q': 'цемент м500'}),
+            ('typo', {'q': 'кирпч'}),
+            ('article', {'q': str(article)}),
+            ('subtree', {'q': 'кирпич', 'category': root.id}),
+        )
+        url = reverse('materials-list')
+        for variant, params in queries:
+            samples = []
+            for _ in range(REPEATS):
+                seconds, response = timed(client.get, url, {**params, 'cursor': '', 'limit': 20})
+                assert response.status_code == 200, response.content
+                samples.append(seconds)
+            percentiles = statistics.quantiles(samples, n=20)
+            results.append(result(
+                'search', variant, created['materials'], statistics.median(samples),
+                rows_per_second=None,
+                p50_ms=round(statistics.median(samples) * 1000, 2),
+                p95_ms=round(percentiles[18] * 1000, 2),
+                found=len(response.json()['results']),
+            ))
+    return results
@@ -0,0 +1,49 @@
+from materials.api.v1.serializers import (
+    CategoryFastSerializer,
+    CategoryListFastSerializer,
+    CategoryListSerializer,
+    CategorySerializer,
+    MaterialFastSerializer,
+    MaterialFullSerializer,
+)
+from materials.benchmarks.utils import result, rolled_back, synthetic_rows, timed
+from materials.models import Category, Material
+
+
+def bench_serializers(rows: int) -> list[dict]:
+    """
+    Сравнивает обычные ModelSerializer с сериализаторами строк '.values()'
+
+    Замеряется выборка и сериализация 'rows' объектов целиком, как в view,
+    плюс время в пересчете на 10 тысяч объектов.
+
+    :param rows: Количество материалов и категорий
+    :return: Результаты замеров
+    """
+    pairs = (
+        ('materials', Material.objects.all(), MaterialFullSerializer, MaterialFastSerializer),
+        ('categories', Category.objects.all(), CategorySerializer, CategoryFastSerializer),
+        ('categories_flat', Category.objects.all(), CategoryListSerializer, CategoryListFastSerializer),
+    )
+    results = []
+    with rolled_back():
+        Category.objects.bulk_create(Category(name=f'Benchmark category {index}') for index in range(rows))
+        category = Category.objects.create(name='Benchmark materials')
+        Material.objects.bulk_create(
+            (Material(name=name, article=article, price=price, category=category)
+             for name, article, price, _ in synthetic_rows(rows, [category.name])),
+            batch_size=5000
+        )
+        for benchmark, queryset, regular, fast in pairs:
+            variants = (
+                ('model_serializer', lambda: regular(queryset.all(), many=True).data),
+                ('values_serializer', lambda: fast(fast.prepare_queryset(queryset.all()), many=True).data),
+            )
+            for variant, serialize in variants:
+                seconds, data = timed(serialize)
+                count = len(data)
+                results.append(result(
+                    f'serialize_{benchmark}', variant, count, seconds,
+                    ms_per_10k=round(seconds * 1000 * 10_000 / count, 1) if count else None
+                ))
+    return results
@@ -0,0 +1,40 @@
+import tracemalloc
+
+from materials.api.v1.services import subtree
+from materials.benchmarks.catalogue import generate_catalogue
+from materials.benchmarks.utils import result, rolled_back, timed
+from materials.models import Category
+
+
+def bench_subtree(rows: int) -> list[dict]:
+    """
+    Замеряет перенос и удаление ветки каталога с материалами
+
+    Каталог как в 'bench_endpoints': 10 корней по 3 уровня, в каждой ветке
+    корня десятая часть из 'rows' материалов. Сначала одна ветка переносится
+    под другую, затем ветка удаляется вместе с материалами. Для удаления
+    показан пик памяти Python: он ограничен пачкой, а не размером ветки.
+
+    :param rows: Количество материалов в каталоге
+    :return: Результаты замеров
+    """
+    results = []
+    with rolled_back():
+        generate_catalogue(depth=3, fanout=10, materials_per_leaf=max(rows // 1000, 1))
+        # Идентификаторы сгенерированных категорий больше уже существующих
+        branch, target = Category.objects.roots().order_by('-id')[:2]
+
+        seconds, branch = timed(subtree.move_subtree, branch.id, target.id)
+        results.append(result('subtree', 'move', branch.materials_count, seconds))
+
+        tracemalloc.start()
+        try:
+            seconds, report = timed(subtree.delete_subtree, branch, with_materials=True)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        results.append(result(
+            'subtree', 'delete', report['materials'], seconds,
+            categories=report['categories'], peak_kb=round(peak / 1024),
+        ))
+    return results
@@ -0,0 +1,95 @@
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Max
+
+from materials.api.v1.services.cache import bump_catalogue_version
+from materials.models import Material
+
+
+@contextmanager
+def rolled_back() -> Iterator[None]:
+    """
+    Выполняет замер в транзакции, которая затем откатывается
+
+    Строки после замера не остаются, но замер мог закэшировать ответы по
+    данным, которых после отката нет, поэтому версия кэша каталога после
+    отката сбрасывается. Запускать бенчмарки стоит на отдельной базе: замер
+    держит блокировки и нагружает базу на все время транзакции.
+    """
+    try:
+        with transaction.atomic():
+            yield
+            transaction.set_rollback(True)
+    finally:
+        bump_catalogue_version()
+
+
+def timed(func: Callable, *args, **kwargs) -> tuple[float, object]:
+    """
+    Замеряет время выполнения функции
+
+    :return: Пара '(секунды, результат функции)'
+    """
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def synthetic_rows(count: int, category_names: list[str]) -> Iterator[tuple]:
+    """
+    Генерирует строки файла импорта с артикулами, которых еще нет в базе
+
+    :param count: Количество строк
+    :param category_names: Имена категорий, по которым распределяются строки
+    :return: Генератор строк (name, article, price, category_name)
+    """
+    first_article = (Material.objects.aggregate(last=Max('article'))['last'] or 0) + 1
+    for index in range(count):
+        yield (
+            f'Material {index}',
+            first_article + index,
+            index % 10_000 + 1,
+            category_names[index % len(category_names)],
+        )
+
+
+def result(benchmark: str, variant: str, rows: int, seconds: float, **extra) -> dict:
+    return {
+        'benchmark': benchmark,
+        'variant': variant,
+        'rows': rows,
+        'seconds': round(seconds, 4),
+        'rows_per_second': round(rows / seconds) if seconds else None,
+        **extra,
+    }
+
+
+def compare_results(baseline: list[dict], current: list[dict], threshold: float) -> list[dict]:
+    """
+    Сопоставляет замеры с базовыми по benchmark, variant и rows
+
+    :param baseline: Результаты базового запуска, например с основной ветки
+    :param current: Результаты текущего запуска
+    :param threshold: Замедление в процентах, начиная с которого замер считается регрессией
+    :return: Пары замеров с изменением времени в процентах
+    """
+    baseline_seconds = {(row['benchmark'], row['variant'], row['rows']): row['seconds'] for row in baseline}
+    compared = []
+    for row in current:
+        before = baseline_seconds.get((row['benchmark'], row['variant'], row['rows']))
+        if not before:
+            continue
+        change = (row['seconds'] - before) / before * 100
+        compared.append({
+            'benchmark': row['benchmark'],
+            'variant': row['variant'],
+            'rows': row['rows'],
+            'baseline': before,
+            'seconds': row['seconds'],
+            'change': round(change, 1),
+            'regression': change > threshold,
+        })
+    return compared
@@ -1,13 +1,14 @@
-from django.db.models import Q
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from openpyxl import Workbook
+
 from materials.models import Material, Category
+from materials.api.v1.services.totals import apply_material_deltas
 
 
 def create_material(pre_material_data: dict, category_id: int) -> Material:
-    category = Category.objects.filter(
-        Q(id=category_id)
-        &
-        ~Q(children__isnull=False)
-    ).first()
+    category = Category.objects.leaves().filter(id=category_id).first()
     if not category:
         raise Exception('Invalid subcategory or not a leaf category.')
     material_data = pre_material_data.copy()
@@ -16,6 +17,7 @@ def create_material(pre_material_data: dict, category_id: int) -> Material:
         **material_data,
         category=category
     )
+    apply_material_deltas({category.id: (material.price, 1)})
     return material
 
 
@@ -26,3 +28,33 @@ def create_category(name: str, parent_id: int=None) -> Category:
     )
 
     return category
+
+
+def create_xlsx_file(rows: list[tuple], name: str = 'materials.xlsx') -> SimpleUploadedFile:
+    return create_workbook_file({'Sheet': rows}, name=name)
+
+
+def create_workbook_file(sheets: dict[str, list[tuple]], name: str = 'materials.xlsx') -> SimpleUploadedFile:
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in sheets.items():
+        sheet = workbook.create_sheet(title)
+        sheet.append(('name', 'article', 'price', 'category_name'))
+        for row in rows:
+            sheet.append(row)
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+def assert_query_budget(response) -> None:
+    """
+    Проверяет, что view уложился в свой бюджет SQL запросов ('query_budgets')
+
+    :param response: Ответ тестового клиента, прошедший через RequestMetricsMiddleware
+    """
+    assert response.query_budget is not None, f'No query budget declared for {response.wsgi_request.path}'
+    assert response.request_metrics.queries <= response.query_budget, (
+        f'{response.wsgi_request.path} made {response.request_metrics.queries} queries, '
+        f'budget is {response.query_budget}'
+    )
@@ -0,0 +1,91 @@
+import json
+import os
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from materials.benchmarks import BENCHMARKS
+from materials.benchmarks.utils import compare_results
+
+
+class Command(BaseCommand):
+    help = 'Запускает бенчмарки на текущей базе, все изменения данных откатываются'
+    columns = ('benchmark', 'variant', 'rows', 'seconds', 'rows_per_second')
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f'Бенчмарки, по умолчанию все: {", ".join(BENCHMARKS)}')
+        parser.add_argument('--rows', type=int, nargs='+', default=[100_000],
+                            help='Размеры синтетических данных, например --rows 10000 100000 1000000')
+        parser.add_argument('--json', help='Сохранить результаты в JSON файл для сравнения между коммитами')
+        parser.add_argument('--compare', help='JSON файл базового запуска, с которым сравнить результаты')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='Замедление в процентах относительно --compare, считающееся регрессией')
+
+    def handle(self, *args, **options):
+        unknown = set(options['names']) - BENCHMARKS.keys()
+        if unknown:
+            raise CommandError(f'Unknown benchmarks: {", ".join(sorted(unknown))}')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+
+        results = []
+        for name in options['names'] or BENCHMARKS:
+            for rows in options['rows']:
+                for row in BENCHMARKS[name](rows):
+                    results.append(row)
+                    extra = ' '.join(f'{key}={value}' for key, value in row.items() if key not in self.columns)
+                    self.stdout.write(
+                        f"{row['benchmark']:<20} {row['variant']:<20} {row['rows']:>10} rows "
+                        f"{row['seconds']:>10.3f} s {row['rows_per_second'] or 0:>12} rows/s {extra}".rstrip()
+                    )
+
+        if options['json']:
+            with open(options['json'], 'w') as file:
+                json.dump({**self.environment(), 'results': results}, file, indent=2)
+
+        if baseline is not None:
+            self.compare(baseline, results, options['threshold'])
+
+    def compare(self, baseline: dict, results: list[dict], threshold: float) -> None:
+        self.stdout.write(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+        compared = compare_results(baseline['results'], results, threshold)
+        for row in compared:
+            line = (
+                f"{row['benchmark']:<20} {row['variant']:<20} {row['rows']:>10} rows "
+                f"{row['baseline']:>10.3f} s -> {row['seconds']:>10.3f} s {row['change']:>+8.1f}%"
+            )
+            self.stdout.write(self.style.ERROR(f'{line} regression') if row['regression'] else line)
+
+        regressions = sum(row['regression'] for row in compared)
+        if regressions:
+            raise CommandError(f'{regressions} benchmarks are more than {threshold}% slower than the baseline')
+
+    @staticmethod
+    def environment() -> dict:
+        """
+        Окружение запуска, без которого результаты разных машин не сравнить
+        """
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW server_version')
+            database = f'PostgreSQL {cursor.fetchone()[0]}'
+        return {
+            'created': timezone.now().isoformat(),
+            'commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': database,
+            'cpu_count': os.cpu_count(),
+        }
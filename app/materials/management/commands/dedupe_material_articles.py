@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max
+
+from materials.api.v1.services.totals import rebuild_totals
+from materials.models import Material
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет материалы с повторяющимися артикулами, оставляя по каждому последний загруженный, '
+        'и пересчитывает итоги категорий. Нужна перед миграцией 0006, если она остановилась на дублях'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать материалы, которые будут удалены',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            duplicates = (
+                Material.objects.order_by().values('article')
+                .annotate(keep_id=Max('id'), copies=Count('id'))
+                .filter(copies__gt=1)
+            )
+            keep_ids = {row['article']: row['keep_id'] for row in duplicates}
+            removed = list(
+                Material.objects.filter(article__in=keep_ids).exclude(id__in=keep_ids.values())
+                .order_by('article', 'id').values_list('id', 'article', 'name', 'price', 'category_id')
+            )
+            for material_id, article, name, price, category_id in removed:
+                self.stdout.write(
+                    f'Material {material_id}: article {article}, name {name!r}, price {price}, '
+                    f'category {category_id}, kept {keep_ids[article]}'
+                )
+            if options['dry_run'] or not removed:
+                self.stdout.write(self.style.SUCCESS(f'{len(removed)} duplicate materials found'))
+                return
+
+            Material.objects.filter(id__in=[row[0] for row in removed]).delete()
+            rebuild_totals()
+        self.stdout.write(self.style.SUCCESS(f'Removed {len(removed)} duplicate materials'))
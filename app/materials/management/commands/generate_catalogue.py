@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from materials.benchmarks.catalogue import generate_catalogue
+
+
+class Command(BaseCommand):
+    help = 'Создает синтетический каталог заданной формы для нагрузочных тестов и бенчмарков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depth', type=int, default=3, help='Число уровней категорий')
+        parser.add_argument('--fanout', type=int, default=10, help='Подкатегорий у каждой категории')
+        parser.add_argument('--roots', type=int, help='Корневых категорий, по умолчанию равно --fanout')
+        parser.add_argument('--materials-per-leaf', type=int, default=100, help='Материалов в каждом листе')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пачки вставки')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора цен')
+
+    def handle(self, *args, **options):
+        if options['depth'] < 1 or options['fanout'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--depth, --fanout and --batch-size must be positive')
+        if options['materials_per_leaf'] < 0 or (options['roots'] is not None and options['roots'] < 1):
+            raise CommandError('--materials-per-leaf must not be negative and --roots must be positive')
+
+        started = time.perf_counter()
+        created = generate_catalogue(
+            depth=options['depth'],
+            fanout=options['fanout'],
+            materials_per_leaf=options['materials_per_leaf'],
+            roots=options['roots'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created['categories']} categories ({created['leaves']} leaves) and "
+            f"{created['materials']} materials in {time.perf_counter() - started:.1f} s"
+        ))
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from materials.api.v1.services import columnar, copy_loader, sheets, specific_queries, xlsx
+from materials.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = 'Импортирует материалы из xlsx, csv, parquet или arrow файла без HTTP запроса'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу')
+        parser.add_argument('--sheets', default='0', help="'all' или индексы листов через запятую")
+        parser.add_argument(
+            '--workers', type=int, default=settings.IMPORT_SHEET_WORKERS,
+            help='Процессов разбора при импорте нескольких листов'
+        )
+        parser.add_argument('--mode', choices=ImportJob.Mode.values, default=ImportJob.Mode.INSERT)
+        parser.add_argument('--engine', choices=ImportJob.Engine.values, default=ImportJob.Engine.COPY)
+
+    def handle(self, *args, **options):
+        file_format = columnar.get_file_format(options['path'])
+        if file_format is None:
+            raise CommandError(f'Only {", ".join(columnar.supported_formats())} files are supported')
+        try:
+            sheet_count = columnar.get_sheet_count(options['path'], file_format)
+            pages = xlsx.parse_sheet_list(options['sheets'], sheet_count)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if len(pages) > 1:
+            if options['engine'] == ImportJob.Engine.COPY:
+                raise CommandError('COPY engine imports a single sheet only, use --engine orm')
+            names = xlsx.get_sheet_names(options['path'])
+            sheet_reports = [sheets.new_sheet_report(page, names[page]) for page in pages]
+            report = sheets.import_sheets(
+                options['path'], sheet_reports, specific_queries.new_report(), lambda *args: None,
+                workers=options['workers'], mode=options['mode'],
+            )
+            for sheet in sheet_reports:
+                self.stdout.write(
+                    f"Sheet {sheet['name']}: processed {sheet['processed']}, rejected {sheet['rejected']}, "
+                    f"parsed {sheet['rows_per_second']} rows/s"
+                )
+            self._write_report(report)
+            return
+
+        if options['engine'] == ImportJob.Engine.COPY:
+            batches = columnar.iter_batches(
+                options['path'], file_format, copy_loader.COPY_BATCH_SIZE, sheet_page=pages[0]
+            )
+            report = copy_loader.copy_batches(batches, mode=options['mode'])
+        else:
+            batches = columnar.iter_batches(
+                options['path'], file_format, specific_queries.IMPORT_BATCH_SIZE, sheet_page=pages[0]
+            )
+            report = specific_queries.write_batches(batches, mode=options['mode'])
+        self._write_report(report)
+
+    def _write_report(self, report: dict) -> None:
+        for error in report['errors']:
+            sheet = f"Sheet {error['sheet']}, " if 'sheet' in error else ''
+            self.stdout.write(f"{sheet}Row {error['row']}, {error['field']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {report['processed']}, rejected {report['rejected']}, inserted {report['inserted']}, "
+            f"updated {report['updated']}, unchanged {report['unchanged']}"
+        ))
@@ -0,0 +1,59 @@
+import http.client
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Нагружает запущенный сервер GET запросами и выводит запросы/с и перцентили задержки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Например, http://127.0.0.1:8000/api/v1/materials/')
+        parser.add_argument('--requests', type=int, default=2000, help='Сколько запросов выполнить')
+        parser.add_argument('--concurrency', type=int, default=32, help='Сколько клиентов работает одновременно')
+        parser.add_argument('--warmup', type=int, default=50, help='Сколько запросов не учитывать в замере')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme not in ('http', 'https'):
+            raise CommandError('Only http and https URLs are supported')
+        path = url.path + (f'?{url.query}' if url.query else '')
+        connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        local = threading.local()
+
+        def request(_) -> tuple[float, int]:
+            # Соединение на поток клиента с keep-alive, как у браузера или прокси
+            if not hasattr(local, 'connection'):
+                local.connection = connection_class(url.netloc, timeout=30)
+            started = time.perf_counter()
+            try:
+                local.connection.request('GET', path)
+                response = local.connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                local.connection.close()
+                del local.connection
+                status = 0
+            return time.perf_counter() - started, status
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(request, range(options['warmup'])))
+            started = time.perf_counter()
+            results = list(pool.map(request, range(options['requests'])))
+            elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency * 1000 for latency, _ in results)
+        errors = sum(1 for _, status in results if not 200 <= status < 400)
+        percentiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f'{len(results)} requests, concurrency {options["concurrency"]}, {elapsed:.2f} s\n'
+            f'requests/s: {len(results) / elapsed:.1f}\n'
+            f'latency ms: p50 {percentiles[49]:.1f}, p95 {percentiles[94]:.1f}, '
+            f'p99 {percentiles[98]:.1f}, max {latencies[-1]:.1f}\n'
+            f'errors: {errors}'
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from materials.api.v1.services.totals import rebuild_totals
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сохраненные итоги категорий (total_sum, materials_count) и сверяет их'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить итоги, завершиться с ошибкой при расхождениях',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            mismatches = rebuild_totals(dry_run=options['check'])
+
+        for category_id, stored, expected in mismatches:
+            self.stdout.write(f'Category {category_id}: stored {stored}, expected {expected}')
+
+        if options['check'] and mismatches:
+            raise CommandError(f'{len(mismatches)} categories have inconsistent totals')
+        if options['check']:
+            self.stdout.write(self.style.SUCCESS('All category totals are consistent'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt totals, {len(mismatches)} categories fixed'))
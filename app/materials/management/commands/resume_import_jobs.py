@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from materials.api.v1.services.jobs import resume_interrupted_jobs
+
+
+class Command(BaseCommand):
+    help = 'Продолжает импорты xlsx, прерванные остановкой сервера, с последней записанной пачки'
+
+    def handle(self, *args, **options):
+        job_ids = resume_interrupted_jobs()
+        self.stdout.write(self.style.SUCCESS(f'Resumed {len(job_ids)} import jobs: {job_ids}'))
@@ -0,0 +1,209 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+
+# Границы гистограммы длительности запросов в секундах
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@dataclass
+class RequestMetrics:
+    """
+    Замеры одного HTTP запроса: число SQL запросов, время в БД и именованные этапы
+    """
+    queries: int = 0
+    db_time: float = 0.0
+    timings: dict[str, float] = field(default_factory=dict)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+
+_current: ContextVar[RequestMetrics | None] = ContextVar('request_metrics', default=None)
+
+
+def start_request() -> tuple[RequestMetrics, object]:
+    """
+    Начинает замеры запроса в текущем контексте
+
+    Контекст копируется в потоки sync_to_async, поэтому запросы к БД
+    асинхронных view тоже попадают в замер.
+
+    :return: Замеры и токен для 'finish_request'
+    """
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def finish_request(token) -> None:
+    _current.reset(token)
+
+
+def current() -> RequestMetrics | None:
+    return _current.get()
+
+
+@contextmanager
+def timer(name: str):
+    """
+    Добавляет время выполнения блока к этапу 'name' текущего запроса
+
+    Вне запроса (команды, фоновые задачи) ничего не замеряет.
+
+    :param name: Имя этапа в заголовке Server-Timing, например 'serialize'
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - started)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Обертка 'connection.execute_wrapper': считает запросы и время в БД текущего запроса
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def get_query_budget(request) -> int | None:
+    """
+    Бюджет SQL запросов view, обработавшего запрос
+
+    Бюджет задается атрибутом view 'query_budgets': словарь из действия
+    ViewSet (или HTTP метода для APIView) в максимальное число запросов.
+
+    :param request: Запрос после разрешения URL
+    :return: Бюджет или None, если он не задан
+    """
+    resolver_match = getattr(request, 'resolver_match', None)
+    view_class = getattr(resolver_match and resolver_match.func, 'cls', None)
+    budgets = getattr(view_class, 'query_budgets', None)
+    if not budgets:
+        return None
+    method = request.method.lower()
+    action = getattr(resolver_match.func, 'actions', {}).get(method, method)
+    return budgets.get(action)
+
+
+def server_timing(metrics: RequestMetrics, total: float) -> str:
+    """
+    Значение заголовка Server-Timing в миллисекундах
+
+    :param metrics: Замеры запроса
+    :param total: Полное время обработки запроса в секундах
+    :return: Например, 'db;dur=1.2;desc="3 queries", render;dur=0.3, total;dur=5.1'
+    """
+    parts = [f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"']
+    parts.extend(f'{name};dur={seconds * 1000:.1f}' for name, seconds in metrics.timings.items())
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+class MetricsRegistry:
+    """
+    Счетчики и гистограммы запросов процесса в формате Prometheus
+
+    Каждый процесс gunicorn хранит свои значения, поэтому Prometheus
+    должен опрашивать процессы по отдельности или через агрегирующий прокси.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._requests = defaultdict(int)
+            self._durations = defaultdict(lambda: [0] * (len(DURATION_BUCKETS) + 1))
+            self._duration_sums = defaultdict(float)
+            self._stages = defaultdict(float)
+            self._queries = defaultdict(int)
+            self._db_time = defaultdict(float)
+            self._over_budget = defaultdict(int)
+
+    def observe(self, view: str, method: str, status: int, total: float, metrics: RequestMetrics,
+                over_budget: bool = False) -> None:
+        """
+        Учитывает обработанный запрос
+
+        :param view: Имя маршрута view
+        :param method: HTTP метод
+        :param status: Код ответа
+        :param total: Полное время обработки в секундах
+        :param metrics: Замеры запроса
+        :param over_budget: Превышен ли бюджет SQL запросов
+        """
+        with self._lock:
+            self._requests[view, method, str(status)] += 1
+            self._durations[view, method][bisect_left(DURATION_BUCKETS, total)] += 1
+            self._duration_sums[view, method] += total
+            for name, seconds in metrics.timings.items():
+                self._stages[view, name] += seconds
+            self._queries[(view,)] += metrics.queries
+            self._db_time[(view,)] += metrics.db_time
+            if over_budget:
+                self._over_budget[(view,)] += 1
+
+    def render(self) -> str:
+        """
+        :return: Текстовый формат Prometheus 0.0.4
+        """
+        with self._lock:
+            lines = []
+            _counter(lines, 'http_requests_total', 'Обработанные HTTP запросы',
+                     ('view', 'method', 'status'), self._requests)
+            lines.append('# HELP http_request_duration_seconds Время обработки HTTP запросов')
+            lines.append('# TYPE http_request_duration_seconds histogram')
+            for (view, method), counts in self._durations.items():
+                labels = _labels(('view', 'method'), (view, method))
+                cumulative = 0
+                for bound, count in zip((*map(str, DURATION_BUCKETS), '+Inf'), counts):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {self._duration_sums[view, method]}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {cumulative}')
+            _counter(lines, 'http_request_stage_seconds_total', 'Время этапов обработки: сериализация, рендер',
+                     ('view', 'stage'), self._stages)
+            _counter(lines, 'db_queries_total', 'SQL запросы, выполненные при обработке HTTP запросов',
+                     ('view',), self._queries)
+            _counter(lines, 'db_query_seconds_total', 'Время SQL запросов при обработке HTTP запросов',
+                     ('view',), self._db_time)
+            _counter(lines, 'query_budget_exceeded_total', 'Запросы, превысившие бюджет SQL запросов view',
+                     ('view',), self._over_budget)
+            return '\n'.join(lines) + '\n'
+
+
+def _counter(lines: list[str], name: str, help_text: str, label_names: tuple, values: dict) -> None:
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} counter')
+    for label_values, value in values.items():
+        lines.append(f'{name}{{{_labels(label_names, label_values)}}} {value}')
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,108 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+from materials import metrics
+
+try:
+    import brotli
+except ImportError:  # brotli - необязательная зависимость, без нее остается gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Сжимает большие ответы brotli или gzip в зависимости от Accept-Encoding
+
+    Brotli выбирается, если он установлен и клиент его принимает, иначе
+    работает стандартный GZipMiddleware. Ответы меньше
+    'RESPONSE_COMPRESSION_MIN_SIZE' байт не сжимаются.
+    """
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+            return response
+        if (
+            brotli is None
+            or response.streaming
+            or response.has_header('Content-Encoding')
+            or 'br' not in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding', ))
+        compressed = brotli.compress(response.content, quality=settings.RESPONSE_COMPRESSION_BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        if etag := response.get('ETag'):
+            if etag.startswith('"'):
+                response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+
+class RequestMetricsMiddleware:
+    """
+    Замеряет число SQL запросов, время в БД, сериализации и рендера каждого запроса
+
+    Замеры попадают в заголовок Server-Timing (при 'SERVER_TIMING') и в
+    метрики Prometheus на /metrics. Превышение бюджета SQL запросов view
+    ('query_budgets') пишется в лог, а замеры и бюджет доступны тестам
+    через 'response.request_metrics' и 'response.query_budget'.
+
+    Работает без переключения потоков и под WSGI, и под ASGI. Запросы,
+    выполненные при отдаче потокового ответа, в замер не попадают.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        request_metrics, token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self.process_response(request, response, request_metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        request_metrics, token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self.process_response(request, response, request_metrics, time.perf_counter() - started)
+
+    def process_response(self, request, response, request_metrics, total):
+        budget = metrics.get_query_budget(request)
+        over_budget = budget is not None and request_metrics.queries > budget
+        view = getattr(request.resolver_match, 'view_name', None) or 'unmatched'
+        if over_budget:
+            logger.warning(
+                'Query budget exceeded: %s %s made %d queries, budget is %d',
+                request.method, view, request_metrics.queries, budget
+            )
+        metrics.registry.observe(view, request.method, response.status_code, total, request_metrics, over_budget)
+
+        response.request_metrics = request_metrics
+        response.query_budget = budget
+        if settings.SERVER_TIMING:
+            response.headers['Server-Timing'] = metrics.server_timing(request_metrics, total)
+        return response
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:48
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_totals(apps, schema_editor):
+    Category = apps.get_model('materials', 'Category')
+    Material = apps.get_model('materials', 'Material')
+
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    totals = defaultdict(lambda: [0, 0])
+    own = Material.objects.order_by().values('category_id').annotate(total=Sum('price'), count=Count('id'))
+    for row in own:
+        category_id = row['category_id']
+        while category_id is not None:
+            totals[category_id][0] += row['total']
+            totals[category_id][1] += row['count']
+            category_id = parents[category_id]
+
+    categories = Category.objects.filter(id__in=totals).only('id')
+    for category in categories:
+        category.total_sum, category.materials_count = totals[category.id]
+    Category.objects.bulk_update(categories, ['total_sum', 'materials_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0002_alter_category_options_alter_material_article'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='materials_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Количество материалов поддерева'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='total_sum',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Стоимость материалов поддерева'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:49
+
+from django.db import migrations, models
+
+
+def backfill_paths(apps, schema_editor):
+    Category = apps.get_model('materials', 'Category')
+
+    level = list(Category.objects.filter(parent__isnull=True).only('id', 'parent_id'))
+    depth = 0
+    paths = {}
+    while level:
+        for category in level:
+            category.path = f'{paths.get(category.parent_id, "")}{category.id}/'
+            category.depth = depth
+            paths[category.id] = category.path
+        Category.objects.bulk_update(level, ['path', 'depth'], batch_size=1000)
+        level = list(Category.objects.filter(parent_id__in=[category.id for category in level]).only('id', 'parent_id'))
+        depth += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0003_category_subtree_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Глубина'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=1000, verbose_name='Путь от корня'),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0004_category_path_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='imports/', verbose_name='Файл импорта')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершен'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('rows_committed', models.PositiveIntegerField(default=0, verbose_name='Прочитано строк файла')),
+                ('rows_processed', models.PositiveIntegerField(default=0, verbose_name='Обработано строк')),
+                ('rows_rejected', models.PositiveIntegerField(default=0, verbose_name='Отклонено строк')),
+                ('errors', models.JSONField(default=list, verbose_name='Ошибки строк')),
+                ('detail', models.TextField(blank=True, verbose_name='Причина сбоя')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Запущен')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершен')),
+            ],
+            options={
+                'verbose_name': 'Импорт материалов',
+                'verbose_name_plural': 'Импорты материалов',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:53
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+DUPLICATES_SHOWN = 20
+
+
+def check_duplicate_articles(apps, schema_editor):
+    """
+    Останавливает миграцию, если артикулы повторяются
+
+    Какой из дублей верный, решает оператор: миграция ничего не удаляет,
+    а показывает конфликтующие артикулы. Оставить по каждому артикулу
+    последний загруженный материал можно командой dedupe_material_articles.
+    """
+    Material = apps.get_model('materials', 'Material')
+
+    duplicates = list(
+        Material.objects.order_by('article').values('article')
+        .annotate(copies=Count('id'))
+        .filter(copies__gt=1)
+        .values_list('article', 'copies')
+    )
+    if not duplicates:
+        return
+
+    shown = ', '.join(f'{article} ({copies} copies)' for article, copies in duplicates[:DUPLICATES_SHOWN])
+    more = f' and {len(duplicates) - DUPLICATES_SHOWN} more' if len(duplicates) > DUPLICATES_SHOWN else ''
+    raise RuntimeError(
+        f'{len(duplicates)} material articles are not unique: {shown}{more}. '
+        f'Resolve them by hand or run "python manage.py dedupe_material_articles --dry-run" to review '
+        f'and "python manage.py dedupe_material_articles" to keep the latest material of each article, '
+        f'then migrate again.'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0005_importjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_articles, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='importjob',
+            name='mode',
+            field=models.CharField(choices=[('insert', 'Только добавление'), ('upsert', 'Добавление и обновление по артикулу')], default='insert', max_length=20, verbose_name='Режим импорта'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='rows_inserted',
+            field=models.PositiveIntegerField(default=0, verbose_name='Добавлено материалов'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='rows_unchanged',
+            field=models.PositiveIntegerField(default=0, verbose_name='Без изменений'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='rows_updated',
+            field=models.PositiveIntegerField(default=0, verbose_name='Обновлено материалов'),
+        ),
+        migrations.AlterField(
+            model_name='material',
+            name='article',
+            field=models.IntegerField(unique=True, verbose_name='Код материала'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0006_material_article_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='engine',
+            field=models.CharField(choices=[('orm', 'Пачки через bulk_create'), ('copy', 'COPY во временную таблицу')], default='orm', max_length=20, verbose_name='Способ загрузки'),
+        ),
+    ]
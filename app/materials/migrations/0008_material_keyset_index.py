@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0007_importjob_engine'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='material',
+            options={'ordering': ('price', 'name', 'id'), 'verbose_name': 'Материал', 'verbose_name_plural': 'Материалы'},
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['price', 'name', 'id'], name='material_price_name_id_idx'),
+        ),
+    ]
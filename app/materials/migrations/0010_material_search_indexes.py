@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:29
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0009_category_name_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='material',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector(models.Func(models.F('name'), models.Value(' '), models.Value(1), function='split_part', output_field=models.TextField()), config='simple', weight='A'), '||', django.contrib.postgres.search.SearchVector('name', config='simple'), django.contrib.postgres.search.SearchConfig('simple')), output_field=django.contrib.postgres.search.SearchVectorField(), verbose_name='Поисковый вектор названия'),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='material_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='material_name_fts_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:46
+
+import materials.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0010_material_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='sheet_reports',
+            field=models.JSONField(default=list, verbose_name='Отчеты по листам'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='sheets',
+            field=models.JSONField(default=materials.models.default_import_sheets, verbose_name='Индексы импортируемых листов'),
+        ),
+    ]
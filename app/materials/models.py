@@ -1,4 +1,43 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models import Exists, F, Func, OuterRef, Value
+from django.db.models.functions import Concat, Substr
+
+
+PATH_SEPARATOR = '/'
+# Конфигурация полнотекстового поиска без стемминга: названия - это марки и размеры, а не текст
+SEARCH_CONFIG = 'simple'
+
+
+class CategoryQuerySet(models.QuerySet):
+
+    def roots(self):
+        return self.filter(parent__isnull=True)
+
+    def leaves(self):
+        return self.filter(~Exists(Category.objects.filter(parent=OuterRef('pk'))))
+
+    def descendants_of(self, category: 'Category', include_self: bool = False):
+        queryset = self.filter(path__startswith=category.path)
+        if not include_self:
+            queryset = queryset.exclude(pk=category.pk)
+        return queryset
+
+    def ancestors_of(self, category: 'Category', include_self: bool = False):
+        ancestor_ids = category.ancestor_ids
+        if not include_self:
+            ancestor_ids = ancestor_ids[:-1]
+        return self.filter(id__in=ancestor_ids)
+
+    def is_leaf(self, category_id: int) -> bool:
+        return not self.filter(parent_id=category_id).exists()
+
+
+class MaterialQuerySet(models.QuerySet):
+
+    def subtree_materials(self, category: 'Category'):
+        return self.filter(category__path__startswith=category.path)
 
 
 class Category(models.Model):
@@ -11,15 +50,96 @@ class Category(models.Model):
         related_name='children',
         verbose_name='Родительская категория'
     )
+    total_sum = models.BigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Стоимость материалов поддерева'
+    )
+    materials_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество материалов поддерева'
+    )
+    path = models.CharField(
+        max_length=1000,
+        default='',
+        editable=False,
+        verbose_name='Путь от корня'
+    )
+    depth = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Глубина'
+    )
+
+    objects = CategoryQuerySet.as_manager()
+
+    # Поддерживаются отдельными UPDATE и не перезаписываются при обычном save()
+    DERIVED_FIELDS = ('total_sum', 'materials_count', 'path', 'depth')
 
     class Meta:
         ordering = ('name', )
+        indexes = [
+            models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['name'], name='category_name_idx'),
+            models.Index(fields=['name'], name='category_root_name_idx', condition=models.Q(parent__isnull=True)),
+        ]
         verbose_name = 'Категория'
         verbose_name_plural = 'Категории'
 
     def __str__(self):
         return f'{self.name} added'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_id = instance.__dict__.get('parent_id')
+        return instance
+
+    @property
+    def ancestor_ids(self) -> list[int]:
+        """Идентификаторы предков от корня, включая саму категорию"""
+        return [int(part) for part in self.path.split(PATH_SEPARATOR) if part]
+
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        if not created and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS
+            ]
+        parent_changed = created or (
+            {'parent', 'parent_id'} & set(kwargs['update_fields'])
+            and self.parent_id != getattr(self, '_loaded_parent_id', self.parent_id)
+        )
+        super().save(*args, **kwargs)
+        if parent_changed:
+            self._move_path(created)
+        self._loaded_parent_id = self.parent_id
+
+    def _move_path(self, created: bool) -> None:
+        """
+        Пересчитывает путь и глубину категории и всего её поддерева одним UPDATE
+
+        bulk_create и queryset.update() этот метод не вызывают, путь для
+        таких записей нужно заполнять самостоятельно.
+        """
+        parent_path = ''
+        if self.parent_id is not None:
+            parent_path = Category.objects.values_list('path', flat=True).get(pk=self.parent_id)
+        new_path = f'{parent_path}{self.pk}{PATH_SEPARATOR}'
+        new_depth = new_path.count(PATH_SEPARATOR) - 1
+
+        if created:
+            Category.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+        else:
+            old_path, old_depth = Category.objects.values_list('path', 'depth').get(pk=self.pk)
+            Category.objects.filter(path__startswith=old_path).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (new_depth - old_depth),
+            )
+        self.path, self.depth = new_path, new_depth
+
 
 class Material(models.Model):
     name = models.CharField(max_length=100, verbose_name='Название материала')
@@ -27,14 +147,100 @@ class Material(models.Model):
         to=Category,
         on_delete=models.PROTECT,
         verbose_name='Категория')
-    article = models.IntegerField(verbose_name='Код материала')
+    article = models.IntegerField(unique=True, verbose_name='Код материала')
     price = models.IntegerField(verbose_name='Стоимость материала')
+    # Первое слово названия входит в вектор с весом A, поэтому 'цем' ставит
+    # 'Цемент М500' выше 'Раствор цементный'. Хранится, чтобы ранжирование
+    # не пересчитывало to_tsvector для каждой найденной строки
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector(
+                Func(F('name'), Value(' '), Value(1), function='split_part', output_field=models.TextField()),
+                config=SEARCH_CONFIG,
+                weight='A',
+            )
+            + SearchVector('name', config=SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+        verbose_name='Поисковый вектор названия'
+    )
 
+    objects = MaterialQuerySet.as_manager()
 
     class Meta:
-        ordering = ('price', 'name')
+        ordering = ('price', 'name', 'id')
+        indexes = [
+            models.Index(fields=['price', 'name', 'id'], name='material_price_name_id_idx'),
+            # Поиск, см. services.search
+            GinIndex(fields=['name'], name='material_name_trgm_idx', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['search_vector'], name='material_name_fts_idx'),
+        ]
         verbose_name = 'Материал'
         verbose_name_plural = 'Материалы'
 
     def __str__(self):
         return f'Добавлен материал: {self.name}'
+
+
+def default_import_sheets() -> list[int]:
+    return [0]
+
+
+class ImportJob(models.Model):
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'В очереди'
+        RUNNING = 'running', 'Выполняется'
+        DONE = 'done', 'Завершен'
+        FAILED = 'failed', 'Ошибка'
+
+    class Mode(models.TextChoices):
+        INSERT = 'insert', 'Только добавление'
+        UPSERT = 'upsert', 'Добавление и обновление по артикулу'
+
+    class Engine(models.TextChoices):
+        ORM = 'orm', 'Пачки через bulk_create'
+        COPY = 'copy', 'COPY во временную таблицу'
+
+    file = models.FileField(upload_to='imports/', verbose_name='Файл импорта')
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name='Статус'
+    )
+    rows_committed = models.PositiveIntegerField(default=0, verbose_name='Прочитано строк файла')
+    rows_processed = models.PositiveIntegerField(default=0, verbose_name='Обработано строк')
+    mode = models.CharField(
+        max_length=20,
+        choices=Mode.choices,
+        default=Mode.INSERT,
+        verbose_name='Режим импорта'
+    )
+    engine = models.CharField(
+        max_length=20,
+        choices=Engine.choices,
+        default=Engine.ORM,
+        verbose_name='Способ загрузки'
+    )
+    rows_rejected = models.PositiveIntegerField(default=0, verbose_name='Отклонено строк')
+    rows_inserted = models.PositiveIntegerField(default=0, verbose_name='Добавлено материалов')
+    rows_updated = models.PositiveIntegerField(default=0, verbose_name='Обновлено материалов')
+    rows_unchanged = models.PositiveIntegerField(default=0, verbose_name='Без изменений')
+    errors = models.JSONField(default=list, verbose_name='Ошибки строк')
+    sheets = models.JSONField(default=default_import_sheets, verbose_name='Индексы импортируемых листов')
+    sheet_reports = models.JSONField(default=list, verbose_name='Отчеты по листам')
+    detail = models.TextField(blank=True, verbose_name='Причина сбоя')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создан')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Запущен')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Завершен')
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name='Последний прогресс')
+
+    class Meta:
+        ordering = ('-created_at', )
+        verbose_name = 'Импорт материалов'
+        verbose_name_plural = 'Импорты материалов'
+
+    def __str__(self):
+        return f'Импорт {self.id}: {self.status}'
@@ -0,0 +1,23 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from materials import metrics
+from materials.api.v1.services.cache import bump_catalogue_version
+from materials.models import Category
+
+
+# Материалы меняют версию каталога явно в сервисах записи: обработчик
+# post_delete на Material отключил бы быстрое каскадное удаление
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalogue(sender, **kwargs):
+    bump_catalogue_version()
+
+
+# Обертка ставится на каждое соединение, а не на время запроса: запросы
+# асинхронных view выполняются в других потоках со своими соединениями
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if metrics.record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.record_query)
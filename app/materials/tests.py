@@ -1,7 +1,33 @@
+import base64
+import csv
+import gzip
+import json
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from unittest import skipUnless
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import modify_settings, override_settings
+from django.utils import timezone
+import msgpack
 from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
 
-from materials.conftest import create_material, create_category
+from materials import middleware
+from materials.conftest import (
+    assert_query_budget, create_material, create_category, create_workbook_file, create_xlsx_file
+)
+from materials.api.v1.mixins import FastReadMixin
+from materials.api.v1.pagination import MaterialPagination
+from materials.api.v1.services import columnar, copy_loader, export, jobs, search, specific_queries, subtree
+from materials.api.v1.services.validation import validate_rows
+from materials.api.v1.services.xlsx import get_datas_from_xlsx
+from materials.models import Category, ImportJob, Material
 
 
 
@@ -49,6 +75,131 @@ class CategoryAPITest(APITestCase):
         response = self.client.delete(url)
         self.assertEqual(response.status_code, 204)
 
+    def test_tree_categories(self):
+        material_data = {'name': 'Tree Material', 'article': 1, 'price': 300, 'subcategory': None}
+        create_material(material_data, category_id=self.category2.id)
+        create_material({**material_data, 'article': 2, 'price': 200}, category_id=self.category3.id)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url_tree)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([node['name'] for node in response.data], ['Test Category', 'Test Category 3'])
+        root = response.data[0]
+        self.assertEqual(root['total_sum'], 300)
+        self.assertEqual(root['materials'], [])
+        self.assertEqual(root['subcategories'][0]['id'], self.category2.id)
+        self.assertEqual(root['subcategories'][0]['subcategories'], [])
+        self.assertEqual(
+            root['subcategories'][0]['materials'][0],
+            {'id': root['subcategories'][0]['materials'][0]['id'], 'name': 'Tree Material',
+             'category': self.category2.id, 'article': 1, 'price': 300}
+        )
+        self.assertEqual(response.data[1]['total_sum'], 200)
+
+
+    def test_tree_cache_and_etag(self):
+        response = self.client.get(self.url_tree)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url_tree).data, response.data)
+            response = self.client.get(self.url_tree, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        subtree = self.client.get(reverse('categories-subtree', kwargs={'pk': self.category1.id}))
+        self.assertNotEqual(subtree['ETag'], etag)
+        for name in ('categories-subtree', 'categories-stats'):
+            response = self.client.get(reverse(name, kwargs={'pk': 999999}), HTTP_IF_NONE_MATCH=subtree['ETag'])
+            self.assertEqual(response.status_code, 404)
+
+        create_category('Test Category 4', parent_id=self.category3)
+        response = self.client.get(self.url_tree, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data[1]['subcategories'][0]['name'], 'Test Category 4')
+
+
+    def test_subtree_depth(self):
+        leaf = create_category('Test Category 4', parent_id=self.category2)
+        material_data = {'name': 'Tree Material', 'article': 1, 'price': 300, 'subcategory': None}
+        create_material(material_data, category_id=leaf.id)
+        url = reverse('categories-subtree', kwargs={'pk': self.category1.id})
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'depth': 1, 'include_materials': 'false'})
+        child = response.data['subcategories'][0]
+        self.assertEqual(response.data['child_count'], 1)
+        self.assertEqual((child['name'], child['subcategories']), ('Test Category 2', []))
+        self.assertEqual((child['has_children'], child['child_count'], child['total_sum']), (True, 1, 300))
+
+        response = self.client.get(url)
+        node = response.data['subcategories'][0]['subcategories'][0]
+        self.assertFalse(node['has_children'])
+        self.assertEqual(node['materials'][0]['article'], 1)
+        self.assertEqual(self.client.get(url, {'depth': -1}).status_code, 400)
+
+
+    def test_query_budgets(self):
+        leaf = create_category('Test Category 4', parent_id=self.category2)
+        for article in range(3):
+            create_material({'name': 'Tree Material', 'article': article, 'price': 300, 'subcategory': None}, leaf.id)
+        cache.clear()
+        urls = (
+            self.url_list, self.url_flat_list, self.url_tree,
+            reverse('categories-detail', kwargs={'pk': self.category1.id}),
+            reverse('categories-subtree', kwargs={'pk': self.category1.id}),
+        )
+
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            assert_query_budget(response)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="3 queries", render;dur=[\d.]+, total;dur=')
+
+    def test_stats(self):
+        leaf = create_category('Test Category 4', parent_id=self.category2)
+        for article, price in enumerate((100, 200, 250, 500)):
+            create_material({'name': 'Stats Material', 'article': article, 'price': price, 'subcategory': None},
+                            leaf.id)
+        cache.clear()
+
+        response = self.client.get(reverse('categories-stats', kwargs={'pk': self.category1.id}), {'buckets': 4})
+        assert_query_budget(response)
+        self.assertEqual(
+            {key: response.data[key] for key in ('count', 'sum', 'min', 'max', 'avg')},
+            {'count': 4, 'sum': 1050, 'min': 100, 'max': 500, 'avg': 262.5}
+        )
+        self.assertEqual([bucket['count'] for bucket in response.data['histogram']], [1, 2, 0, 1])
+        self.assertEqual(response.data['histogram'][1], {'lower': 200, 'upper': 300, 'count': 2})
+
+        response = self.client.get(reverse('categories-stats-bulk'),
+                                   {'ids': f'{self.category3.id},0,{leaf.id}'})
+        assert_query_budget(response)
+        self.assertEqual([item['id'] for item in response.data], [self.category3.id, leaf.id])
+        self.assertEqual((response.data[0]['count'], response.data[0]['histogram']), (0, []))
+        self.assertEqual(len(response.data[1]['histogram']), 10)
+        self.assertEqual(self.client.get(reverse('categories-stats-bulk'), {'ids': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('categories-stats-bulk'), {'ids': '²'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('categories-stats', kwargs={'pk': 0})).status_code, 404)
+        detail_url = reverse('categories-stats', kwargs={'pk': 0}).replace('/0/', '/²/')
+        self.assertEqual(self.client.get(detail_url).status_code, 404)
+
+
+    @modify_settings(MIDDLEWARE={'prepend': 'materials.middleware.CompressionMiddleware'})
+    @override_settings(RESPONSE_COMPRESSION_MIN_SIZE=0)
+    def test_tree_renderers_and_compression(self):
+        data = self.client.get(self.url_tree).json()
+        response = self.client.get(self.url_tree, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), data)
+
+        response = self.client.get(self.url_tree, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content)), data)
+        response = self.client.get(self.url_tree, HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'br' if middleware.brotli else 'gzip')
+
 
 class MaterialAPITest(APITestCase):
     def setUp(self):
@@ -81,16 +232,196 @@ class MaterialAPITest(APITestCase):
         self.assertEqual(result[0]['category'], self.data['subcategory'])
 
 
+    def test_fast_serializers_match(self):
+        create_material({**self.data, 'article': 2, 'price': 100}, category_id=self.sub_category.id)
+        urls = (self.url_get, f'{self.url_get}?cursor=', reverse('categories-list'), reverse('categories-flat'))
+        fast = [self.client.get(url).json() for url in urls]
+
+        with patch.object(FastReadMixin, 'use_fast_serializers', False):
+            cache.clear()
+            regular = [self.client.get(url).json() for url in urls]
+        self.assertEqual(fast, regular)
+        # JSON сравнивается как словари, поэтому порядок ключей проверяется отдельно
+        for fast_page, regular_page in zip(fast[:3], regular[:3]):
+            self.assertEqual(list(fast_page['results'][0]), list(regular_page['results'][0]))
+        self.assertEqual(list(fast[0]['results'][0]), ['id', 'name', 'category', 'article', 'price'])
+        self.assertEqual(list(fast[2]['results'][0]), ['id', 'name', 'parent', 'total_sum', 'materials_count', 'depth'])
+
+    def test_keyset_pagination(self):
+        for article, price in ((2, 1000), (3, 2000), (4, 2000), (5, 3000)):
+            create_material({**self.data, 'name': f'Material {article}', 'article': article, 'price': price},
+                            category_id=self.sub_category.id)
+
+        seen = []
+        url = f'{self.url_get}?cursor=&limit=2&count=exact'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], 5)
+            seen.extend(item['article'] for item in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(seen, [2, 3, 4, 123456, 5])
+        response = self.client.get(f'{self.url_get}?cursor=&count=estimate')
+        self.assertIsInstance(response.data['count'], int)
+        self.assertEqual(self.client.get(f'{self.url_get}?cursor=garbage').status_code, 404)
+        for position in (['abc', 'x', 1], [{'a': 1}, 'x', 1], [2 ** 40, 'x', 1], [1, 'x', None]):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            self.assertEqual(self.client.get(self.url_get, {'cursor': cursor}).status_code, 404, position)
+
+    def test_export_materials(self):
+        other = create_category('Other Category')
+        create_material({**self.data, 'article': 2}, category_id=other.id)
+        url = reverse('materials-export')
+
+        with patch.object(export, 'EXPORT_CHUNK_SIZE', 1):
+            response = self.client.get(url)
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line)['article'] for line in lines], [123456, 2])
+
+        response = self.client.get(url, {'fmt': 'csv', 'category': self.category.id})
+        rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows, [
+            ['name', 'article', 'price', 'category_name', 'category', 'id'],
+            ['Test Material', '123456', '2000', 'Test SubCategory', str(self.sub_category.id), str(self.material.id)],
+        ])
+
+        response = self.client.get(url, {'fmt': 'xlsx'})
+        file = BytesIO(b''.join(response.streaming_content))
+        self.assertEqual(len(list(get_datas_from_xlsx(file, sheet_page=0))), 2)
+        self.assertEqual(self.client.get(url, {'fmt': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'category': '²'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'category': 0}).status_code, 400)
+
+    @skipUnless(export.pyarrow, 'pyarrow is not installed')
+    def test_export_parquet(self):
+        response = self.client.get(reverse('materials-export'), {'fmt': 'parquet'})
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.parquet')
+        file = BytesIO(b''.join(response.streaming_content))
+        self.assertEqual(
+            list(columnar.get_datas(file, columnar.PARQUET)), [('Test Material', 123456, 2000, 'Test SubCategory')]
+        )
+
+    def test_query_budgets_and_metrics(self):
+        for article in range(2, 5):
+            create_material({**self.data, 'article': article}, category_id=self.sub_category.id)
+        for params in ({}, {'cursor': '', 'count': 'exact'}):
+            assert_query_budget(self.client.get(self.url_get, params))
+        assert_query_budget(self.client.get(reverse('materials-detail', kwargs={'pk': self.material.id})))
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        metrics = response.content.decode()
+        self.assertIn('http_requests_total{view="materials-list",method="GET",status="200"}', metrics)
+        self.assertRegex(metrics, r'db_queries_total\{view="materials-detail"\} \d+')
+        self.assertIn('http_request_duration_seconds_bucket{view="materials-list",method="GET",le="+Inf"}', metrics)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1').status_code, 404)
+
+    async def test_async_read_views(self):
+        response = await self.async_client.get(self.url_get, {'cursor': '', 'count': 'exact'})
+        self.assertEqual((response.json()['count'], response.json()['results'][0]['article']), (1, 123456))
+        response = await self.async_client.get(reverse('materials-detail', kwargs={'pk': self.material.id}))
+        self.assertEqual(response.json()['name'], self.data['name'])
+
+        await sync_to_async(create_material)({**self.data, 'article': 2}, category_id=self.sub_category.id)
+        with patch.object(export, 'EXPORT_CHUNK_SIZE', 1):
+            response = await self.async_client.get(reverse('materials-export'), {'fmt': 'csv'})
+            content = ''.join([chunk.decode() async for chunk in response.streaming_content])
+        rows = [line.split(',')[:4] for line in content.splitlines()[1:]]
+        self.assertEqual(rows[0], ['Test Material', '123456', '2000', 'Test SubCategory'])
+        self.assertEqual(len(rows), 2)
+
+        response = await self.async_client.get(reverse('categories-tree'))
+        self.assertEqual(response.json()[0]['subcategories'][0]['materials'][0]['article'], 123456)
+        self.assertGreater(response.request_metrics.queries, 0)
+
     def test_create_materials(self):
         url = reverse('materials-list')
-        response = self.client.post(url, data=self.data)
+        response = self.client.post(url, data={**self.data, 'article': 654321})
 
         result = response.data
         self.assertEqual(result['name'], self.data['name'])
-        self.assertEqual(result['article'], self.data['article'])
+        self.assertEqual(result['article'], 654321)
         self.assertEqual(result['price'], self.data['price'])
         self.assertEqual(result['category'], self.data['subcategory'])
 
+    def test_search(self):
+        other = create_category('Other', parent_id=self.category)
+        for article, name, category in (
+            (1, 'Цемент М500', self.sub_category),
+            (2, 'Раствор цементный', other),
+            (3, 'Кирпич красный', self.sub_category),
+            (4, 'Доска обрезная', other),
+        ):
+            create_material({**self.data, 'name': name, 'article': article}, category_id=category.id)
+
+        def found(**params):
+            return [item['article'] for item in self.client.get(self.url_get, params).data['results']]
+
+        self.assertEqual(found(q='цем'), [1, 2])
+        self.assertEqual(found(q='кирпч'), [3])
+        self.assertEqual(found(q='цем', category=other.id), [2])
+        self.assertEqual(found(q='123456')[0], 123456)
+        self.assertEqual(found(q='?!'), [])
+        self.assertEqual((found(q='--5'), found(q='²')), ([], []))
+        for category in ('x', '²'):
+            self.assertEqual(self.client.get(self.url_get, {'category': category}).status_code, 400)
+
+        seen, url, params = [], self.url_get, {'q': 'цем', 'cursor': '', 'limit': 1}
+        while url:
+            response = self.client.get(url, params)
+            params = None
+            assert_query_budget(response)
+            seen.extend(item['article'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [1, 2])
+
+    def test_bulk_create_update_delete(self):
+        url = reverse('materials-bulk')
+        other = create_category('Other', parent_id=self.category)
+        items = [
+            {'name': 'Bulk 1', 'article': 1, 'price': 100, 'subcategory': self.sub_category.id},
+            {'name': 'Bulk 2', 'article': 2, 'price': 50, 'subcategory': other.id},
+            {'name': 'Taken', 'article': self.data['article'], 'price': 1, 'subcategory': self.sub_category.id},
+            {'name': 'Not a leaf', 'article': 3, 'price': 1, 'subcategory': self.category.id},
+            {'name': 'Duplicate', 'article': 1, 'price': 1, 'subcategory': self.sub_category.id},
+            {'name': 'Bad price', 'article': 4, 'price': 'abc', 'subcategory': self.sub_category.id},
+        ]
+        response = self.client.post(url, items, format='json')
+        assert_query_budget(response)
+        self.assertEqual((response.data['succeeded'], response.data['failed']), (2, 4))
+        self.assertEqual([result['status'] for result in response.data['results']], ['created'] * 2 + ['error'] * 4)
+        self.assertEqual([list(result.get('errors', {})) for result in response.data['results']],
+                         [[], [], ['article'], ['subcategory'], ['article'], ['price']])
+        first, second = (result['id'] for result in response.data['results'][:2])
+        self.category.refresh_from_db()
+        self.assertEqual((self.category.total_sum, self.category.materials_count), (2150, 3))
+
+        response = self.client.patch(url, [
+            {'id': first, 'price': 300, 'subcategory': other.id},
+            {'id': second, 'name': 'Renamed'},
+            {'id': second, 'article': self.data['article']},
+            {'id': 0, 'price': 1},
+        ], format='json')
+        assert_query_budget(response)
+        self.assertEqual([result['status'] for result in response.data['results']], ['updated'] * 2 + ['error'] * 2)
+        self.assertEqual(list(Material.objects.filter(category=other).order_by('article').values_list('name', 'price')),
+                         [('Bulk 1', 300), ('Renamed', 50)])
+        self.sub_category.refresh_from_db()
+        self.assertEqual((self.sub_category.total_sum, self.sub_category.materials_count), (2000, 1))
+
+        response = self.client.delete(url, [first, first, 0], format='json')
+        assert_query_budget(response)
+        self.assertEqual([result['status'] for result in response.data['results']], ['deleted', 'error', 'error'])
+        self.category.refresh_from_db()
+        self.assertEqual((self.category.total_sum, self.category.materials_count), (2050, 2))
+        self.assertEqual(self.client.post(url, {'name': 'Not a list'}, format='json').status_code, 400)
+
+    def test_create_duplicate_article(self):
+        response = self.client.post(reverse('materials-list'), data=self.data)
+        self.assertEqual(response.status_code, 400)
+
     def test_patch_materials(self):
         url = reverse('materials-detail', kwargs={'pk': self.material.id})
         patch_data = {'name': 'Patched Test Material'}
@@ -112,3 +443,483 @@ class MaterialAPITest(APITestCase):
         self.assertEqual(response.data['name'], put_data['name'])
         self.assertEqual(response.data['article'], put_data['article'])
         self.assertEqual(response.data['price'], put_data['price'])
+
+
+class CategoryTotalsTest(APITestCase):
+    def setUp(self):
+        self.root = create_category('Root')
+        self.branch = create_category('Branch', parent_id=self.root)
+        self.leaf = create_category('Leaf', parent_id=self.branch)
+        self.other = create_category('Other')
+        self.material = create_material(
+            {'name': 'Material', 'article': 1, 'price': 100, 'subcategory': None},
+            category_id=self.leaf.id
+        )
+
+    def assertTotals(self, category, total_sum, materials_count):
+        category.refresh_from_db()
+        self.assertEqual((category.total_sum, category.materials_count), (total_sum, materials_count))
+
+    def test_material_writes_update_ancestor_chain(self):
+        data = {'name': 'Second', 'article': 2, 'price': 50, 'subcategory': self.leaf.id}
+        self.client.post(reverse('materials-list'), data=data)
+        self.assertTotals(self.root, 150, 2)
+
+        url = reverse('materials-detail', kwargs={'pk': self.material.id})
+        self.client.patch(url, data={'price': 300})
+        self.assertTotals(self.branch, 350, 2)
+
+        self.client.delete(url)
+        self.assertTotals(self.root, 50, 1)
+        self.assertTotals(self.leaf, 50, 1)
+
+    def test_reparent_moves_totals(self):
+        url = reverse('categories-detail', kwargs={'pk': self.branch.id})
+        response = self.client.put(url, data={'name': 'Branch', 'parent': self.other.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTotals(self.root, 0, 0)
+        self.assertTotals(self.other, 100, 1)
+        self.assertTotals(self.branch, 100, 1)
+
+    def test_move_subtree(self):
+        url = reverse('categories-move', kwargs={'pk': self.branch.id})
+        response = self.client.post(url, data={'parent': self.other.id}, format='json')
+        assert_query_budget(response)
+
+        self.assertEqual((response.status_code, response.data['parent']), (200, self.other.id))
+        self.assertTotals(self.root, 0, 0)
+        self.assertTotals(self.other, 100, 1)
+        self.leaf.refresh_from_db()
+        self.assertEqual((self.leaf.ancestor_ids, self.leaf.depth), ([self.other.id, self.branch.id, self.leaf.id], 2))
+
+        for parent in (self.leaf.id, self.branch.id, 0):
+            response = self.client.post(url, data={'parent': parent}, format='json')
+            self.assertEqual(response.status_code, 400, parent)
+        detail = reverse('categories-detail', kwargs={'pk': self.other.id})
+        response = self.client.patch(detail, data={'parent': self.leaf.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post(url, data={'parent': None}, format='json').data['parent'], None)
+        call_command('rebuild_category_totals', '--check', stdout=StringIO())
+
+    def test_delete_subtree_in_batches(self):
+        for article in range(2, 12):
+            create_material({'name': 'Material', 'article': article, 'price': 10, 'subcategory': None}, self.leaf.id)
+        url = reverse('categories-detail', kwargs={'pk': self.branch.id})
+
+        response = self.client.delete(url)
+        self.assertEqual((response.status_code, response.data['materials_count']), (409, 11))
+        self.assertTrue(Category.objects.filter(id=self.leaf.id).exists())
+
+        report = subtree.delete_subtree(self.branch, with_materials=True, batch_size=3)
+        self.assertEqual(report, {'categories': 2, 'materials': 11})
+        self.assertTotals(self.root, 0, 0)
+        self.assertEqual(
+            list(Category.objects.order_by('id').values_list('id', flat=True)), [self.root.id, self.other.id]
+        )
+        self.assertFalse(Material.objects.exists())
+
+        # С пустым путем префикс '%' выбрал бы весь каталог
+        Category.objects.filter(id=self.other.id).update(path='')
+        response = self.client.delete(reverse('categories-detail', kwargs={'pk': self.other.id}))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Category.objects.count(), 2)
+
+        url = reverse('categories-detail', kwargs={'pk': self.root.id})
+        self.assertEqual(self.client.delete(url, QUERY_STRING='with_materials=true').status_code, 204)
+
+    def test_rebuild_command(self):
+        Category.objects.filter(id=self.root.id).update(total_sum=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_category_totals', '--check', stdout=StringIO())
+
+        call_command('rebuild_category_totals', stdout=StringIO())
+        self.assertTotals(self.root, 100, 1)
+        call_command('rebuild_category_totals', '--check', stdout=StringIO())
+
+    def test_generate_catalogue_command(self):
+        call_command('generate_catalogue', depth=3, fanout=2, roots=1, materials_per_leaf=3, stdout=StringIO())
+
+        root = Category.objects.get(name='Category 1')
+        leaf = Category.objects.get(name='Category 1 2 1')
+        self.assertEqual((leaf.depth, leaf.ancestor_ids[0], leaf.parent.parent_id), (2, root.id, root.id))
+        self.assertEqual(Category.objects.descendants_of(root).count(), 6)
+        self.assertEqual(root.materials_count, 12)
+        self.assertEqual(root.total_sum, sum(Material.objects.subtree_materials(root).values_list('price', flat=True)))
+        call_command('rebuild_category_totals', '--check', stdout=StringIO())
+
+    def test_benchmark_json_and_compare(self):
+        with TemporaryDirectory() as directory:
+            path = f'{directory}/baseline.json'
+            call_command('benchmark', 'import_engines', rows=[10, 20], json=path, stdout=StringIO())
+            with open(path) as file:
+                baseline = json.load(file)
+            self.assertEqual([(row['variant'], row['rows']) for row in baseline['results']],
+                             [('bulk_create', 10), ('copy', 10), ('bulk_create', 20), ('copy', 20)])
+
+            for row in baseline['results']:
+                row['seconds'] = 1e-6
+            with open(path, 'w') as file:
+                json.dump(baseline, file)
+            with self.assertRaisesMessage(CommandError, 'benchmarks are more than 10.0% slower'):
+                call_command('benchmark', 'import_engines', rows=[10], compare=path, stdout=StringIO())
+
+
+class CategoryHierarchyIndexTest(APITestCase):
+    def setUp(self):
+        self.root = create_category('Root')
+        self.branch = create_category('Branch', parent_id=self.root)
+        self.leaf = create_category('Leaf', parent_id=self.branch)
+        self.other = create_category('Other')
+        self.material = create_material(
+            {'name': 'Material', 'article': 1, 'price': 100, 'subcategory': None},
+            category_id=self.leaf.id
+        )
+
+    def test_paths_on_create(self):
+        self.assertEqual(self.leaf.path, f'{self.root.id}/{self.branch.id}/{self.leaf.id}/')
+        self.assertEqual(self.leaf.depth, 2)
+
+    def test_queryset_helpers(self):
+        with self.assertNumQueries(1):
+            descendants = list(Category.objects.descendants_of(self.root))
+        self.assertEqual({category.id for category in descendants}, {self.branch.id, self.leaf.id})
+
+        with self.assertNumQueries(1):
+            ancestors = list(Category.objects.ancestors_of(self.leaf))
+        self.assertEqual({category.id for category in ancestors}, {self.root.id, self.branch.id})
+
+        self.assertTrue(Category.objects.is_leaf(self.leaf.id))
+        self.assertFalse(Category.objects.is_leaf(self.branch.id))
+        self.assertEqual(list(Material.objects.subtree_materials(self.root)), [self.material])
+        self.assertEqual(list(Material.objects.subtree_materials(self.other)), [])
+
+    def test_reparent_updates_subtree_paths(self):
+        self.branch.parent = self.other
+        self.branch.save()
+
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.path, f'{self.other.id}/{self.branch.id}/{self.leaf.id}/')
+        self.assertEqual(list(Material.objects.subtree_materials(self.other)), [self.material])
+        self.assertFalse(Category.objects.descendants_of(self.root).exists())
+
+        self.branch.parent = None
+        self.branch.save()
+        self.leaf.refresh_from_db()
+        self.assertEqual((self.leaf.path, self.leaf.depth), (f'{self.branch.id}/{self.leaf.id}/', 1))
+
+
+class QueryPlanTest(APITestCase):
+    """
+    Горячие запросы не должны падать в последовательное сканирование
+
+    На маленькой тестовой базе планировщик и так предпочел бы Seq Scan,
+    поэтому он выключается: если подходящего индекса нет, план все равно
+    покажет Seq Scan, и тест упадет.
+    """
+
+    def setUp(self):
+        self.root = create_category('Root')
+        self.leaves = [create_category(f'Leaf {index}', parent_id=self.root) for index in range(20)]
+        Material.objects.bulk_create(
+            Material(name=f'Material {index}', article=index, price=index % 50, category=self.leaves[index % 20])
+            for index in range(500)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE materials_category, materials_material')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertIndexPlan(self, queryset, index_name: str | None = None):
+        plan = queryset.explain()
+        self.assertNotIn('Seq Scan', plan, plan)
+        if index_name is not None:
+            self.assertIn(index_name, plan, plan)
+
+    def test_category_plans(self):
+        self.assertIndexPlan(Category.objects.filter(name__in=['Leaf 1', 'Leaf 2']), 'category_name_idx')
+        self.assertIndexPlan(Category.objects.all()[:20], 'category_name_idx')
+        self.assertIndexPlan(Category.objects.roots()[:20], 'category_root_name_idx')
+        self.assertIndexPlan(Category.objects.descendants_of(self.root).order_by(), 'category_path_idx')
+
+    def test_material_plans(self):
+        self.assertIndexPlan(Material.objects.filter(article__in=[1, 2, 3]))
+        queryset = Material.objects.order_by(*MaterialPagination.keyset_fields)
+        self.assertIndexPlan(
+            queryset.filter(MaterialPagination().after(queryset, [10, 'Material 10', 10]))[:21],
+            'material_price_name_id_idx'
+        )
+        self.assertIndexPlan(Material.objects.subtree_materials(self.leaves[0]))
+
+    def test_search_plans(self):
+        # Число: полнотекстовый поиск и артикул; опечатка - нечеткий поиск по триграммам
+        plan = search.search_materials(Material.objects.all(), '42').explain()
+        for index_name in ('material_name_fts_idx', 'materials_material_article'):
+            self.assertIn(index_name, plan, plan)
+        self.assertNotIn('Seq Scan', plan, plan)
+        self.assertIndexPlan(search.search_materials(Material.objects.all(), 'matrial'), 'material_name_trgm_idx')
+
+
+class MaterialXLSXImportTest(APITestCase):
+    def setUp(self):
+        self.root = create_category('Root')
+        self.leaf = create_category('Leaf', parent_id=self.root)
+        self.url = reverse('xlsx')
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = self.settings(IMPORT_JOBS_EAGER=True, MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_import_reports_processed_and_rejected(self):
+        rows = [
+            ('Material 1', 1, 100, 'Leaf'),
+            ('Material 2', 2, 200, 'Leaf'),
+            ('Bad price', 3, 'abc', 'Leaf'),
+            ('Unknown category', 4, 100, 'Nope'),
+            (None, None, None, None),
+        ]
+        response = self.client.post(self.url, data={'file': create_xlsx_file(rows)}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        assert_query_budget(response)
+
+        response = self.client.get(response.data['url'])
+        self.assertEqual(response.data['status'], ImportJob.Status.DONE)
+        self.assertEqual((response.data['rows_processed'], response.data['rows_rejected']), (4, 2))
+        self.assertIsNotNone(response.data['rows_per_second'])
+        self.assertEqual(response.data['errors'], [
+            {'row': 4, 'field': 'price', 'error': 'A valid integer is required.'},
+            {'row': 5, 'field': 'category', 'error': 'Category Nope: not found!'},
+        ])
+        self.assertEqual(Material.objects.count(), 2)
+        self.root.refresh_from_db()
+        self.assertEqual((self.root.total_sum, self.root.materials_count), (300, 2))
+
+    def test_import_sheets_in_index_order(self):
+        workbook = {
+            'First': [('Material 1', 1, 100, 'Leaf'), ('Bad price', 2, 'abc', 'Leaf')],
+            'Second': [('Material 3', 3, 200, 'Leaf')],
+            'Third': [('Material 4', 4, 300, 'Leaf'), ('Unknown category', 5, 100, 'Nope')],
+        }
+        response = self.client.post(
+            self.url, data={'file': create_workbook_file(workbook), 'sheets': 'all'}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 202)
+        assert_query_budget(response)
+
+        response = self.client.get(response.data['url'])
+        self.assertEqual(response.data['status'], ImportJob.Status.DONE)
+        self.assertEqual(response.data['sheets'], [0, 1, 2])
+        self.assertEqual((response.data['rows_processed'], response.data['rows_rejected']), (5, 2))
+        self.assertEqual(
+            [(sheet['name'], sheet['processed'], sheet['rejected'], sheet['finished'])
+             for sheet in response.data['sheet_reports']],
+            [('First', 2, 1, True), ('Second', 1, 0, True), ('Third', 2, 1, True)]
+        )
+        self.assertEqual(
+            [(error['sheet'], error['row'], error['field']) for error in response.data['errors']],
+            [('First', 3, 'price'), ('Third', 3, 'category')]
+        )
+        self.root.refresh_from_db()
+        self.assertEqual((self.root.total_sum, self.root.materials_count), (600, 3))
+
+        response = self.client.post(
+            self.url, data={'file': create_workbook_file(workbook), 'sheets': '2, 0', 'mode': 'upsert'},
+            format='multipart'
+        )
+        assert_query_budget(response)
+        self.assertEqual(self.client.get(response.data['url']).data['sheets'], [0, 2])
+
+        # Повтор артикула в листах: последним пишется лист с большим индексом, и с пулом процессов тоже
+        workbook = {'First': [('Repeated', 7, 100, 'Leaf')], 'Second': [('Repeated', 7, 300, 'Leaf')]}
+        for workers in (1, 2):
+            with self.settings(IMPORT_SHEET_WORKERS=workers):
+                response = self.client.post(
+                    self.url, data={'file': create_workbook_file(workbook), 'sheets': 'all', 'mode': 'upsert'},
+                    format='multipart'
+                )
+            response = self.client.get(response.data['url'])
+            self.assertEqual((response.data['status'], response.data['rows_processed']), (ImportJob.Status.DONE, 2))
+            self.assertEqual(Material.objects.get(article=7).price, 300)
+
+    def test_import_sheets_validation(self):
+        workbook = {'First': [], 'Second': []}
+        for data in ({'sheets': '5'}, {'sheets': 'first'}, {'sheets': 'all', 'engine': ImportJob.Engine.COPY}):
+            response = self.client.post(
+                self.url, data={'file': create_workbook_file(workbook), **data}, format='multipart'
+            )
+            self.assertEqual(response.status_code, 400, data)
+        self.assertFalse(ImportJob.objects.exists())
+
+    def test_import_csv(self):
+        content = (
+            'price, category_name,name ,article\n'
+            '100, Leaf ,Material 1,1\n\nabc,Leaf,Bad price,2\n,,,\n200,Leaf,Material 3,3\n'
+        )
+        # Пустая строка файла не сдвигает номера строк, пачки с пропуском начинаются с нужной строки
+        batches = columnar.iter_batches(BytesIO(content.encode('utf-8-sig')), columnar.CSV, 2, skip_rows=1)
+        self.assertEqual([(columns['row'], len(errors), rows_read) for columns, errors, rows_read in batches],
+                         [([], 1, 2), ([6], 0, 2)])
+        file = SimpleUploadedFile('materials.csv', content.encode('utf-8-sig'))
+        response = self.client.post(self.url, data={'file': file}, format='multipart')
+        assert_query_budget(response)
+
+        response = self.client.get(response.data['url'])
+        self.assertEqual((response.data['rows_processed'], response.data['rows_rejected']), (3, 1))
+        self.assertEqual(
+            response.data['errors'], [{'row': 4, 'field': 'price', 'error': 'A valid integer is required.'}]
+        )
+        self.assertEqual(
+            list(Material.objects.order_by('article').values_list('article', 'price')), [(1, 100), (3, 200)]
+        )
+
+        file = SimpleUploadedFile('materials.csv', b'name,article,price\nMaterial,1,100\n')
+        response = self.client.post(self.url, data={'file': file}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        file = SimpleUploadedFile('materials.txt', b'')
+        self.assertEqual(self.client.post(self.url, data={'file': file}, format='multipart').status_code, 400)
+
+    @skipUnless(columnar.pyarrow, 'pyarrow is not installed')
+    def test_import_parquet(self):
+        import pyarrow.parquet
+
+        table = columnar.pyarrow.table({
+            'article': [1, 2],
+            'name': ['Material 1', 'Material 2'],
+            'price': [100.0, 2.5],
+            'category_name': ['Leaf'] * 2,
+        })
+        buffer = BytesIO()
+        pyarrow.parquet.write_table(table, buffer)
+        file = SimpleUploadedFile('materials.parquet', buffer.getvalue())
+        response = self.client.post(self.url, data={'file': file, 'engine': ImportJob.Engine.COPY}, format='multipart')
+        assert_query_budget(response)
+
+        response = self.client.get(response.data['url'])
+        self.assertEqual(response.data['status'], ImportJob.Status.DONE)
+        self.assertEqual(
+            response.data['errors'], [{'row': 3, 'field': 'price', 'error': 'A valid integer is required.'}]
+        )
+        self.assertEqual(list(Material.objects.values_list('article', 'price')), [(1, 100)])
+
+    def test_import_query_budget(self):
+        rows = [(f'Material {index}', index, 10, 'Leaf') for index in range(50)]
+        response = self.client.post(self.url, data={'file': create_xlsx_file(rows)}, format='multipart')
+        assert_query_budget(response)
+        assert_query_budget(self.client.get(response.data['url']))
+        self.assertEqual(Material.objects.count(), 50)
+
+    def test_upsert_by_article(self):
+        create_material({'name': 'Same', 'article': 1, 'price': 100, 'subcategory': None}, self.leaf.id)
+        create_material({'name': 'Old price', 'article': 2, 'price': 100, 'subcategory': None}, self.leaf.id)
+        rows = [
+            ('Same', 1, 100, 'Leaf'),
+            ('Old price', 2, 150, 'Leaf'),
+            ('New', 3, 10, 'Leaf'),
+        ]
+
+        report = specific_queries.create_records(rows, mode=ImportJob.Mode.INSERT)
+        self.assertEqual((report['inserted'], report['rejected']), (1, 2))
+
+        rows.append(('New', 3, 20, 'Leaf'))
+        report = specific_queries.create_records(rows, mode=ImportJob.Mode.UPSERT)
+        self.assertEqual(
+            (report['inserted'], report['updated'], report['unchanged'], report['rejected']), (0, 2, 1, 1)
+        )
+        self.assertEqual(
+            list(Material.objects.order_by('article').values_list('article', 'price')), [(1, 100), (2, 150), (3, 20)]
+        )
+        self.root.refresh_from_db()
+        self.assertEqual((self.root.total_sum, self.root.materials_count), (270, 3))
+
+    def test_import_article_taken_concurrently(self):
+        existing_materials = specific_queries._existing_materials
+        rows = [('New', 1, 10, 'Leaf'), ('Other', 2, 20, 'Leaf')]
+        for mode, counters, total_sum in ((ImportJob.Mode.INSERT, (1, 0, 1), 120), (ImportJob.Mode.UPSERT, (1, 1, 0), 30)):
+            create_material({'name': 'Taken', 'article': 1, 'price': 100, 'subcategory': None}, self.leaf.id)
+            # первое чтение не видит артикул, вставленный параллельной транзакцией
+            with patch.object(specific_queries, '_existing_materials', side_effect=[{}, existing_materials([1])]):
+                report = specific_queries.create_records(rows, mode=mode)
+            self.assertEqual((report['inserted'], report['updated'], report['rejected']), counters)
+            self.root.refresh_from_db()
+            self.assertEqual((self.root.total_sum, self.root.materials_count), (total_sum, 2))
+            Material.objects.all().delete()
+            Category.objects.update(total_sum=0, materials_count=0)
+
+    def test_copy_loader_matches_bulk_create(self):
+        create_material({'name': 'Same', 'article': 1, 'price': 100, 'subcategory': None}, self.leaf.id)
+        create_material({'name': 'Old price', 'article': 2, 'price': 100, 'subcategory': None}, self.leaf.id)
+        rows = [
+            ('Same', 1, 100, 'Leaf'),
+            ('Old price', 2, 150, 'Leaf'),
+            ('New', 3, 10, 'Leaf'),
+            ('New', 3, 20, 'Leaf'),
+            ('Unknown category', 4, 100, 'Nope'),
+            ('Bad price', 5, 'abc', 'Leaf'),
+        ]
+
+        report = copy_loader.copy_records(rows, mode=ImportJob.Mode.UPSERT)
+
+        self.assertEqual(
+            (report['processed'], report['inserted'], report['updated'], report['unchanged'], report['rejected']),
+            (6, 1, 1, 1, 3)
+        )
+        self.assertEqual(
+            list(Material.objects.order_by('article').values_list('article', 'price')), [(1, 100), (2, 150), (3, 20)]
+        )
+        self.root.refresh_from_db()
+        self.assertEqual((self.root.total_sum, self.root.materials_count), (270, 3))
+
+    def test_resume_interrupted_job(self):
+        rows = [(f'Material {index}', index, 10, 'Leaf') for index in range(5)]
+        job = ImportJob.objects.create(
+            file=create_xlsx_file(rows),
+            status=ImportJob.Status.RUNNING,
+            rows_committed=3,
+            rows_processed=3,
+        )
+
+        running = ImportJob.objects.create(
+            file=create_xlsx_file(rows), status=ImportJob.Status.RUNNING, heartbeat_at=timezone.now()
+        )
+        self.assertFalse(jobs.run_import_job(job.id))
+
+        call_command('resume_import_jobs', stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_committed, job.rows_processed), (ImportJob.Status.DONE, 5, 5))
+        running.refresh_from_db()
+        self.assertEqual((running.status, running.rows_processed), (ImportJob.Status.RUNNING, 0))
+
+        failed = ImportJob.objects.create(file=create_xlsx_file(rows), sheets=[5])
+        self.assertTrue(jobs.run_import_job(failed.id))
+        failed.refresh_from_db()
+        self.assertEqual(failed.status, ImportJob.Status.FAILED)
+        self.assertFalse(failed.file.storage.exists(failed.file.name))
+        self.assertEqual(
+            list(Material.objects.order_by('article').values_list('article', flat=True)), [3, 4]
+        )
+
+    def test_import_resolves_categories_per_batch(self):
+        rows = [(f'Material {index}', index, index, 'Leaf') for index in range(500)]
+        # категории, артикулы, вставка, пути предков, итоги и savepoint пачки - без запросов на строку
+        with self.assertNumQueries(7):
+            report = specific_queries.create_records(rows, batch_size=1000)
+
+        self.assertEqual((report['processed'], report['rejected']), (500, 0))
+        self.assertEqual(Material.objects.count(), 500)
+
+    def test_validate_rows_collects_all_errors(self):
+        columns, errors = validate_rows(
+            [('Ok', ' -7 ', 1.0, 'Leaf'), ('', 'x', 2 ** 40, 'Leaf'), ('Short',), ('Signs', '--5', '²', 'Leaf')],
+            first_row_number=2
+        )
+
+        self.assertEqual(columns['row'], [2])
+        self.assertEqual(list(columns['article']), [-7])
+        self.assertEqual(
+            [(error['row'], error['field']) for error in errors],
+            [
+                (3, 'name'), (3, 'article'), (3, 'price'), (4, 'article'), (4, 'price'), (4, 'category'),
+                (5, 'article'), (5, 'price'),
+            ]
+        )
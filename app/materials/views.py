@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+from materials import metrics
+
+
+def metrics_view(request):
+    """
+    Метрики процесса в формате Prometheus
+
+    Доступны только с адресов из 'METRICS_ALLOWED_IPS', для остальных - 404.
+    """
+    if not settings.METRICS_ENABLED or request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,42 @@
+"""
+Профиль настроек для запуска нескольких процессов gunicorn (см. gunicorn.conf.py)
+
+Включается через DJANGO_SETTINGS_MODULE=settings.production.
+"""
+from django.core.exceptions import ImproperlyConfigured
+
+from settings.settings import *  # noqa: F401,F403
+from settings.settings import CACHES, DATABASES, env
+
+
+DEBUG = False
+
+# Класс воркера gunicorn; тот же env читает gunicorn.conf.py
+GUNICORN_WORKER_CLASS = env.str('GUNICORN_WORKER_CLASS', default='uvicorn.workers.UvicornWorker')
+ASYNC_WORKERS = 'uvicorn' in GUNICORN_WORKER_CLASS
+
+DATABASES['default'].update({
+    # Под ASGI соединения привязаны к потокам запросов и не переиспользуются,
+    # поэтому там соединения закрываются сразу, а пул держит pgbouncer
+    'CONN_MAX_AGE': env.int('DB_CONN_MAX_AGE', default=0 if ASYNC_WORKERS else 60),
+    'CONN_HEALTH_CHECKS': True,
+    # pgbouncer в режиме transaction не поддерживает серверные курсоры между транзакциями
+    'DISABLE_SERVER_SIDE_CURSORS': env.bool('DB_DISABLE_SERVER_SIDE_CURSORS', default=False),
+    'OPTIONS': {
+        'connect_timeout': env.int('DB_CONNECT_TIMEOUT', default=5),
+    },
+})
+
+# Server-Timing раскрывает число SQL запросов и время этапов, в продакшене - только явно
+SERVER_TIMING = env.bool('SERVER_TIMING', default=False)
+
+# Версия каталога живет в кэше: с кэшем в памяти процесса у каждого воркера
+# своя версия, и изменение на одном воркере не сбрасывает ответы и ETag других
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+if CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES:
+    raise ImproperlyConfigured(
+        'settings.production needs a cache shared by all workers: set CACHE_URL, e.g. redis://redis:6379/0'
+    )
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'drf_spectacular',
     'drf_spectacular_sidecar',
@@ -62,6 +63,22 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Сжатие больших ответов (brotli, если установлен, иначе gzip) включается явно
+RESPONSE_COMPRESSION = env.bool('RESPONSE_COMPRESSION', default=False)
+RESPONSE_COMPRESSION_MIN_SIZE = env.int('RESPONSE_COMPRESSION_MIN_SIZE', default=1024)
+RESPONSE_COMPRESSION_BROTLI_QUALITY = env.int('RESPONSE_COMPRESSION_BROTLI_QUALITY', default=5)
+if RESPONSE_COMPRESSION:
+    MIDDLEWARE.insert(1, 'materials.middleware.CompressionMiddleware')
+
+# Замеры запросов: SQL, время БД, сериализации и рендера. Server-Timing раскрывает
+# внутренние детали, поэтому в профиле production по умолчанию выключен
+REQUEST_METRICS = env.bool('REQUEST_METRICS', default=True)
+SERVER_TIMING = env.bool('SERVER_TIMING', default=True)
+METRICS_ENABLED = env.bool('METRICS_ENABLED', default=True)
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=['127.0.0.1', '::1'])
+if REQUEST_METRICS:
+    MIDDLEWARE.insert(0, 'materials.middleware.RequestMetricsMiddleware')
+
 ROOT_URLCONF = 'settings.urls'
 
 TEMPLATES = [
@@ -97,6 +114,12 @@ DATABASES = {
         },
     }
 
+# Кэш ответов каталога: locmemcache://, filecache:///path или redis://host:port/db
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='locmemcache://'),
+}
+CATALOGUE_CACHE_TIMEOUT = env.int('CATALOGUE_CACHE_TIMEOUT', default=24 * 60 * 60)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -123,6 +146,11 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.SessionAuthentication',
         "rest_framework.authentication.BasicAuthentication",
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'materials.api.v1.renderers.ORJSONRenderer',
+        'materials.api.v1.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_PARSER_CLASSES': [
@@ -130,6 +158,22 @@ REST_FRAMEWORK = {
     ]
 }
 
+# Максимальный размер пачки в /materials/bulk/
+MATERIALS_BULK_MAX_ITEMS = env.int('MATERIALS_BULK_MAX_ITEMS', default=5000)
+# Максимальное число категорий в /categories/stats/?ids=
+CATEGORY_STATS_MAX_IDS = env.int('CATEGORY_STATS_MAX_IDS', default=100)
+
+# Фоновый импорт материалов: число потоков пула и синхронный режим (для тестов)
+IMPORT_JOBS_WORKERS = env.int('IMPORT_JOBS_WORKERS', default=2)
+IMPORT_JOBS_EAGER = env.bool('IMPORT_JOBS_EAGER', default=False)
+# Через сколько секунд без прогресса выполняющийся импорт считается оборванным и
+# может быть продолжен resume_import_jobs; должно быть больше времени записи одной пачки
+IMPORT_JOB_STALE_SECONDS = env.int('IMPORT_JOB_STALE_SECONDS', default=600)
+# Процессов разбора листов при импорте нескольких листов одной книги; при 1 листы
+# разбираются в потоке импорта без пула процессов. Пул выключен по умолчанию: ускорение
+# в разы не подтверждено замером, см. README и бенчмарк import_sheets
+IMPORT_SHEET_WORKERS = env.int('IMPORT_SHEET_WORKERS', default=1)
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
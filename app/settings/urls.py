@@ -23,6 +23,8 @@ from drf_spectacular.views import (
 )
 from rest_framework.versioning import URLPathVersioning
 
+from materials.views import metrics_view
+
 app_urls = [
     path('', include('materials.api.urls')),
 ]
@@ -45,4 +47,5 @@ urlpatterns = [
     path('', include(swagger_urls)),
     path('', include(api_urls)),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file